@@ -0,0 +1,157 @@
+"""Reading xDD data drops directly from archives
+
+An xDD data drop often arrives as a tar file (possibly compressed) or a zip file
+with the raw text files and the ScienceParse files as members. Instead of first
+extracting all those members to disk, this module streams them from the archive
+and pairs the text and ScienceParse members of each document by identifier.
+
+Members are recognized by their basenames:
+
+    <identifier>.txt                 raw text
+    <identifier>_input.pdf.json      ScienceParse output
+
+Either of those may have an additional .gz extension, in which case the member
+is decompressed on the fly. Directories inside the archive are ignored, so both
+of the following layouts work:
+
+    text/5cd7d9e40b45c76caf88d812.txt
+    scienceparse/5cd7d9e40b45c76caf88d812_input.pdf.json
+
+For tar files, which can only be read sequentially, the archive is read in one
+pass and members are buffered until their partner shows up. With the second
+layout that means all text members are buffered before the first ScienceParse
+member is read, so only MAX_UNPAIRED members are kept in memory and the older
+ones wait in a temporary file on disk. Only members that have no partner in
+the whole archive are released without one: a text member is then processed
+without its ScienceParse file and a ScienceParse member is dropped. Zip files
+have a central directory so members can be paired before reading.
+
+"""
+
+import os, gzip, tarfile, zipfile, tempfile
+from collections import OrderedDict
+
+
+TEXT_EXTENSION = '.txt'
+SCPA_EXTENSION = '_input.pdf.json'
+
+# Maximum number of unpaired members kept in memory when reading a tar file, the
+# others are kept in a temporary file
+MAX_UNPAIRED = 1000
+
+
+def is_archive(path: str) -> bool:
+    """Return True if path is a tar file or a zip file."""
+    if path is None or not os.path.isfile(path):
+        return False
+    return tarfile.is_tarfile(path) or zipfile.is_zipfile(path)
+
+
+def member_type(member_name: str):
+    """Return a pair of the member type ('text' or 'scpa') and the document
+    identifier, return None if the member is neither a text file nor a
+    ScienceParse file."""
+    name = os.path.basename(member_name)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith(SCPA_EXTENSION):
+        return 'scpa', name[:-len(SCPA_EXTENSION)]
+    if name.endswith(TEXT_EXTENSION):
+        return 'text', name[:-len(TEXT_EXTENSION)]
+    return None
+
+
+def member_data(member_name: str, data: bytes) -> bytes:
+    """Return the data of a member, uncompressed if it was gzipped."""
+    return gzip.decompress(data) if member_name.endswith('.gz') else data
+
+
+def documents(path: str, max_unpaired: int = MAX_UNPAIRED):
+    """Generate triples <identifier, text, scpa> from the archive, where text is
+    the bytes of the text member and scpa the bytes of the ScienceParse member
+    or None if there was no ScienceParse member. For tar files, max_unpaired is
+    the number of members that wait for their partner in memory, the others
+    wait in a temporary file."""
+    if zipfile.is_zipfile(path):
+        return _zip_documents(path)
+    return _tar_documents(path, max_unpaired)
+
+
+def _tar_documents(path: str, max_unpaired: int):
+    # the kind and the location in the spill file of each member that waits for
+    # its partner, the location is None for members that are in memory
+    pending = {}
+    in_memory = OrderedDict()
+    # mode 'r|*' reads the tar file as a stream, with transparent compression
+    with tempfile.TemporaryFile() as spill, tarfile.open(path, 'r|*') as tar:
+
+        def take(identifier: str) -> tuple:
+            kind, location = pending.pop(identifier)
+            if location is None:
+                return kind, in_memory.pop(identifier)
+            spill.seek(location[0])
+            return kind, spill.read(location[1])
+
+        for member in tar:
+            if not member.isfile():
+                continue
+            member_info = member_type(member.name)
+            if member_info is None:
+                continue
+            kind, identifier = member_info
+            data = member_data(member.name, tar.extractfile(member).read())
+            other = pending.get(identifier)
+            if other is not None and other[0] != kind:
+                _, other_data = take(identifier)
+                if kind == 'text':
+                    yield identifier, data, other_data
+                else:
+                    yield identifier, other_data, data
+                continue
+            if other is not None:
+                print(f'WARNING: duplicate {kind} member for {identifier}')
+                take(identifier)
+            pending[identifier] = (kind, None)
+            in_memory[identifier] = data
+            if len(in_memory) > max_unpaired:
+                identifier, data = in_memory.popitem(last=False)
+                offset = spill.seek(0, os.SEEK_END)
+                spill.write(data)
+                pending[identifier] = (pending[identifier][0], (offset, len(data)))
+        for identifier in list(pending):
+            released = _release(identifier, *take(identifier))
+            if released is not None:
+                yield released
+
+
+def _release(identifier: str, kind: str, data: bytes):
+    """Return a triple for a member that has no partner in the archive, return
+    None for ScienceParse members since there is nothing to parse without the
+    text."""
+    if kind == 'text':
+        print(f"WARNING: there was no SCPA member for {identifier}")
+        return identifier, data, None
+    print(f"WARNING: there was no text member for {identifier}")
+    return None
+
+
+def _zip_documents(path: str):
+    with zipfile.ZipFile(path) as zf:
+        members = {}
+        for member_name in zf.namelist():
+            member_info = member_type(member_name)
+            if member_info is not None:
+                kind, identifier = member_info
+                members.setdefault(identifier, {})[kind] = member_name
+        for identifier in sorted(members):
+            text_member = members[identifier].get('text')
+            scpa_member = members[identifier].get('scpa')
+            if text_member is None:
+                continue
+            text = member_data(text_member, zf.read(text_member))
+            scpa = None
+            if scpa_member is not None:
+                scpa = member_data(scpa_member, zf.read(scpa_member))
+            else:
+                print(f"WARNING: there was no SCPA member for {identifier}")
+            yield identifier, text, scpa
@@ -0,0 +1,186 @@
+"""Index of boilerplate lines
+
+Many xDD text files repeat the same lines on every page, like "medRxiv preprint
+doi: ... this version posted ...", running heads of journals and copyright and
+license notices. This module builds an index of lines that occur in many of the
+documents of a corpus so they can be removed before paragraphs are scored.
+
+Lines are normalized by lower casing, replacing each sequence of digits with a
+single zero and squeezing whitespace, so that the running head of a preprint is
+the same on all pages and in all preprints. Short lines are never considered to
+be boilerplate since that would include section headers like "Introduction".
+
+The index counts in how many documents a normalized line occurs and it is built
+in one pass over the corpus. To keep memory bounded the counts are pruned when
+there are too many of them, which is a variant of the Lossy Counting algorithm:
+the entries with the lowest counts are removed and the removed count is kept as
+the maximum error. A line that is counted again after that may have been in as
+many documents as the error before, so each entry keeps the error at the time it
+was added. Its count is a lower bound and its count plus that error an upper
+bound of the real count. Only lower bounds are saved, so a line that is not in
+enough documents is never saved as boilerplate, however often the counts were
+pruned.
+
+The index is saved as a tab-separated file with the line hash, the document count
+and an example of the normalized line. When loaded only the hashes for lines that
+occur in enough documents are kept in a set, so deciding whether a line is
+boilerplate is one hash lookup.
+
+To build the index:
+
+$ python3 boilerplate.py --text DIR --out FILE
+
+Where DIR is a directory with text files or an archive (see archive.py). Use the
+resulting file with the --boilerplate option of parse.py.
+
+"""
+
+import os, re, argparse, hashlib
+import archive
+import utils
+
+
+# Lines shorter than this after normalization are never boilerplate
+MIN_LINE_LENGTH = 30
+
+# Minimum number of documents a line has to occur in to be boilerplate
+MIN_DOCUMENTS = 10
+
+# Maximum number of lines counted at the same time
+MAX_ENTRIES = 1000000
+
+# Number of characters saved as an example of the normalized line
+EXAMPLE_LENGTH = 100
+
+DIGITS = re.compile(r'\d+')
+
+
+def normalize(line: str) -> str:
+    return ' '.join(DIGITS.sub('0', line.lower()).split())
+
+
+def line_hash(normalized_line: str) -> int:
+    return utils.stable_hash(normalized_line.encode('utf-8'))
+
+
+class BoilerplateCounter:
+
+    """Counts in how many documents each normalized line occurs, with bounded
+    memory. The counts dictionary maps line hashes to triples of the count since
+    the line was added, the maximum count before that and an example line."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.counts = {}
+        self.error = 0
+        self.documents = 0
+
+    def add_document(self, content: str):
+        self.documents += 1
+        seen = set()
+        for line in content.split('\n'):
+            normalized = normalize(line)
+            if len(normalized) < MIN_LINE_LENGTH:
+                continue
+            key = line_hash(normalized)
+            if key in seen:
+                continue
+            seen.add(key)
+            count, delta, example = self.counts.get(
+                key, (0, self.error, normalized[:EXAMPLE_LENGTH]))
+            self.counts[key] = (count + 1, delta, example)
+        if len(self.counts) > self.max_entries:
+            self.prune()
+
+    def prune(self):
+        """Remove the half of the entries with the lowest upper bounds. New
+        entries get the current error as their delta."""
+        bounds = sorted(count + delta for count, delta, _ in self.counts.values())
+        self.error = max(self.error, bounds[len(bounds) // 2])
+        self.counts = {key: value for key, value in self.counts.items()
+                       if value[0] + value[1] > self.error}
+
+    def save(self, path: str, min_documents: int = 2):
+        with open(path, 'w') as fh:
+            fh.write(f'# documents\t{self.documents}\n')
+            fh.write(f'# error\t{self.error}\n')
+            # the saved count is the lower bound, the real count is at least that
+            entries = sorted(self.counts.items(), key=lambda item: -item[1][0])
+            for key, (count, _, example) in entries:
+                if count >= min_documents:
+                    fh.write(f'{key:016x}\t{count}\t{example}\n')
+
+
+class BoilerplateIndex:
+
+    """The set of boilerplate line hashes loaded from an index file."""
+
+    def __init__(self, path: str, min_documents: int = MIN_DOCUMENTS):
+        self.path = path
+        self.min_documents = min_documents
+        self.hashes = set()
+        with open(path) as fh:
+            for line in fh:
+                if line.startswith('#'):
+                    continue
+                key, count, _ = line.split('\t', 2)
+                if int(count) >= min_documents:
+                    self.hashes.add(int(key, 16))
+        # identifies the index, used as part of the key for the result cache
+        self.version = hashlib.sha1(
+            repr(sorted(self.hashes)).encode('ascii')).hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __str__(self):
+        return f'<BoilerplateIndex {self.path} lines={len(self)}>'
+
+    def is_boilerplate(self, line: str) -> bool:
+        normalized = normalize(line)
+        return len(normalized) >= MIN_LINE_LENGTH and line_hash(normalized) in self.hashes
+
+    def strip(self, content: str) -> str:
+        """Remove boilerplate lines from the content, paragraphs that only had
+        boilerplate lines are removed altogether."""
+        paragraphs = []
+        for paragraph in content.split('\n\n'):
+            lines = [line for line in paragraph.split('\n')
+                     if not self.is_boilerplate(line)]
+            if lines or not paragraph:
+                paragraphs.append('\n'.join(lines))
+        return '\n\n'.join(paragraphs)
+
+
+def texts(path: str):
+    """Generate the contents of all text files in a directory or an archive."""
+    if archive.is_archive(path):
+        for _, text, _ in archive.documents(path):
+            yield utils.decode_text(text)
+    else:
+        for fname in sorted(os.listdir(path)):
+            if fname.endswith('.txt'):
+                with open(os.path.join(path, fname)) as fh:
+                    yield fh.read()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build an index of boilerplate lines')
+    parser.add_argument('--text', help="text directory or archive")
+    parser.add_argument('--out', help="index file")
+    parser.add_argument('--max-entries', help="maximum number of lines counted at once",
+                        type=int, default=MAX_ENTRIES)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    counter = BoilerplateCounter(args.max_entries)
+    for count, content in enumerate(texts(args.text), start=1):
+        counter.add_document(content)
+        if count % 1000 == 0:
+            print(count)
+    counter.save(args.out)
+    print(f'>>> Counted lines in {counter.documents:,} documents, error={counter.error}')
+    print(f'>>> Index written to {args.out}')
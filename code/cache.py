@@ -0,0 +1,193 @@
+"""Content-addressed cache for parser results
+
+The same paper often shows up in more than one xDD topic set. This cache stores
+the result of processing a document under a key that is computed from the bytes
+of the text file, the bytes of the ScienceParse file and the version of the
+scoring configuration, so the document does not have to be parsed again when it
+shows up in another topic, even if it has a different name or location there.
+
+The cache is a single SQLite database, which takes care of locking so several
+runs can read from and write to the same cache at the same time. Values are the
+zlib-compressed json of a result dictionary as created by Document.result().
+The cache has a maximum size, when it grows over the maximum the least recently
+used entries are removed. The total size is kept in a separate table by triggers
+on the results table, so it is updated in the same transaction as the results
+and checking it after an insert does not have to scan the whole table. The time
+at which an entry was last used is written in batches of TOUCH_BATCH hits, and
+before an eviction, so a hit does not need a write of its own.
+
+Usage:
+
+    cache = ResultCache('/Users/Shared/data/xdd/cache.db', max_bytes=10**9)
+    key = cache.key(text_bytes, scpa_bytes, version)
+    result = cache.get(key)
+    if result is None:
+        result = compute_result()
+        cache.put(key, result)
+    print(cache.report())
+
+You can also get some statistics from the command line:
+
+$ python3 cache.py CACHE_FILE
+
+"""
+
+import sys, time, json, zlib, sqlite3, hashlib
+
+
+# Default maximum size of the stored values, in bytes
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# When the cache is too big, entries are removed until it is at this fraction of
+# the maximum size, so we do not have to evict again after every insert
+EVICTION_TARGET = 0.9
+
+# Number of hits for which the time of last use is written in one transaction
+TOUCH_BATCH = 100
+
+
+class ResultCache:
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.evictions = 0
+        # times of last use that are not written yet, by key
+        self.touched = {}
+        # the timeout is how long a writer waits for the lock held by another run
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        # the delete trigger also has to fire for rows removed by INSERT OR REPLACE
+        self.connection.execute('PRAGMA recursive_triggers = ON')
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                ' key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS stats ('
+                ' id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)')
+            # a cache created before there was a stats table gets its total once
+            self.connection.execute(
+                'INSERT OR IGNORE INTO stats SELECT 0, COALESCE(SUM(size), 0) FROM results')
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results'
+                ' BEGIN UPDATE stats SET size = size + new.size WHERE id = 0; END')
+            self.connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results'
+                ' BEGIN UPDATE stats SET size = size - old.size WHERE id = 0; END')
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def __str__(self):
+        return f'<ResultCache {self.path} hits={self.hits} misses={self.misses}>'
+
+    @staticmethod
+    def key(text: bytes, scpa: bytes, version: str) -> str:
+        """Return the key for the text and ScienceParse bytes and the version of
+        the scoring configuration. Lengths are included so that content cannot
+        shift from one part to the other."""
+        digest = hashlib.sha256()
+        for part in (version.encode('utf-8'), text, scpa):
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Return the result stored for the key or None if there is none."""
+        row = self.connection.execute(
+            'SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched[key] = time.time()
+        if self.hits % TOUCH_BATCH == 0:
+            self.flush()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: str, result: dict):
+        value = zlib.compress(json.dumps(result).encode('utf-8'))
+        self.connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+            (key, value, len(value), time.time()))
+        self.touched.pop(key, None)
+        self.inserts += 1
+        if self.size() > self.max_bytes:
+            self.evict()
+
+    def size(self) -> int:
+        """Return the total size of all stored values."""
+        return self.connection.execute('SELECT size FROM stats WHERE id = 0').fetchone()[0]
+
+    def count(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def evict(self):
+        """Remove the least recently used entries if the cache is too big. This
+        runs in a write transaction so concurrent runs do not evict twice. The
+        times of last use that were not written yet are written first."""
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._write_touched()
+            size = self.size()
+            if size > self.max_bytes:
+                target = self.max_bytes * EVICTION_TARGET
+                rows = self.connection.execute(
+                    'SELECT key, size FROM results ORDER BY last_used')
+                removed = []
+                for key, value_size in rows:
+                    if size <= target:
+                        break
+                    removed.append((key,))
+                    size -= value_size
+                self.connection.executemany('DELETE FROM results WHERE key = ?', removed)
+                self.evictions += len(removed)
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def flush(self):
+        """Write the times of last use that were not written yet."""
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            self._write_touched()
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+
+    def _write_touched(self):
+        self.connection.executemany(
+            'UPDATE results SET last_used = ? WHERE key = ?',
+            [(last_used, key) for key, last_used in self.touched.items()])
+        self.touched = {}
+
+    def hit_rate(self) -> float:
+        try:
+            return self.hits / (self.hits + self.misses)
+        except ZeroDivisionError:
+            return 0.0
+
+    def report(self) -> str:
+        return (f'cache {self.path}: hits={self.hits:,} misses={self.misses:,}'
+                f' hit_rate={self.hit_rate():.2f} evictions={self.evictions:,}'
+                f' entries={self.count():,} size={self.size() / 1024 ** 2:.1f}MB')
+
+    def close(self):
+        if self.touched:
+            self.flush()
+        self.connection.close()
+
+
+if __name__ == '__main__':
+
+    print(ResultCache(sys.argv[1]).report())
@@ -11,8 +11,9 @@ Also checks whether all file names have the standard length.
 
 """
 
-import os, sys
+import os, sys, itertools
 from utils import trim_filename
+from ids import IdSet
 
 STANDARD_FILENAME_LENGTH = 24
 
@@ -22,21 +23,24 @@ def check_directories(text_dir: str, scpa_dir: str):
     print(text_dir)
     print(scpa_dir)
     print()
-    text_files = list(sorted([trim_filename(fname, '.txt') for fname in os.listdir(text_dir)]))
-    scpa_files = list(sorted([trim_filename(fname, '_input.pdf.json') for fname in os.listdir(scpa_dir)]))
-    text_files_set = set(text_files)
-    scpa_files_set = set(scpa_files)
-    text_files_extras = list(sorted(text_files_set.difference(scpa_files_set)))
-    scpa_files_extras = list(sorted(scpa_files_set.difference(text_files_set)))
-    print('  TEXT count', len(text_files), text_files[:4])
-    print('  SCPA count', len(scpa_files), scpa_files[:4])
-    print('  Extra in TEXT', len(text_files_extras), text_files_extras[:4])
-    print('  Extra in SCPA', len(scpa_files_extras), scpa_files_extras[:4])
-    for text_file in text_files:
+    text_files = IdSet(trim_filename(fname, '.txt') for fname in os.listdir(text_dir))
+    scpa_files = IdSet(trim_filename(fname, '_input.pdf.json') for fname in os.listdir(scpa_dir))
+    text_files_extras = text_files.difference(scpa_files)
+    scpa_files_extras = scpa_files.difference(text_files)
+    print('  TEXT count', len(text_files), _first(text_files))
+    print('  SCPA count', len(scpa_files), _first(scpa_files))
+    print('  Extra in TEXT', len(text_files_extras), _first(text_files_extras))
+    print('  Extra in SCPA', len(scpa_files_extras), _first(scpa_files_extras))
+    # standard identifiers always have the standard length
+    for text_file in text_files.others:
         if len(text_file) != STANDARD_FILENAME_LENGTH:
             print(f'  Unexpected file name: {text_file}')
 
 
+def _first(ids: IdSet, n: int = 4) -> list:
+    return list(itertools.islice(ids, n))
+
+
 if __name__ == '__main__':
 
     data_directory = sys.argv[1]
@@ -0,0 +1,203 @@
+"""Near-duplicate detection with MinHash and locality sensitive hashing
+
+xDD drops contain near-identical versions of the same paper, for example a
+preprint and the published version or two OCR runs over the same PDF. This
+module assigns each document to a duplicate cluster while documents stream by,
+the cluster is identified by the name of the first document that was seen for
+it.
+
+Documents are represented by the set of word shingles in their paragraphs, using
+the same paragraph split as document.Document, and shingles never cross a
+paragraph boundary. The MinHash signature is created with one permutation
+hashing: each shingle is hashed once, the hash picks one of the NUM_BINS bins and
+the bin keeps the smallest value. Empty bins are filled in from their neighbours
+so that all signatures have the same length. The cost is therefore linear in the
+number of shingles and does not depend on the length of the signature.
+
+The signature is cut into BANDS bands and each band is hashed into a table that
+maps band hashes to the first document with that band. Documents that share a
+band are candidates, and a candidate is accepted if the estimated similarity is
+at least the threshold. To keep the index small for millions of documents the
+band tables are open addressing hash tables on top of arrays and for each
+document only one byte per bin is kept for the similarity estimate, which in
+total is about 300 bytes per document plus the name.
+
+Usage:
+
+    detector = DuplicateDetector()
+    for name, content in documents:
+        cluster = detector.add(name, content)
+
+Or from the command line, which prints clusters with more than one document:
+
+$ python3 dedup.py TEXT_DIR
+
+"""
+
+import os, sys
+from array import array
+from utils import stable_hash
+
+
+SHINGLE_SIZE = 5
+NUM_BINS = 128
+BANDS = 16
+ROWS = NUM_BINS // BANDS
+
+# Minimum estimated Jaccard similarity for a candidate to be accepted as a duplicate,
+# two OCR runs that differ in 2% of the tokens have a similarity of about 0.82 and
+# the estimate can be off by several hundredths
+THRESHOLD = 0.7
+
+MAX_HASH = (1 << 64) - 1
+EMPTY = MAX_HASH
+
+
+def shingles(content: str):
+    """Generate the hashes of the word shingles of all paragraphs in the content.
+    Paragraphs that are shorter than the shingle size yield one shingle."""
+    for paragraph in content.split("\n\n"):
+        tokens = paragraph.lower().split()
+        if not tokens:
+            continue
+        for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1)):
+            yield stable_hash(' '.join(tokens[i:i + SHINGLE_SIZE]).encode('utf-8'))
+
+
+def signature(content: str) -> list:
+    """Return the MinHash signature of the content, using one permutation hashing
+    with rotation to fill in empty bins. Returns None if there are no tokens."""
+    bins = [EMPTY] * NUM_BINS
+    for value in shingles(content):
+        i = value % NUM_BINS
+        value //= NUM_BINS
+        if value < bins[i]:
+            bins[i] = value
+    if all(value == EMPTY for value in bins):
+        return None
+    for i in range(NUM_BINS):
+        distance = 1
+        while bins[i] == EMPTY:
+            borrowed = bins[(i + distance) % NUM_BINS]
+            if borrowed != EMPTY and borrowed < (1 << 57):
+                # the offset keeps filled bins from matching by accident
+                bins[i] = borrowed + distance * (1 << 57)
+            distance += 1
+    return bins
+
+
+class BandTable:
+
+    """Open addressing hash table from non-zero 63-bit keys to document numbers,
+    stored in two arrays so that an entry takes 12 bytes plus free space."""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.size = 0
+        self.keys = array('q', bytes(8 * capacity))
+        self.values = array('l', bytes(array('l').itemsize * capacity))
+
+    def __len__(self):
+        return self.size
+
+    def setdefault(self, key: int, value: int) -> int:
+        """Return the value for the key, adding the key with the given value if
+        it was not in the table yet."""
+        mask = self.capacity - 1
+        i = key & mask
+        while True:
+            stored = self.keys[i]
+            if stored == key:
+                return self.values[i]
+            if stored == 0:
+                self.keys[i] = key
+                self.values[i] = value
+                self.size += 1
+                if self.size * 2 > self.capacity:
+                    self._grow()
+                return value
+            i = (i + 1) & mask
+
+    def _grow(self):
+        keys, values = self.keys, self.values
+        self.__init__(self.capacity * 2)
+        for key, value in zip(keys, values):
+            if key:
+                self.setdefault(key, value)
+
+
+class DuplicateDetector:
+
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self.names = []
+        self.clusters = array('l')
+        self.sketches = bytearray()
+        self.bands = [BandTable() for _ in range(BANDS)]
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return f'<DuplicateDetector documents={len(self)} duplicates={self.duplicates}>'
+
+    def add(self, name: str, content: str) -> str:
+        """Add the document and return the identifier of its duplicate cluster,
+        which is the name of the first document seen for the cluster."""
+        sig = signature(content)
+        number = len(self.names)
+        self.names.append(name)
+        if sig is None:
+            self.clusters.append(number)
+            self.sketches.extend(bytes(NUM_BINS))
+            return name
+        sketch = bytes(value & 0xff for value in sig)
+        self.sketches.extend(sketch)
+        best, best_similarity = None, self.threshold
+        for band, table in enumerate(self.bands):
+            rows = sig[band * ROWS:(band + 1) * ROWS]
+            key = stable_hash(repr(rows).encode('ascii')) >> 1 | 1
+            candidate = table.setdefault(key, number)
+            if candidate != number:
+                similarity = self.similarity(sketch, candidate)
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+        if best is None:
+            self.clusters.append(number)
+        else:
+            self.clusters.append(self.clusters[best])
+            self.duplicates += 1
+        return self.names[self.clusters[number]]
+
+    def similarity(self, sketch: bytes, number: int) -> float:
+        """Estimate the Jaccard similarity from the lowest byte of each bin. Two
+        different values agree on one byte with probability 1/256, so the raw
+        agreement is corrected for that."""
+        other = self.sketches[number * NUM_BINS:(number + 1) * NUM_BINS]
+        agreement = sum(1 for a, b in zip(sketch, other) if a == b) / NUM_BINS
+        return max(0.0, (agreement - 1 / 256) / (1 - 1 / 256))
+
+    def cluster_of(self, number: int) -> str:
+        return self.names[self.clusters[number]]
+
+    def report(self) -> str:
+        return (f'duplicates: {self.duplicates:,} of {len(self):,} documents'
+                f' are near-duplicates of an earlier document')
+
+
+if __name__ == '__main__':
+
+    text_dir = sys.argv[1]
+    detector = DuplicateDetector()
+    for fname in sorted(os.listdir(text_dir)):
+        if fname.endswith('.txt'):
+            with open(os.path.join(text_dir, fname)) as fh:
+                detector.add(fname[:-4], fh.read())
+    members = {}
+    for number, name in enumerate(detector.names):
+        members.setdefault(detector.cluster_of(number), []).append(name)
+    for cluster, names in members.items():
+        if len(names) > 1:
+            print(cluster, ' '.join(names))
+    print(detector.report())
@@ -2,18 +2,72 @@
 
 Contains classes that implement the behavior of documents and paragraphs.
 
+The parser can also be used without any files, which is handy when it is
+embedded in another service:
+
+    result = process_document(name, text, scpa_json)
+
+Where text is the text as a string or bytes and scpa_json is the ScienceParse
+output as a dictionary. The result is a dictionary with the mode, the scores and
+the morsels, see Document.result(). Use process_documents() to lazily process an
+iterable of <name, text, scpa_json> triples.
+
 """
 
 import os, json, glob
 import sys
+import copy
+from concurrent.futures import Future
+import bisect
+import hashlib
+import itertools
 from collections import Counter
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 import frequencies
 import utils
+import archive
+import spans
+import headings
+import languages
+import scheduler
+import jsonfields
+import lexicon
+import watchdog
+from ids import IdSet
 
 FREQUENT_ENGLISH_WORDS = set(
     [line.split()[1] for line in frequencies.FREQUENCIES.split('\n') if line])
 
+FREQUENT_WORDS = {'en': FREQUENT_ENGLISH_WORDS}
+FREQUENT_WORDS.update(
+    {language: set(words.split()) for language, words in frequencies.OTHER_LANGUAGES.items()})
+
+LANGUAGE_TABLE = languages.LanguageTable(FREQUENT_WORDS)
+
+
+def _bytes_language_table() -> languages.LanguageTable:
+    """Return the language table for tokens that are bytes, see process_plain()."""
+    return languages.LanguageTable(
+        {language: {word.encode('utf-8') for word in words}
+         for language, words in FREQUENT_WORDS.items()})
+
+
+BYTES_LANGUAGE_TABLE = _bytes_language_table()
+
+# The lexicon file that replaced the built-in English words, if any
+LEXICON_FILE = None
+
+# Times at which the stages of parsing the current document ended, for documents
+# that go over their budget
+STAGE_CLOCK = watchdog.StageClock()
+
+# A worker that is this many times over the time budget is killed
+HARD_TIMEOUT_FACTOR = 3
+
+# Outputs with more characters of text than this are written one section at a
+# time by the output writer, see write_morsels()
+STREAM_SIZE = 1024 ** 2
+
 DOCUMENT_TESTS = {
     'size': (utils.between, (1000, 500000)),
     'language': (utils.larger, 0.2),
@@ -29,20 +83,112 @@ PARAGRAPH_TESTS = {
     'average_token_length': (utils.larger, 4),
     'singletons_per_token': (utils.smaller, 0.1)}
 
+# Increment this when a code change alters the output for the same input, this
+# invalidates all results in the result cache
+PARSER_VERSION = 3
+
+
+def use_lexicon(path: str):
+    """Score English with the words from a lexicon file instead of the built-in
+    list, see lexicon.py. This changes the scoring version, so cached results for
+    the built-in list are not used."""
+    global FREQUENT_ENGLISH_WORDS, LANGUAGE_TABLE, BYTES_LANGUAGE_TABLE, LEXICON_FILE
+    FREQUENT_ENGLISH_WORDS = lexicon.load(path)
+    FREQUENT_WORDS['en'] = FREQUENT_ENGLISH_WORDS
+    LANGUAGE_TABLE = languages.LanguageTable(FREQUENT_WORDS)
+    BYTES_LANGUAGE_TABLE = _bytes_language_table()
+    LEXICON_FILE = path
+
+
+def scoring_version() -> str:
+    """Return a short hash of everything that determines the results for a given
+    input: the parser version, the tests and the list of frequent words."""
+    def test_config(tests: dict):
+        return sorted((name, test.__name__, threshold)
+                      for name, (test, threshold) in tests.items())
+    config = [PARSER_VERSION,
+              test_config(DOCUMENT_TESTS),
+              test_config(PARAGRAPH_TESTS),
+              sorted((language, sorted(words)) for language, words in FREQUENT_WORDS.items())]
+    return hashlib.sha1(repr(config).encode('utf-8')).hexdigest()[:16]
+
 
 class Documents:
 
-    def __init__(self, file_list: str, html_dir: str, data_dir: str):
+    def __init__(self, file_list: str, html_dir: str, data_dir: str, **options):
         """Initialize with a file list, an output directory for the html analysis
-        view and an output directory for the processed and filtered data."""
+        view and an output directory for the processed and filtered data. See
+        set_options() for the options."""
         self.html_dir = html_dir
         self.data_dir = data_dir
+        self.set_options(**options)
         with open(file_list) as fh:
             self.text_dir = fh.readline().split()[2]
             self.scpa_dir = fh.readline().split()[2]
-            self.names = [name.strip() for name in fh if not name.startswith('#')]
+            names = (name.strip() for name in fh
+                     if name.strip() and not name.startswith('#'))
+            if self.shard is not None:
+                names = (name for name in names if name in self.shard)
+            self.names = IdSet(names)
         self.initialize_documents()
 
+    def set_options(self, cache=None, dedup=None, skip_duplicates=False,
+                    boilerplate=None, trim_lines=False, abstract_only=False, workers=1,
+                    memory_budget=scheduler.DEFAULT_MEMORY_BUDGET,
+                    memory_factor=scheduler.MEMORY_FACTOR,
+                    huge_size=scheduler.HUGE_DOCUMENT_SIZE, time_budget=None,
+                    memory_limit=None, quarantine=None, retry_cheaper=False,
+                    bytes_mode=False, encoding_errors='replace', metadata=None,
+                    outliers=None, shard=None, writer=None):
+        """If a cache.ResultCache is handed in then results are taken from the
+        cache if possible. If a dedup.DuplicateDetector is handed in then the
+        output is tagged with a duplicate cluster and duplicates are optionally
+        skipped. If a boilerplate.BoilerplateIndex is handed in then boilerplate
+        lines are removed from the text before parsing. With trim_lines, lines
+        that are not running text are removed from paragraphs in the output.
+        With abstract_only the output only has the title and the abstract, see
+        process_abstract(). With more than one worker, documents are parsed by a
+        pool of processes, see scheduler.py for the memory budget, the memory
+        factor and the size of huge documents. The time_budget (in seconds) and
+        the memory_limit (in bytes) are the budget for a single document,
+        documents over the budget are added to the quarantine, a
+        watchdog.Quarantine, and with retry_cheaper they are parsed again in
+        abstract-only mode. With bytes_mode the text is handed to the parser as
+        bytes, see process_bytes(). The encoding_errors are 'replace' or
+        'strict', with 'strict' documents that are not UTF-8 are added to the
+        quarantine. If a metadata.MetadataIndex is handed in then the output is
+        enriched with the DOI, the journal and the year from the xDD metadata.
+        If an outliers.SlowDocuments is handed in then it is given the parse
+        time of each document and write_output() ends with its summary. If a
+        shards.Shard is handed in then only the documents in the shard are
+        processed and write_output() writes a manifest for the shard. If a
+        writer.OutputWriter is handed in then the output is written by its
+        background thread."""
+        self.cache = cache
+        self.dedup = dedup
+        self.skip_duplicates = skip_duplicates
+        self.boilerplate = boilerplate
+        self.trim_lines = trim_lines
+        self.abstract_only = abstract_only
+        self.time_budget = time_budget
+        self.memory_limit = memory_limit
+        self.quarantine = watchdog.Quarantine() if quarantine is None else quarantine
+        self.retry_cheaper = retry_cheaper
+        self.bytes_mode = bytes_mode
+        self.encoding_errors = encoding_errors
+        self.metadata = metadata
+        self.outliers = outliers
+        self.shard = shard
+        self.writer = writer
+        self._pending = {}
+        # pairs of a future and a name for documents that are being parsed, by
+        # cache key
+        self._in_flight = {}
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.memory_factor = memory_factor
+        self.huge_size = huge_size
+
     def initialize_documents(self):
         # using a generator because there could be many documents
         self.documents = (
@@ -68,15 +214,271 @@ class Documents:
     def output_filename(self, name: str):
         return os.path.join(self.data_dir, f"{name}.json")
 
+    def document_name(self, name: str) -> str:
+        """Return the xDD name of the document, which is the name itself here, see
+        topics.TopicDocuments for names that are not."""
+        return name
+
+    def sources(self):
+        """Generate triples <name, text, scpa> with the raw bytes of the text file
+        and the ScienceParse file, scpa is the empty string if there is no file."""
+        for name in self.names:
+            yield self.source(name)
+
+    def source(self, name: str) -> tuple:
+        with open(self.text_filename(name), 'rb') as fh:
+            text = fh.read()
+        try:
+            with open(self.scpa_filename(name), 'rb') as fh:
+                scpa = fh.read()
+        except FileNotFoundError:
+            scpa = b''
+        return name, text, scpa
+
+    def source_size(self, name: str) -> int:
+        """Return the combined size of the text file and the ScienceParse file."""
+        size = os.path.getsize(self.text_filename(name))
+        try:
+            return size + os.path.getsize(self.scpa_filename(name))
+        except FileNotFoundError:
+            return size
+
+    def document_from_content(self, name: str, content: str, scpa: bytes):
+        return Document(
+            name,
+            self.text_filename(name),
+            self.scpa_filename(name),
+            self.output_filename(name),
+            content=content,
+            scpa_json=json.loads(scpa) if scpa else {},
+            boilerplate=self.boilerplate,
+            trim_lines=self.trim_lines)
+
+    def cache_version(self) -> str:
+        """The version that goes into the cache key, which includes the options
+        that change the results."""
+        version = scoring_version()
+        if self.boilerplate is not None:
+            version += self.boilerplate.version
+        if self.trim_lines:
+            version += '-trim'
+        if self.abstract_only:
+            version += '-abstract'
+        return version
+
     def write_output(self):
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
-        count = 0
-        for doc in self:
-            count += 1
+        if self.shard is not None:
+            self.shard.start(self.data_dir)
+        for count, (name, result) in enumerate(self.results(), start=1):
             if count % 100 == 0:
                 print(count)
-            doc.write_data(self.data_dir)
+            bundled = self.shard is not None and self.shard.add(name, result)
+            if result is not None and not bundled:
+                self.write_result(name, result)
+        if self.writer is not None:
+            self.writer.close()
+            print(f'>>> {self.writer}')
+        self.report()
+        if self.shard is not None:
+            self.shard.finish()
+        if self.outliers is not None:
+            self.outliers.finish(self)
+
+    def records(self):
+        """Generate a record for each document that was processed, with the name
+        as the id, the mode, the scores and the morsels, see stream.py. Documents
+        that failed get a record with the id and the error."""
+        for name, result in self.results():
+            if result is not None:
+                record = {'id': name, 'mode': result['mode'], 'scores': result['scores']}
+                record.update(result['morsels'])
+                yield record
+            elif self.quarantine.entries and self.quarantine.entries[-1]['name'] == name:
+                # finish() just added the failure to the quarantine
+                entry = self.quarantine.entries[-1]
+                record = {'id': name, 'error': entry['error']}
+                if 'message' in entry:
+                    record['message'] = entry['message']
+                yield record
+
+    def write_result(self, name: str, result: dict):
+        """Write the morsels of the result, or queue them if there is a writer."""
+        if self.writer is None:
+            write_morsels(self.output_filename(name), result['morsels'])
+        else:
+            self.writer.write(self.output_filename(name), result['morsels'])
+
+    def results(self):
+        """Generate pairs of names and results, the result is None for skipped
+        duplicates. Documents are parsed by worker processes if there is more
+        than one worker."""
+        if self.workers > 1:
+            return self.parallel_results()
+        return ((name, self.process(name, text, scpa))
+                for name, text, scpa in self.sources())
+
+    def report(self):
+        """Print statistics on the cache, the duplicates and the metadata, if any."""
+        if self.cache is not None:
+            self.cache.evict()
+            print(f'>>> {self.cache.report()}')
+        if self.dedup is not None:
+            print(f'>>> {self.dedup.report()}')
+        if self.metadata is not None:
+            print(f'>>> {self.metadata.report()}')
+        if self.quarantine.entries:
+            print(f'>>> {self.quarantine.report()}')
+
+    def parallel_results(self):
+        """Generate pairs of names and results, where the documents are parsed by
+        a pool of worker processes. The order is the largest-first order of the
+        scheduler, which only depends on the names and sizes of the documents and
+        not on which worker finishes first."""
+        jobs = [(name, self.source_size(name)) for name in self.names]
+        pool = self.scheduler()
+        try:
+            for name, raw_result in pool.run(jobs, self.submit_name):
+                yield name, self.finish(name, raw_result)
+        finally:
+            pool.shutdown()
+
+    def scheduler(self) -> scheduler.Scheduler:
+        has_budget = self.time_budget is not None or self.memory_limit is not None
+        return scheduler.Scheduler(
+            self.workers, self.memory_budget, self.huge_size,
+            initializer=initialize_worker,
+            initargs=(self.worker_options(), LEXICON_FILE),
+            hard_timeout=(None if self.time_budget is None
+                          else self.time_budget * HARD_TIMEOUT_FACTOR),
+            on_failure=failure if has_budget else None,
+            memory_factor=self.memory_factor)
+
+    def worker_options(self) -> dict:
+        """The keyword arguments for process_with_budget()."""
+        return {'boilerplate': self.boilerplate,
+                'trim_lines': self.trim_lines,
+                'abstract_only': self.abstract_only,
+                'time_budget': self.time_budget,
+                'memory_budget': self.memory_limit,
+                'errors': self.encoding_errors,
+                'timed': self.outliers is not None}
+
+    def content(self, text: bytes):
+        """Return what the parser gets for the bytes of a text file, which is the
+        bytes themselves in bytes mode and the decoded text otherwise."""
+        return text if self.bytes_mode else utils.decode_text(text, self.encoding_errors)
+
+    def submit_name(self, executor, name: str) -> Future:
+        return self.submit(*self.source(name), executor=executor)
+
+    def process(self, name: str, text: bytes, scpa: bytes):
+        """Return the result for a document given the bytes of the text file and
+        the ScienceParse file. The result is taken from the cache if possible,
+        and it is tagged with the duplicate cluster if we look for duplicates.
+        Returns None if the document is a duplicate that should be skipped."""
+        return self.finish(name, self.submit(name, text, scpa).result())
+
+    def submit(self, name: str, text: bytes, scpa: bytes, executor=None) -> Future:
+        """Do the work for process() that comes before parsing and return a Future
+        for the result of parsing, which is done by the executor if there is one.
+        Returns a Future that is already done for cached documents and skipped
+        duplicates. The result of the Future is handed to finish()."""
+        context = self._pending[name] = {'cluster': None, 'key': None}
+        try:
+            content = self.content(text)
+            if self.dedup is not None:
+                decoded = (utils.decode_text(text, self.encoding_errors)
+                           if self.bytes_mode else content)
+                context['cluster'] = self.dedup.add(name, decoded)
+        except UnicodeDecodeError:
+            return completed_future(failure(name, 'encoding'))
+        if self.outliers is not None:
+            context['size'] = len(text) + len(scpa)
+            context['paragraphs'] = utils.translate_newlines(text).count(b'\n\n') + 1
+        if self.dedup is not None and self.skip_duplicates and context['cluster'] != name:
+            context['skipped'] = True
+            return completed_future(None)
+        if self.cache is not None:
+            key = self.cache.key(text, scpa, self.cache_version())
+            result = self.cache.get(key)
+            if result is not None:
+                # the result may have been stored for a copy with another name
+                result['name'] = name
+                return completed_future(result)
+            future, first = self._in_flight.get(key, (None, None))
+            if future is not None and not future.done() and first in self._pending:
+                # the same document is parsed already, for example in another
+                # topic, both get the same result and copy it in finish()
+                self._pending[first]['shared'] = context['shared'] = True
+                return chained_future(future)
+            context['key'] = key
+        if executor is None:
+            result = process_with_budget(name, content, scpa, **self.worker_options())
+            if is_failure(result):
+                # keep the input for a retry, it cannot be read again from an archive
+                context['source'] = content, scpa
+            return completed_future(result)
+        future = executor.submit(process_in_worker, name, content, scpa)
+        if context['key'] is not None:
+            self._in_flight[context['key']] = future, name
+        return future
+
+    def finish(self, name: str, result: dict):
+        """Do the work for process() that comes after parsing, this runs in the
+        main process since the cache connection cannot be shared."""
+        context = self._pending.pop(name)
+        if context['key'] is not None:
+            self._in_flight.pop(context['key'], None)
+        if context.get('skipped'):
+            return None
+        if context.get('shared') and result is not None:
+            # the result is also handed to another document, so it is not changed
+            result = copy.deepcopy(result)
+            result['name'] = name
+        if is_failure(result):
+            result = self.handle_failure(name, result, context.get('source'))
+            if result is None:
+                return None
+            result.pop('seconds', None)
+        else:
+            seconds = result.pop('seconds', None)
+            if seconds is not None and self.outliers is not None:
+                self.outliers.add(name, seconds, context['size'], context['paragraphs'],
+                                  result['scores']['section_count'])
+            if context['key'] is not None:
+                self.cache.put(context['key'], result)
+        if context['cluster'] is not None:
+            result['morsels']['duplicate_cluster'] = self.document_name(context['cluster'])
+        if self.metadata is not None:
+            result['morsels']['metadata'] = self.metadata.fields(self.document_name(name))
+        return result
+
+    def handle_failure(self, name: str, result: dict, source: tuple = None):
+        """Add a document that went over its budget, that could not be decoded or
+        that could not be parsed to the quarantine and return the result of
+        parsing it again in abstract-only mode if we retry, or None if we do not
+        or if that failed too. Documents that could not be decoded are not
+        retried. Retried results are not cached."""
+        entry = {'name': name, 'error': result['error'], 'stages': result['stages'],
+                 'retried': None}
+        if 'message' in result:
+            entry['message'] = result['message']
+        retried = None
+        if self.retry_cheaper and not self.abstract_only and result['error'] != 'encoding':
+            if source is None:
+                _, text, scpa = self.source(name)
+                source = self.content(text), scpa
+            options = dict(self.worker_options(), abstract_only=True)
+            retried = process_with_budget(name, source[0], source[1], **options)
+            if is_failure(retried):
+                retried = None
+            entry['retried'] = 'failed' if retried is None else 'abstract'
+        error = result.get('message', result['error'])
+        print(f'WARNING: {name} failed ({error}), retried={entry["retried"]}')
+        self.quarantine.add(entry)
+        return retried
 
     def write_html(self):
         print('HTML', self.html_dir)
@@ -132,29 +534,88 @@ class Documents:
             fh.write(f'</ul>\n</body>\n</html>\n')
 
 
+class ArchiveDocuments(Documents):
+
+    """Documents read from a tar or zip archive instead of from the text and
+    ScienceParse directories, see archive.py for what the archive should look
+    like. Members are streamed so nothing is extracted to disk."""
+
+    def __init__(self, archive_file: str, html_dir: str, data_dir: str,
+                 limit: int = sys.maxsize, **options):
+        self.archive_file = archive_file
+        self.html_dir = html_dir
+        self.data_dir = data_dir
+        self.set_options(**options)
+        # archives are read as a stream so sizes are not known up front
+        self.workers = 1
+        self.limit = limit
+        # if set only the documents with these names are read, see verify.py
+        self.names = None
+        self.text_dir = archive_file
+        self.scpa_dir = archive_file
+        self.initialize_documents()
+
+    def initialize_documents(self):
+        self.documents = (
+            self.document_from_content(name, utils.decode_text(text), scpa)
+            for name, text, scpa in self.sources())
+
+    def sources(self):
+        members = archive.documents(self.archive_file)
+        if self.shard is not None:
+            members = (member for member in members if member[0] in self.shard)
+        if self.names is not None:
+            members = (member for member in members if member[0] in self.names)
+        for name, text, scpa in itertools.islice(members, self.limit):
+            yield name, text, b'' if scpa is None else scpa
+
+    def __str__(self):
+        return f'<ArchiveDocuments archive={self.archive_file} data_dir={self.data_dir}>'
+
+
 class Document:
 
-    def __init__(self, name: str, text_file: str, scpa_file: str, out_file: str):
+    def __init__(self, name: str, text_file: str = None, scpa_file: str = None,
+                 out_file: str = None, content: str = None, scpa_json: dict = None,
+                 boilerplate=None, trim_lines: bool = False):
         """Created from the name of the document ("5cd7d9e40b45c76caf88d812")
-        and the locations of the text file and the ScienceParse file."""
+        and the locations of the text file and the ScienceParse file. If the
+        content of the text file and the ScienceParse json are handed in then
+        the files are not read and the file locations are optional. If a
+        boilerplate index is given then boilerplate lines are removed before
+        anything else is done. With trim_lines the paragraphs that make it into
+        the output have their lines that are not running text removed."""
         self.name = name
-        self.text_file = os.path.abspath(text_file)
-        self.scpa_file = os.path.abspath(scpa_file)
-        self.out_file = os.path.abspath(out_file)
-        with open(text_file) as fh:
-            self.content = fh.read()
-        self.paras = [Paragraph(p, self) for p in self.content.split("\n\n")]
+        self.text_file = None if text_file is None else os.path.abspath(text_file)
+        self.scpa_file = None if scpa_file is None else os.path.abspath(scpa_file)
+        self.out_file = None if out_file is None else os.path.abspath(out_file)
+        if content is None:
+            with open(text_file) as fh:
+                content = fh.read()
+        if boilerplate is not None:
+            content = boilerplate.strip(content)
+            STAGE_CLOCK.mark('boilerplate')
+        self.content = content
+        self.trim_lines = trim_lines
+        self.paras = self.create_paragraphs()
+        STAGE_CLOCK.mark('paragraphs')
         self.lines = self.content.split("\n")
+        self._span_index = None
         self.tokens = Counter(self.content.split())
+        STAGE_CLOCK.mark('tokens')
+        self.headings = []
         self.abstract = None
+        self.abstract_span = None
         self.para_count = len(self.paras)
         self.line_count = len(self.lines)
         self.token_count = sum(self.tokens.values())
-        self.scpa_doc = ScpaDocument(scpa_file)
+        self.scpa_doc = ScpaDocument(self.scpa_file, scpa_json)
         self.tests = DOCUMENT_TESTS
         self.scores = DocumentScores(self)
+        STAGE_CLOCK.mark('scores')
         self.link_paragraphs()
-        self.parse_paragraphs()
+        self.parse_headings()
+        STAGE_CLOCK.mark('headings')
         # this will be filled in when the output string is created
         self.output_size = None
 
@@ -168,21 +629,78 @@ class Document:
     def __len__(self):
         return len(self.content)
 
+    def create_paragraphs(self) -> list:
+        """Create the paragraphs and give each of them the range of document line
+        numbers it was taken from."""
+        paragraphs = []
+        start = 0
+        offset = 0
+        for content in self.content.split("\n\n"):
+            end = start + content.count("\n") + 1
+            paragraph = Paragraph(content, self, (start, end))
+            paragraph.offset = offset
+            paragraphs.append(paragraph)
+            # skip the empty line between paragraphs
+            start = end + 1
+            offset += len(content) + 2
+        return paragraphs
+
+    def paragraph_at(self, offset: int):
+        """Return the paragraph that the character offset is in."""
+        offsets = [para.offset for para in self.paras]
+        return self.paras[max(0, bisect.bisect_right(offsets, offset) - 1)]
+
+    def span_index(self) -> spans.SpanIndex:
+        """Return the index for scoring line ranges, it is created the first time
+        it is needed."""
+        if self._span_index is None:
+            self._span_index = spans.SpanIndex(self.lines, FREQUENT_ENGLISH_WORDS)
+        return self._span_index
+
+    def prose_lines(self, start: int, end: int) -> list:
+        """Return the line numbers from the range that are running text."""
+        return self.span_index().prose_lines(start, end)
+
+    def language_table(self) -> languages.LanguageTable:
+        """Return the table that the document and its paragraphs are scored with."""
+        return LANGUAGE_TABLE
+
+    def find_headings(self) -> list:
+        return headings.find_headings(self.content)
+
     def link_paragraphs(self):
         """Turn the paragraph list into a linked list."""
         for i in range(len(self.paras) - 1):
             self.paras[i].next = self.paras[i + 1]
             self.paras[i + 1].previous = self.paras[i]
 
-    def parse_paragraphs(self):
-        for para in self.paras:
-            para.parse()
+    def parse_headings(self):
+        """Find all headings with one scan over the text and take the abstract
+        from the first abstract heading that is followed by some text."""
+        self.headings = self.find_headings()
+        found = headings.first_abstract_span(self.content, self.headings)
+        if found is not None:
+            self.abstract_span = found[1]
+            self.abstract = self.paragraph_at(self.abstract_span[0])
+            self.abstract.is_abstract = True
+
+    def abstract_span_after(self, heading: headings.Heading):
+        """Return the character offsets of the abstract that follows the heading,
+        see headings.abstract_span()."""
+        return headings.abstract_span(self.content, self.headings, heading)
+
+    def sections(self) -> list:
+        """Return a list of <heading, text> pairs for the headings in the text."""
+        return headings.sections(self.content, self.headings)
 
     def class_name(self):
         return self.__class__.__name__
 
     def abstract_content(self):
-        return self.abstract.abstract_content() if self.abstract else None
+        if self.abstract_span is None:
+            return None
+        start, end = self.abstract_span
+        return self.content[start:end].strip()
 
     def abstract_content_scpa(self):
         return self.scpa_doc.abstract if self.scpa_doc.abstract else None
@@ -253,16 +771,325 @@ class Document:
 
     def write_data(self, directory: str):
         morsels = Morsels(self)
-        with open(self.out_file, 'w') as fh:
-            output = json.dumps(morsels.as_json(), indent=4)
-            self.output_size = len(output)
-            fh.write(output)
+        self.output_size = write_morsels(self.out_file, morsels.as_json())
+
+    def result(self) -> dict:
+        """Return the processing result as a dictionary with the name, the mode
+        that Morsels picked, the document scores and the json for the morsels."""
+        morsels = Morsels(self)
+        STAGE_CLOCK.mark('morsels')
+        return {'name': self.name,
+                'mode': morsels.mode,
+                'scores': self.scores.as_dict(),
+                'morsels': morsels.as_json()}
+
+
+def process_document(name: str, text, scpa_json: dict = None,
+                     boilerplate=None, trim_lines: bool = False) -> dict:
+    """Process a document without touching the file system and return the result
+    as created by Document.result(). The text is a string or the bytes of the
+    text file and scpa_json the decoded ScienceParse output, if any."""
+    if isinstance(text, (bytes, bytearray)):
+        text = utils.decode_text(bytes(text))
+    document = Document(name, content=text,
+                        scpa_json={} if scpa_json is None else scpa_json,
+                        boilerplate=boilerplate, trim_lines=trim_lines)
+    return document.result()
+
+
+def process_documents(inputs, boilerplate=None, trim_lines: bool = False):
+    """Lazily generate the results for an iterable of <name, text, scpa_json>
+    triples, see process_document()."""
+    for name, text, scpa_json in inputs:
+        yield process_document(name, text, scpa_json, boilerplate, trim_lines)
+
+
+def process_source(name: str, content, scpa: bytes, boilerplate=None,
+                   trim_lines: bool = False, abstract_only: bool = False,
+                   errors: str = 'replace') -> dict:
+    """Like process_document(), but with the ScienceParse file as bytes. With
+    abstract_only this uses process_abstract(). The content is the decoded text
+    or the bytes of the text file, bytes are handed to process_bytes(). The
+    errors are used for decoding, see utils.decode_text()."""
+    if isinstance(content, bytes):
+        return process_bytes(name, content, scpa, boilerplate, trim_lines,
+                             abstract_only, errors)
+    scpa = scpa.decode('utf-8-sig', errors)
+    if abstract_only:
+        return process_abstract(name, content, scpa, boilerplate)
+    scpa_json = json.loads(scpa) if scpa else {}
+    STAGE_CLOCK.mark('json')
+    return process_document(name, content, scpa_json, boilerplate, trim_lines)
+
+
+def process_bytes(name: str, text: bytes, scpa: bytes, boilerplate=None,
+                  trim_lines: bool = False, abstract_only: bool = False,
+                  errors: str = 'replace') -> dict:
+    """Like process_source(), but with the text file as bytes. Plain text, which
+    is most of it, is not decoded, see process_plain() and utils.is_plain_text().
+    Other text is decoded, as is all text with boilerplate removal or trimmed
+    lines since those work on lines of text."""
+    text = utils.translate_newlines(text)
+    scpa = scpa.decode('utf-8-sig', errors)
+    if boilerplate is not None or trim_lines or not utils.is_plain_text(text):
+        text = utils.decode_text(text, errors)
+    if abstract_only:
+        return process_abstract(name, text, scpa, boilerplate)
+    if isinstance(text, bytes):
+        return process_plain(name, text, scpa)
+    scpa_json = json.loads(scpa) if scpa else {}
+    STAGE_CLOCK.mark('json')
+    return process_document(name, text, scpa_json, boilerplate, trim_lines)
+
+
+def process_plain(name: str, content: bytes, scpa: str) -> dict:
+    """Return the same result as process_document() for plain text as bytes. The
+    paragraphs are split, tokenized and scored as bytes and only the paragraphs
+    and the abstract that go into the output are decoded. Only the ScienceParse
+    fields that are used are decoded, see jsonfields.py."""
+    fields = jsonfields.extract(scpa, ['metadata'], ['title', 'abstractText', 'sections'])
+    scpa_doc = ScpaDocument(scpa_json={'metadata': fields})
+    STAGE_CLOCK.mark('json')
+    paragraphs = [paragraph.strip() for paragraph in content.split(b'\n\n')]
+    STAGE_CLOCK.mark('paragraphs')
+    language_scores = BYTES_LANGUAGE_TABLE.scores(Counter(content.split()))
+    STAGE_CLOCK.mark('tokens')
+    best_language, best_language_score = BYTES_LANGUAGE_TABLE.best(language_scores)
+    # the same fields in the same order as DocumentScores
+    scores = {'size': len(content),
+              'language': language_scores['en'],
+              'best_language': best_language,
+              'best_language_score': best_language_score,
+              'medrxiv': content.count(b'medRxiv') / len(paragraphs),
+              'section_count': len(scpa_doc.sections),
+              'section_length': scpa_doc.section_length,
+              'section_headers_ratio': scpa_doc.section_headers_ratio}
+    STAGE_CLOCK.mark('scores')
+    mode = pick_mode(scores['section_count'], scores['section_length'],
+                     lambda: scores['language'])
+    abstract = None
+    sections = []
+    if mode in ('scpa', 'text'):
+        found = headings.first_abstract_span(content, headings.find_headings(content))
+        if found is not None:
+            start, end = found[1]
+            abstract = {'source': 'text', 'abstract': content[start:end].strip().decode('ascii')}
+        elif scpa_doc.abstract:
+            abstract = {'source': 'scpa', 'abstract': scpa_doc.abstract}
+    STAGE_CLOCK.mark('headings')
+    if mode == 'scpa':
+        sections = scpa_sections(scpa_doc.sections)
+    elif mode == 'text':
+        for paragraph in paragraphs:
+            if BYTES_LANGUAGE_TABLE.scores(Counter(paragraph.split()))['en'] > 0.3:
+                sections.append(
+                    {'source': 'text', 'heading': None, 'text': paragraph.decode('ascii')})
+    STAGE_CLOCK.mark('morsels')
+    return {'name': name,
+            'mode': mode,
+            'scores': scores,
+            'morsels': {'title': scpa_doc.title, 'abstract': abstract, 'sections': sections}}
+
+
+def process_abstract(name: str, content, scpa: str, boilerplate=None) -> dict:
+    """Return the result for a document when only the title and the abstract are
+    needed. This picks the same mode and the same abstract as Morsels, but does not
+    create paragraphs and does not score them. Only the fields that are needed are
+    taken from the ScienceParse file and the language score of the text is only
+    calculated if the mode depends on it. The result has the mode, the scores that
+    were needed for it and morsels with the title and the abstract. The content is
+    a string or plain text as bytes, see process_bytes()."""
+    fields = jsonfields.extract(
+        scpa, ['metadata'], ['title', 'abstractText'], lengths={'sections': 'text'})
+    STAGE_CLOCK.mark('json')
+    if boilerplate is not None:
+        content = boilerplate.strip(content)
+        STAGE_CLOCK.mark('boilerplate')
+    section_lengths = fields['sections'] or []
+    scores = {'section_count': len(section_lengths),
+              'section_length': _average_section_length(section_lengths),
+              'language': None}
+
+    def language():
+        table = BYTES_LANGUAGE_TABLE if isinstance(content, bytes) else LANGUAGE_TABLE
+        scores['language'] = table.scores(Counter(content.split()))['en']
+        return scores['language']
+
+    mode = pick_mode(scores['section_count'], scores['section_length'], language)
+    STAGE_CLOCK.mark('mode')
+    abstract = None
+    if mode in ('scpa', 'text'):
+        found = headings.first_abstract_span(content, headings.find_headings(content))
+        if found is not None:
+            start, end = found[1]
+            text = content[start:end].strip()
+            if isinstance(text, bytes):
+                text = text.decode('ascii')
+            abstract = {'source': 'text', 'abstract': text}
+        elif fields['abstractText']:
+            abstract = {'source': 'scpa', 'abstract': fields['abstractText']}
+    return {'name': name,
+            'mode': mode,
+            'scores': scores,
+            'morsels': {'title': fields['title'], 'abstract': abstract}}
+
+
+def _average_section_length(section_lengths: list) -> int:
+    try:
+        return int(sum(section_lengths) / len(section_lengths))
+    except ZeroDivisionError:
+        return 0
+
+
+# Options for process_in_worker(), set once for each worker process
+_worker_options = {}
+
+
+def initialize_worker(options: dict, lexicon_file: str = None):
+    """Set the keyword arguments for process_with_budget() in a worker process."""
+    if lexicon_file is not None and lexicon_file != LEXICON_FILE:
+        use_lexicon(lexicon_file)
+    _worker_options.update(options)
+
+
+def process_in_worker(name: str, content: str, scpa: bytes) -> dict:
+    return process_with_budget(name, content, scpa, **_worker_options)
+
+
+def process_with_budget(name: str, content: str, scpa: bytes, boilerplate=None,
+                        trim_lines: bool = False, abstract_only: bool = False,
+                        time_budget: float = None, memory_budget: int = None,
+                        errors: str = 'replace', timed: bool = False) -> dict:
+    """Like process_source(), but with a time budget in seconds and a memory budget
+    in bytes, see watchdog.py. For a document that goes over its budget, that
+    cannot be decoded or that could not be parsed for another reason, like
+    ScienceParse JSON that is not valid or too deeply nested, this returns a
+    failure, which is a dictionary with the name, the error and the stage
+    timings, see is_failure(). With timed the result has the parse time in
+    seconds."""
+    options = boilerplate, trim_lines, abstract_only, errors
+    STAGE_CLOCK.start()
+    try:
+        if time_budget is None and memory_budget is None:
+            result = process_source(name, content, scpa, *options)
+        else:
+            with watchdog.budget(time_budget, memory_budget):
+                result = process_source(name, content, scpa, *options)
+        if timed:
+            result['seconds'] = STAGE_CLOCK.elapsed()
+        return result
+    except watchdog.BudgetExceeded:
+        return failure(name, 'timeout', STAGE_CLOCK.timings())
+    except MemoryError:
+        return failure(name, 'memory', STAGE_CLOCK.timings())
+    except UnicodeDecodeError:
+        return failure(name, 'encoding', STAGE_CLOCK.timings())
+    except RecursionError:
+        return failure(name, 'recursion', STAGE_CLOCK.timings())
+    except Exception as e:
+        return failure(name, 'exception', STAGE_CLOCK.timings(), f'{type(e).__name__}: {e}')
+
+
+def failure(name: str, error: str, stages: dict = None, message: str = None) -> dict:
+    result = {'name': name, 'error': error, 'stages': {} if stages is None else stages}
+    if message is not None:
+        result['message'] = message
+    return result
+
+
+def is_failure(result) -> bool:
+    return result is not None and 'error' in result
+
+
+def completed_future(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def chained_future(future: Future) -> Future:
+    """Return a new Future with the outcome of the future, for a result that is
+    used for more than one document. The result itself is not copied, since the
+    callback runs in the thread of the executor while the main process may use
+    the result, see Documents.finish()."""
+    chained = Future()
+
+    def set_outcome(done: Future):
+        if done.cancelled():
+            chained.cancel()
+        elif done.exception() is not None:
+            chained.set_exception(done.exception())
+        else:
+            chained.set_result(done.result())
+
+    future.add_done_callback(set_outcome)
+    return chained
+
+
+def write_morsels(out_file: str, morsels: dict, stream_size: int = None) -> int:
+    """Write the json for the morsels to a file and return the size of the output.
+    The json is written to a temporary file that is synced to disk and then
+    renamed, so a crash never leaves a file with part of the output. If the
+    morsels have more text than stream_size the json is written one section at a
+    time, see encode_morsels()."""
+    temporary = f'{out_file}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'w') as fh:
+            if stream_size is not None and text_size(morsels) > stream_size:
+                size = 0
+                for chunk in encode_morsels(morsels):
+                    fh.write(chunk)
+                    size += len(chunk)
+            else:
+                output = json.dumps(morsels, indent=4)
+                fh.write(output)
+                size = len(output)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temporary, out_file)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return size
+
+
+def encode_morsels(morsels: dict):
+    """Generate the json for the morsels in pieces, with a piece for each section,
+    so that the json for the whole output is never created. The pieces add up to
+    json.dumps(morsels, indent=4)."""
+    if not morsels:
+        yield json.dumps(morsels, indent=4)
+        return
+    yield '{'
+    for i, (key, value) in enumerate(morsels.items()):
+        yield ('\n    ' if i == 0 else ',\n    ') + json.dumps(key) + ': '
+        if isinstance(value, list) and value:
+            yield '['
+            for j, item in enumerate(value):
+                # strings in json have no newlines, so this only indents the lines
+                item = json.dumps(item, indent=4).replace('\n', '\n        ')
+                yield ('\n        ' if j == 0 else ',\n        ') + item
+            yield '\n    ]'
+        else:
+            yield json.dumps(value, indent=4).replace('\n', '\n    ')
+    yield '\n}'
+
+
+def text_size(morsels: dict) -> int:
+    """Return the number of characters in the abstract and the sections."""
+    size = len((morsels.get('abstract') or {}).get('abstract') or '')
+    for section in morsels.get('sections') or []:
+        size += len(section.get('text') or '')
+    return size
 
 
 @dataclass()
 class DocumentScores:
     size: int = 0
     language: float = 0
+    best_language: str = None
+    best_language_score: float = 0.0
     medrxiv: float = 0
     section_count: int = 0
     section_length: int = 0
@@ -272,17 +1099,27 @@ class DocumentScores:
         self.document = document
         scpa_doc = self.document.scpa_doc
         self.size = len(self.document)
-        self.language = utils.language_score(document.tokens, FREQUENT_ENGLISH_WORDS)
+        # the English score and the best language come from the same single pass
+        table = document.language_table()
+        language_scores = table.scores(document.tokens)
+        self.language = language_scores['en']
+        self.best_language, self.best_language_score = table.best(language_scores)
         self.medrxiv = utils.medrxiv_score(document.content, document.para_count)
         self.section_count = len(scpa_doc.sections)
         self.section_length = scpa_doc.section_length
         self.section_headers_ratio = scpa_doc.section_headers_ratio
 
+    def as_dict(self) -> dict:
+        return {field.name: getattr(self, field.name) for field in fields(self)}
+
 
 class Paragraph:
 
-    def __init__(self, content: str, doc: Document):
+    def __init__(self, content: str, doc: Document, line_span: tuple = None):
         self.document = doc
+        self.line_span = line_span
+        # character offset in the document, set by the document
+        self.offset = None
         self.content = content.strip()
         self.lines = self.content.split("\n")
         self.tokens = Counter(self.content.split())
@@ -317,23 +1154,13 @@ class Paragraph:
         except ZeroDivisionError:
             return 0.0
 
-    def abstract_content(self) -> str:
-        """Return the text of the paragraph after the line with 'abstract',
-        the returned text can be the empty string."""
-        # TODO: include lines from the next paragraph, especially if this
-        #       returns an emtpy string after the abstract line
-        for i, line in enumerate(self.lines):
-            if line.lower() == 'abstract':
-                return '\n'.join(self.lines[i + 1:])
-        return ''
-
-    def parse(self):
-        for i, line in enumerate(self.lines):
-            if line.lower() == 'abstract':
-                if self.abstract_content():
-                    self.is_abstract = True
-                    self.document.abstract = self
-                break
+    def trimmed_content(self) -> str:
+        """Return the content with the lines that are not running text removed,
+        this uses the span index of the document."""
+        start, end = self.line_span
+        lines = self.document.lines
+        prose = self.document.prose_lines(start, end)
+        return '\n'.join(lines[i] for i in prose).strip()
 
     def is_useful(self):
         """Return True if the paragraph is an abstract or if all the tests
@@ -376,13 +1203,18 @@ class ParagraphScores:
 
     size: int = 0
     language: float = 0
+    best_language: str = None
+    best_language_score: float = 0.0
     average_line_length: float = 0.0
     average_token_length: float = 0.0
     singletons_per_token: float = 0.0
 
     def __init__(self, paragraph):
         self.size = len(paragraph)
-        self.language = utils.language_score(paragraph.tokens, FREQUENT_ENGLISH_WORDS)
+        table = paragraph.document.language_table()
+        language_scores = table.scores(paragraph.tokens)
+        self.language = language_scores['en']
+        self.best_language, self.best_language_score = table.best(language_scores)
         self.average_line_length = paragraph.average_line_length()
         self.average_token_length = paragraph.average_token_length()
         self.singletons_per_token = paragraph.singletons_per_token()
@@ -399,13 +1231,18 @@ class ScpaDocument:
     # DocumentScores class, but we are already using DocumentScores to include
     # scores from the SCPA file
 
-    def __init__(self, scpa_file):
+    def __init__(self, scpa_file: str = None, scpa_json: dict = None):
         self.scpa_file = scpa_file
-        try:
-            with open(scpa_file) as fh:
-                self.json = json.load(fh)
-        except FileNotFoundError:
+        if scpa_json is not None:
+            self.json = scpa_json
+        elif scpa_file is None:
             self.json = {}
+        else:
+            try:
+                with open(scpa_file) as fh:
+                    self.json = json.load(fh)
+            except FileNotFoundError:
+                self.json = {}
         self.metadata = self.json.get('metadata', {})
         self.title = self.get_title()
         self.abstract = self.get_abstract()
@@ -419,7 +1256,7 @@ class ScpaDocument:
         return "<%s %s%s>" % (self.__class__.__name__, self.short_name(), abstract)
 
     def short_name(self):
-        return os.path.basename(self.scpa_file)
+        return None if self.scpa_file is None else os.path.basename(self.scpa_file)
 
     def get_title(self):
         return self.metadata.get('title')
@@ -456,38 +1293,22 @@ class Morsels:
         self.title = doc.scpa_doc.title
         self.abstract = None
         self.sections = []
-        if doc.scores.section_count > 1 and doc.scores.section_length < 10000:
-            # use SCPA analysis if the sections are not too long
-            self.mode = 'scpa'
-        else:
-            # otherwise go with the text
-            self.mode = 'text' if doc.scores.language > 0.2 else 'none'
+        self.mode = pick_mode(doc.scores.section_count, doc.scores.section_length,
+                              lambda: doc.scores.language)
         # self.pp()
         if self.mode in ('scpa', 'text'):
             self.abstract = doc.pick_abstract()
         if self.mode == 'scpa':
-            for section in doc.scpa_doc.sections:
-                tokens = Counter(section['text'].split())
-                language = utils.language_score(tokens, FREQUENT_ENGLISH_WORDS)
-                if language > 0.3:
-                    self.sections.append(
-                        {'source': 'scpa',
-                         'heading': section['heading'],
-                         'text': section['text']})
+            self.sections = scpa_sections(doc.scpa_doc.sections)
         elif self.mode == 'text':
             for para in doc.paras:
-                # TODO: some code potentially useful for more fine-grained filtering
-                #print('\n'); print(para, para.scores); print()
-                #print(para.content.strip()); print()
-                #for line in para.content.split('\n'):
-                #    p = Paragraph(line, self.doc)
-                #    print(f"\t{p.scores}\t{line[:120]}")
-                language = utils.language_score(para.tokens, FREQUENT_ENGLISH_WORDS)
-                if language > 0.3:
-                    self.sections.append(
-                        {'source': 'text',
-                         'heading': None,
-                         'text': para.content})
+                if para.scores.language > 0.3:
+                    text = para.trimmed_content() if doc.trim_lines else para.content
+                    if text:
+                        self.sections.append(
+                            {'source': 'text',
+                             'heading': None,
+                             'text': text})
 
     def as_json(self):
         return {'title': self.title,
@@ -498,3 +1319,27 @@ class Morsels:
         print(f'{self.doc.name}  {self.doc.scores.language:.2f}'
               f'  {self.doc.scores.section_count:2d}'
               f'  {self.doc.scores.section_length:6d}  {self.mode}')
+
+
+def scpa_sections(sections: list) -> list:
+    """Return the output sections for the ScienceParse sections in English."""
+    result = []
+    for section in sections:
+        tokens = Counter(section['text'].split())
+        language = utils.language_score(tokens, FREQUENT_ENGLISH_WORDS)
+        if language > 0.3:
+            result.append(
+                {'source': 'scpa',
+                 'heading': section['heading'],
+                 'text': section['text']})
+    return result
+
+
+def pick_mode(section_count: int, section_length: int, language) -> str:
+    """Return the mode that Morsels uses for a document, the language is a function
+    that returns the language score, so it is only calculated when needed."""
+    if section_count > 1 and section_length < 10000:
+        # use SCPA analysis if the sections are not too long
+        return 'scpa'
+    # otherwise go with the text
+    return 'text' if language() > 0.2 else 'none'
@@ -504,3 +504,70 @@ FREQUENCIES = '''
 499	meet	162687
 500	paid	162605
 '''
+
+
+# Frequent words for other languages, mostly function words, compiled by hand from
+# the frequency lists at https://en.wiktionary.org/wiki/Wiktionary:Frequency_lists
+# These are used to find out what language a text is in, the English list above
+# is still the one used for the English language score.
+
+OTHER_LANGUAGES = {
+
+    'de': '''
+der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als
+auch es an werden aus er hat dass sie nach wird bei einer um am sind noch wie
+einem über einen so zum war haben nur oder aber vor zur bis mehr durch man sein
+wurde sei kann können diese dieser dieses wenn wir ich ihr ihre ihren seine
+seiner wurden zwischen unter gegen ohne sowie damit daher jedoch sehr hier alle
+beim bereits während sondern weil ob dann schon worden dort immer neue neuen
+anderen andere gibt wieder denn sowohl einige vom habe hatte hatten kein keine
+müssen soll sollte sollen waren weitere wo was wer welche welcher welches zwei
+also etwa dabei ebenfalls insbesondere nicht mit dies dessen deren wobei
+''',
+
+    'fr': '''
+de la le et les des en un une du est que qui dans pour pas au sur par plus ne se
+sont avec il elle ce cette ces nous vous ils elles son sa ses leur leurs mais ou
+comme été être avoir fait peut aux entre sans aussi très tout tous toutes bien
+deux dont où lui même autres autre encore avant après depuis lors selon ainsi
+donc car si y on était ont sera faire nos notre votre ceux celle celui chez sous
+vers contre pendant alors déjà moins peu quand toujours cela ici leurs enfin
+plusieurs chaque quelques avait étaient sont peuvent doit permet lorsque
+''',
+
+    'es': '''
+de la que el en y a los del se las por un para con no una su al lo como más pero
+sus le ya o este sí porque esta entre cuando muy sin sobre también me hasta hay
+donde quien desde todo nos durante todos uno les ni contra otros ese eso ante
+ellos e esto mí antes algunos qué unos yo otro otras otra él tanto esa estos
+mucho quienes nada muchos cual poco ella estar estas algunas algo nosotros es
+son fue ser ha han era sido está están puede según además así mientras cada
+dos tiene tienen hace pueden fueron sea mismo misma
+''',
+
+    'it': '''
+di e il la che a in per un è non una del con i da le si della al sono come ma più
+dei nel alla lo delle anche gli se o ha questo questa tra cui dal nella degli
+loro essere stato suo sua suoi sue molto ci ne mi ti era hanno quando solo tutti
+tutte dopo prima senza perché sul sulla già fra quale stesso ogni può due così
+ancora dove sia nei negli alle ai agli dalla dalle questi queste quello quella
+sempre viene vengono stata stati altri altre essa esso tale
+''',
+
+    'pt': '''
+de a o que e do da em um para é com não uma os no se na por mais as dos como mas
+foi ao ele das tem à seu sua ou ser quando muito há nos já está eu também só
+pelo pela até isso ela entre era depois sem mesmo aos ter seus quem nas me esse
+eles estão você tinha foram essa num nem suas meu às minha têm numa pelos elas
+havia seja qual será nós tenho lhe deles essas esses pelas este fosse dele são
+sobre cada podem pode ainda onde estes esta dois forma assim
+''',
+
+    'nl': '''
+de en van het een in is dat op te zijn voor met die niet aan er om ook als bij
+dan of door maar naar uit wordt worden tot ze zich nog kan werd hun meer over
+wel geen al hij we wij zij dit deze heeft hebben was waren zo omdat tussen onder
+tegen zonder na nu daar hier alle veel andere wat wie waar hoe kunnen moet
+moeten zal zou twee werden kunnen echter ons onze haar zijn hem men
+''',
+}
@@ -0,0 +1,134 @@
+"""Finding section headings in the raw text
+
+All headings of a document are found in one scan over the text with a single
+compiled regular expression. The expression recognizes a fixed set of common
+headings of scientific papers and allows for:
+
+- any case ("Abstract", "ABSTRACT")
+- numbering ("1 Introduction", "2.1. Methods", "IV. RESULTS", "A. Methods")
+- letter spacing ("A B S T R A C T", "I N T R O D U C T I O N")
+- a heading on a line of its own, optionally followed by a colon or a period
+- a heading followed by a colon, period or dash and then text on the same line
+  ("ABSTRACT: We study ...")
+
+Each heading is returned with its character offsets in the text, so the text of
+a section can be taken by slicing the text from the end of one heading to the
+start of the next.
+
+The functions also take the bytes of a plain text, see utils.is_plain_text(),
+then the offsets are byte offsets, which for plain text are the same.
+
+"""
+
+import re
+from dataclasses import dataclass
+
+
+# Heading labels and the phrases that are recognized for each of them
+HEADINGS = {
+    'abstract': ['abstract'],
+    'keywords': ['keywords', 'key words'],
+    'introduction': ['introduction', 'background'],
+    'methods': ['materials and methods', 'methods and materials', 'methods',
+                'methodology', 'method', 'data and methods'],
+    'results': ['results and discussion', 'results'],
+    'discussion': ['discussion'],
+    'conclusions': ['conclusions', 'conclusion', 'concluding remarks'],
+    'acknowledgements': ['acknowledgements', 'acknowledgments', 'acknowledgement',
+                         'acknowledgment'],
+    'references': ['references', 'bibliography', 'literature cited', 'works cited']}
+
+NUMBERING = r'(?:\d+(?:\.\d+)*\.?|[IVX]+\.|[A-Z]\.)'
+
+
+def _spaced(phrase: str) -> str:
+    """Return a pattern for the phrase that also matches the letter-spaced version."""
+    words = [r'[ \t]?'.join(re.escape(char) for char in word) for word in phrase.split()]
+    return r'[ \t]+'.join(words)
+
+
+def _compile_headings(dashes: str = '–—'):
+    labels = []
+    for label, phrases in HEADINGS.items():
+        # longer phrases first so that "results and discussion" beats "results"
+        phrases = sorted(phrases, key=len, reverse=True)
+        labels.append('(?P<%s>%s)' % (label, '|'.join(_spaced(p) for p in phrases)))
+    return re.compile(
+        r'^[ \t]*(?:%s[ \t]*)?(?:%s)' % (NUMBERING, '|'.join(labels))
+        + r'(?:(?:[ \t]*[:.%s]|[ \t]+-)[ \t]*(?=\S)|[ \t]*[:.]?[ \t]*$)' % dashes,
+        re.IGNORECASE | re.MULTILINE)
+
+
+HEADING_PATTERN = _compile_headings()
+
+# the same for bytes, plain text has no dashes other than the hyphen
+BYTES_HEADING_PATTERN = re.compile(
+    _compile_headings('').pattern.encode('ascii'), re.IGNORECASE | re.MULTILINE)
+
+
+@dataclass()
+class Heading:
+
+    label: str
+    start: int
+    end: int
+
+    def text(self, content: str) -> str:
+        """Return the heading as it occurs in the text."""
+        return content[self.start:self.end].strip()
+
+
+def find_headings(content: str) -> list:
+    """Return all headings in the content, in the order they occur."""
+    pattern = BYTES_HEADING_PATTERN if isinstance(content, bytes) else HEADING_PATTERN
+    return [Heading(match.lastgroup, match.start(), match.end())
+            for match in pattern.finditer(content)]
+
+
+def paragraph_end(content: str, position: int) -> int:
+    """Return the end offset of the paragraph that the position is in."""
+    end = content.find(b'\n\n' if isinstance(content, bytes) else '\n\n', position)
+    return len(content) if end < 0 else end
+
+
+def abstract_span(content: str, headings: list, heading: Heading):
+    """Return the character offsets of the abstract that follows the heading,
+    which is the rest of the paragraph the heading is in. If the heading is the
+    last line of its paragraph we use the next paragraph, unless it starts with
+    another heading. Returns None if no abstract was found."""
+    start = heading.end
+    end = paragraph_end(content, start)
+    if not content[start:end].strip():
+        if end >= len(content):
+            return None
+        start = end + 2
+        end = paragraph_end(content, start)
+        if any(start <= h.start < end for h in headings):
+            return None
+    text = content[start:end]
+    if not text.strip():
+        return None
+    # leave out the whitespace so the span starts in the abstract paragraph
+    start += len(text) - len(text.lstrip())
+    return start, end
+
+
+def first_abstract_span(content: str, headings: list):
+    """Return the heading and the character offsets of the abstract after the first
+    abstract heading that is followed by some text, or None if there is none."""
+    for heading in headings:
+        if heading.label == 'abstract':
+            span = abstract_span(content, headings, heading)
+            if span is not None:
+                return heading, span
+    return None
+
+
+def sections(content: str, headings: list) -> list:
+    """Return a list of <heading, text> pairs where the text runs from the end of
+    a heading to the start of the next heading or the end of the content."""
+    result = []
+    for i, heading in enumerate(headings):
+        end = headings[i + 1].start if i + 1 < len(headings) else len(content)
+        result.append((heading, content[heading.end:end].strip()))
+    return result
@@ -0,0 +1,152 @@
+"""Compact sets of xDD document identifiers
+
+An xDD identifier is 24 hexadecimal characters, like 5c02a2371faed6554886c814. As
+a Python string that takes about 75 bytes, plus the slot in a list or set that
+holds it. With millions of documents, and several copies of the identifiers in
+lists and sets, that adds up before any parsing is done.
+
+An IdSet stores standard identifiers as 12 bytes each in one sorted bytes buffer,
+so membership is a binary search and the set costs 12 bytes per identifier.
+Names that are not standard identifiers, for example test files or names with
+upper case letters, are kept as strings in a sorted list next to the buffer, so
+any name can be stored.
+
+Iteration generates the names as strings, in sorted order.
+
+Usage:
+
+    ids = IdSet(name[:-4] for name in os.listdir(text_dir))
+    '5c02a2371faed6554886c814' in ids
+    extra = ids.difference(other_ids)
+    sample = ids.sample(100)
+
+"""
+
+import re, random, bisect, heapq
+
+
+ID_SIZE = 12
+
+STANDARD_ID = re.compile(r'[0-9a-f]{24}')
+
+# Number of identifiers that are sorted at once when creating a set
+CHUNK_SIZE = 100000
+
+
+class _Records:
+
+    """Sequence view of the fixed-size records in a buffer, for bisect."""
+
+    def __init__(self, buffer: bytes):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer) // ID_SIZE
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.buffer[i * ID_SIZE:(i + 1) * ID_SIZE]
+
+
+class IdSet:
+
+    def __init__(self, names=()):
+        # identifiers are sorted in chunks that are merged at the end, so there is
+        # never more than one chunk of them as separate bytes objects
+        chunks = []
+        chunk = set()
+        others = set()
+        for name in names:
+            if STANDARD_ID.fullmatch(name):
+                chunk.add(bytes.fromhex(name))
+                if len(chunk) >= CHUNK_SIZE:
+                    chunks.append(b''.join(sorted(chunk)))
+                    chunk = set()
+            else:
+                others.add(name)
+        chunks.append(b''.join(sorted(chunk)))
+        self.buffer = chunks[0] if len(chunks) == 1 else _merge(chunks)
+        self.others = sorted(others)
+
+    @classmethod
+    def from_parts(cls, buffer: bytes, others: list):
+        """Create the set from a sorted buffer and a sorted list of other names."""
+        ids = cls()
+        ids.buffer = buffer
+        ids.others = others
+        return ids
+
+    def __len__(self):
+        return len(self.buffer) // ID_SIZE + len(self.others)
+
+    def __str__(self):
+        return f'<IdSet size={len(self)} other={len(self.others)} bytes={len(self.buffer)}>'
+
+    def __contains__(self, name: str) -> bool:
+        if STANDARD_ID.fullmatch(name):
+            return self._find(bytes.fromhex(name)) is not None
+        i = bisect.bisect_left(self.others, name)
+        return i < len(self.others) and self.others[i] == name
+
+    def __iter__(self):
+        return heapq.merge(self._standard_names(), self.others)
+
+    def __getitem__(self, i: int) -> str:
+        """Return the name at position i, standard identifiers come first. This is
+        not the order of iteration, it is meant for picking names at random."""
+        standard = len(self.buffer) // ID_SIZE
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('IdSet index out of range')
+        if i < standard:
+            return self.buffer[i * ID_SIZE:(i + 1) * ID_SIZE].hex()
+        return self.others[i - standard]
+
+    def _find(self, record: bytes):
+        records = _Records(self.buffer)
+        i = bisect.bisect_left(records, record)
+        if i < len(records) and records[i] == record:
+            return i
+        return None
+
+    def _standard_names(self):
+        for record in _records(self.buffer):
+            yield record.hex()
+
+    def difference(self, other: 'IdSet') -> 'IdSet':
+        """Return the names in this set that are not in the other set. The buffers
+        are merged in one pass since both are sorted."""
+        records = bytearray()
+        buffer, other_buffer = self.buffer, other.buffer
+        j = 0
+        for i in range(0, len(buffer), ID_SIZE):
+            record = buffer[i:i + ID_SIZE]
+            while j < len(other_buffer) and other_buffer[j:j + ID_SIZE] < record:
+                j += ID_SIZE
+            if other_buffer[j:j + ID_SIZE] != record:
+                records += record
+        other_names = set(other.others)
+        others = [name for name in self.others if name not in other_names]
+        return IdSet.from_parts(bytes(records), others)
+
+    def sample(self, k: int, rng: random.Random = None) -> list:
+        """Return a list of k names picked at random without replacement, or all
+        names in random order if the set does not have more than k names."""
+        rng = random if rng is None else rng
+        return [self[i] for i in rng.sample(range(len(self)), min(k, len(self)))]
+
+
+def _records(buffer: bytes):
+    for i in range(0, len(buffer), ID_SIZE):
+        yield buffer[i:i + ID_SIZE]
+
+
+def _merge(chunks: list) -> bytes:
+    """Merge sorted buffers into one sorted buffer without duplicates."""
+    merged = bytearray()
+    previous = None
+    for record in heapq.merge(*[_records(chunk) for chunk in chunks]):
+        if record != previous:
+            merged += record
+            previous = record
+    return bytes(merged)
@@ -0,0 +1,189 @@
+"""Taking a few fields from a large json document
+
+ScienceParse files are mostly sections and references, while some consumers only
+need the title and the abstract. Instead of decoding the whole file, this walks
+the members of the objects on the path to the fields and only decodes the values
+that are asked for, with json.JSONDecoder.raw_decode(), which stops at the end of
+the value. Strings that are not asked for are skipped by searching for the
+closing quote, without building them.
+
+For an array of objects the lengths of one string member of each object can be
+asked for instead of the array itself, which is enough to get the number and the
+average length of the ScienceParse sections without building their text.
+
+If the document is not what the walker expects, the whole document is decoded
+after all. The fields are the same as with json.loads(), also when a key is
+there more than once, and a document that is not valid JSON raises the same
+json.JSONDecodeError.
+
+Usage:
+
+    fields = extract(scpa_text, ['metadata'], ['title', 'abstractText'],
+                     lengths={'sections': 'text'})
+
+"""
+
+import re, json
+
+
+_DECODER = json.JSONDecoder()
+
+_WHITESPACE = re.compile(r'\s*')
+_KEY = re.compile(r'\s*"([^"\\]*(?:\\.[^"\\]*)*)"\s*:\s*', re.DOTALL)
+
+
+class FieldError(Exception):
+    pass
+
+
+def extract(text: str, path: list, keys: list, lengths: dict = None) -> dict:
+    """Return a dictionary with the values of the keys in the object that is found
+    by following the path of keys from the top-level object. The lengths map keys
+    of arrays of objects to a member of those objects, for those keys the value is
+    the list of the lengths of that member. Keys that are not there get None."""
+    lengths = {} if lengths is None else lengths
+    fields = {key: None for key in list(keys) + list(lengths)}
+    if not text:
+        return fields
+    try:
+        def decode(key, value):
+            if key in lengths:
+                fields[key], end = _member_lengths(text, value, lengths[key])
+                return end
+            if key in fields:
+                fields[key], end = _DECODER.raw_decode(text, value)
+                return end
+            return _skip(text, value)
+
+        def follow(steps, position):
+            """Walk the object at the position and return the position after it.
+            The members on the path are walked instead of skipped. As with
+            json.loads() the last member wins if a key is there more than once,
+            so the fields are reset when a member on the path is found again."""
+            if not steps:
+                return _walk(text, position, decode)
+
+            def member(key, value):
+                if key != steps[0]:
+                    return _skip(text, value)
+                fields.update(dict.fromkeys(fields))
+                return follow(steps[1:], value)
+
+            return _walk(text, position, member)
+
+        end = follow(list(path), 0)
+        if _WHITESPACE.match(text, end).end() != len(text):
+            raise FieldError(f'extra data at position {end}')
+        return fields
+    except (FieldError, json.JSONDecodeError):
+        return _extract_from_json(text, path, keys, lengths)
+
+
+def _walk(text: str, position: int, handle) -> int:
+    """Call handle with the key and the position of the value for each member of
+    the object that starts at the position. The handler returns the position after
+    the value. Returns the position after the object."""
+    position = _WHITESPACE.match(text, position).end()
+    if text[position:position + 1] != '{':
+        raise FieldError(f'no object at position {position}')
+    position = _WHITESPACE.match(text, position + 1).end()
+    if text[position:position + 1] == '}':
+        return position + 1
+    while True:
+        match = _KEY.match(text, position)
+        if match is None:
+            raise FieldError(f'no key at position {position}')
+        key = match.group(1)
+        if '\\' in key:
+            # keys with escapes are rare enough to decode them properly
+            key = json.loads(f'"{key}"')
+        position = _WHITESPACE.match(text, handle(key, match.end())).end()
+        char = text[position:position + 1]
+        if char == '}':
+            return position + 1
+        if char != ',':
+            raise FieldError(f'no comma at position {position}')
+        position += 1
+
+
+def _member_lengths(text: str, position: int, wanted: str) -> tuple:
+    """Return the lengths of the wanted string member of the objects in the array
+    at the position, and the position after the array."""
+    if text.startswith('null', position):
+        return None, position + 4
+    if text[position:position + 1] != '[':
+        raise FieldError(f'no array at position {position}')
+    result = []
+    position = _WHITESPACE.match(text, position + 1).end()
+    if text[position:position + 1] == ']':
+        return result, position + 1
+    while True:
+        lengths = []
+
+        def measure(key, value):
+            end = _skip(text, value)
+            if key == wanted:
+                lengths.append(_string_length(text, value, end))
+            return end
+
+        position = _WHITESPACE.match(text, _walk(text, position, measure)).end()
+        result.append(lengths[-1] if lengths else None)
+        char = text[position:position + 1]
+        if char == ']':
+            return result, position + 1
+        if char != ',':
+            raise FieldError(f'no comma at position {position}')
+        position = _WHITESPACE.match(text, position + 1).end()
+
+
+def _string_length(text: str, start: int, end: int):
+    """Return the length of the string value from start to end, or None if the
+    value is not a string. Escapes other than \\u escapes are two characters that
+    stand for one, and in a run of backslashes every pair is one escape, so the
+    length can be calculated by counting. Strings with \\u escapes are decoded."""
+    if text[start] != '"':
+        return None
+    backslashes = text.count('\\', start, end)
+    if backslashes == 0:
+        return end - start - 2
+    if text.find('\\u', start, end) >= 0:
+        return len(_DECODER.raw_decode(text, start)[0])
+    escapes = backslashes - text.count('\\\\', start, end)
+    return end - start - 2 - escapes
+
+
+def _skip(text: str, position: int) -> int:
+    """Return the position after the value that starts at the position. Strings
+    are skipped by looking for the closing quote with str.find(), which is much
+    faster than a regular expression. Other values are decoded and dropped, which
+    for arrays and objects is faster than matching the brackets in Python."""
+    if text[position:position + 1] == '"':
+        end = position
+        while True:
+            end = text.find('"', end + 1)
+            if end < 0:
+                raise FieldError(f'unterminated string at position {position}')
+            # the quote is escaped if it follows an odd number of backslashes
+            backslashes = end - 1
+            while text[backslashes] == '\\':
+                backslashes -= 1
+            if (end - 1 - backslashes) % 2 == 0:
+                return end + 1
+    return _DECODER.raw_decode(text, position)[1]
+
+
+def _extract_from_json(text: str, path: list, keys: list, lengths: dict) -> dict:
+    value = json.loads(text)
+    for step in path:
+        value = value.get(step) if isinstance(value, dict) else None
+    if not isinstance(value, dict):
+        value = {}
+    fields = {key: value.get(key) for key in keys}
+    for key, member in lengths.items():
+        items = value.get(key)
+        # the walker falls back to this for values that are not arrays of objects
+        fields[key] = None if not isinstance(items, list) else [
+            len(item[member]) if isinstance(item, dict) and isinstance(item.get(member), str)
+            else None
+            for item in items]
+    return fields
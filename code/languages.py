@@ -0,0 +1,68 @@
+"""Language scores for several languages in one pass
+
+The frequent word lists of all supported languages are merged into one table
+that maps a token to a bitmask with one bit for each language the token is a
+frequent word in. Scoring a Counter of tokens is then one pass over the tokens
+with one lookup per token, the counts are summed per bitmask and only at the end
+the few distinct bitmasks are spread out over the languages. This makes the cost
+of scoring about the same as for a single language.
+
+The score for a language is the same as what utils.language_score() returns for
+the frequent word list of that language.
+
+Usage:
+
+    table = LanguageTable({'en': english_words, 'de': german_words})
+    scores = table.scores(Counter(text.split()))
+    language, score = table.best(scores)
+
+"""
+
+from collections import Counter
+
+
+class LanguageTable:
+
+    def __init__(self, word_lists: dict):
+        """Initialize from a dictionary that maps language codes to collections
+        of frequent words for the language."""
+        self.languages = list(word_lists)
+        self.masks = {}
+        for i, language in enumerate(self.languages):
+            for word in word_lists[language]:
+                self.masks[word] = self.masks.get(word, 0) | (1 << i)
+        # for each bitmask that occurs, the indices of the languages in it
+        self.bits = {mask: [i for i in range(len(self.languages)) if mask & (1 << i)]
+                     for mask in set(self.masks.values())}
+
+    def __str__(self):
+        return f'<LanguageTable {" ".join(self.languages)} words={len(self.masks)}>'
+
+    def scores(self, tokens: Counter) -> dict:
+        """Return a dictionary with for each language the ratio of tokens that are
+        frequent words in that language."""
+        total_tokens = sum(tokens.values())
+        mask_counts = {}
+        masks = self.masks
+        # intersecting the key views is done in C and only loops over the smaller
+        # of the two, so the Python loop below only sees frequent words
+        for token in tokens.keys() & masks.keys():
+            mask = masks[token]
+            mask_counts[mask] = mask_counts.get(mask, 0) + tokens[token]
+        counts = [0] * len(self.languages)
+        for mask, count in mask_counts.items():
+            for i in self.bits[mask]:
+                counts[i] += count
+        if total_tokens == 0:
+            return {language: 0 for language in self.languages}
+        return {language: count / total_tokens
+                for language, count in zip(self.languages, counts)}
+
+    def best(self, scores: dict) -> tuple:
+        """Return the language with the highest score and the score, ties are
+        resolved in favour of the language that was listed first. Returns None
+        for the language if no language has a score above zero."""
+        language = max(self.languages, key=lambda lang: scores[lang])
+        if scores[language] <= 0:
+            return None, 0.0
+        return language, scores[language]
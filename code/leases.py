@@ -0,0 +1,268 @@
+"""Sharing the work on a topic between machines with lease files
+
+With static shards (see shards.py) a machine that gets the slow documents
+finishes long after the others. Here the machines take work as they go, with
+nothing but a directory that they can all write to:
+
+- The documents are split into batches of BATCH_SIZE names. The first process
+  writes the batches to plan.json in the work directory, the others use that
+  plan, so all processes agree on the batches even if the text directory
+  changes while they start.
+- A process claims a batch by creating leases/N.lease with O_CREAT | O_EXCL,
+  which succeeds for one process only. While it works on the batch, a thread
+  touches the lease file every timeout / HEARTBEATS seconds.
+- When a batch is done its marker done/N is written and the lease is removed.
+- A lease that was not touched for the timeout belonged to a process that died
+  or hangs. Another process reclaims it by renaming the lease file to a name of
+  its own and then claims the batch as usual. Two processes can both see the
+  expired lease, and the second one may rename the new lease of the first one,
+  so after the rename the process checks that it got the expired lease, with
+  the same owner, inode and modification time. If not, it puts the new lease
+  back and leaves the batch to the other process. Times are compared with the
+  modification time of a file that the process touches itself, so the clocks
+  of the machines do not need to agree.
+- Processes keep claiming batches until all of them are done, waiting for
+  leases to expire when all open batches are taken, so all processes finish at
+  about the same time.
+
+A process that lost its lease while it was still working, because it was too
+slow to heartbeat, gives a warning and finishes the batch anyway. Writing the
+same output twice is harmless, since it is the same output.
+
+Usage, on any number of machines:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --coordinate DIR4 --workers 8
+
+"""
+
+import os, json, time, socket, random, threading
+from ids import IdSet
+from watch import WatchedDocuments, TEXT_SUFFIX
+
+
+# Number of documents in a batch
+BATCH_SIZE = 100
+
+# Seconds after which a lease that was not touched expires
+LEASE_TIMEOUT = 300.0
+
+# Number of heartbeats in the lease timeout
+HEARTBEATS = 10
+
+# Seconds between looking for expired leases when all open batches are taken
+POLL_INTERVAL = 5.0
+
+PLAN_FILE = 'plan.json'
+
+
+class Lease:
+
+    """The lease of this process on a batch, with a thread that keeps it alive."""
+
+    def __init__(self, path: str, owner: str, interval: float):
+        self.path = path
+        self.owner = owner
+        self.interval = interval
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self.thread.start()
+
+    def _heartbeat(self):
+        while not self.stopped.wait(self.interval):
+            if not self.is_ours():
+                self.lost = True
+                print(f'WARNING: lost the lease {self.path}, finishing the batch anyway')
+                return
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                self.lost = True
+                print(f'WARNING: lost the lease {self.path}, finishing the batch anyway')
+                return
+
+    def is_ours(self) -> bool:
+        return lease_owner(self.path) == self.owner
+
+    def release(self):
+        self.stopped.set()
+        self.thread.join()
+        if not self.lost and self.is_ours():
+            os.remove(self.path)
+
+
+def lease_owner(path: str):
+    """Return the owner in the lease file, or None if it cannot be read, which
+    includes a lease file that is still being written."""
+    try:
+        with open(path) as fh:
+            return json.load(fh).get('owner')
+    except (OSError, ValueError):
+        return None
+
+
+class Coordinator:
+
+    def __init__(self, work_dir: str, batch_size: int = BATCH_SIZE,
+                 timeout: float = LEASE_TIMEOUT, poll_interval: float = POLL_INTERVAL):
+        self.work_dir = work_dir
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.owner = f'{socket.gethostname()}-{os.getpid()}'
+        self.lease_dir = os.path.join(work_dir, 'leases')
+        self.done_dir = os.path.join(work_dir, 'done')
+        self.clock_file = os.path.join(work_dir, 'clocks', self.owner)
+        for directory in (self.lease_dir, self.done_dir, os.path.dirname(self.clock_file)):
+            os.makedirs(directory, exist_ok=True)
+        self.batches = None
+        self.claimed = 0
+        self.reclaimed = 0
+
+    def __str__(self):
+        return (f'<Coordinator {self.owner} batches={len(self.batches or [])}'
+                f' claimed={self.claimed} reclaimed={self.reclaimed}>')
+
+    def plan(self, names) -> list:
+        """Return the batches, which are taken from the plan file if there is one,
+        otherwise the plan file is created from the sorted names."""
+        path = os.path.join(self.work_dir, PLAN_FILE)
+        if not os.path.exists(path):
+            names = list(names)
+            batches = [names[i:i + self.batch_size]
+                       for i in range(0, len(names), self.batch_size)]
+            temporary = f'{path}.{self.owner}'
+            with open(temporary, 'w') as fh:
+                json.dump({'batch_size': self.batch_size, 'batches': batches}, fh)
+            try:
+                # unlike a rename, a link fails if another process was first
+                os.link(temporary, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temporary)
+        with open(path) as fh:
+            self.batches = json.load(fh)['batches']
+        return self.batches
+
+    def now(self) -> float:
+        """Return the time on the clock of the file system."""
+        with open(self.clock_file, 'a'):
+            pass
+        os.utime(self.clock_file)
+        return os.stat(self.clock_file).st_mtime
+
+    def lease_file(self, batch: int) -> str:
+        return os.path.join(self.lease_dir, f'{batch}.lease')
+
+    def done(self) -> set:
+        return {int(name) for name in os.listdir(self.done_dir) if name.isdigit()}
+
+    def claim(self, batch: int):
+        """Return a Lease on the batch, or None if another process has one."""
+        path = self.lease_file(batch)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as fh:
+            json.dump({'owner': self.owner, 'batch': batch, 'claimed': time.time()}, fh)
+        self.claimed += 1
+        return Lease(path, self.owner, self.timeout / HEARTBEATS)
+
+    def reclaim(self, batch: int, now: float):
+        """Return a Lease on the batch if the lease of another process expired."""
+        path = self.lease_file(batch)
+        try:
+            stale = os.stat(path)
+            if now - stale.st_mtime < self.timeout:
+                return None
+            owner = lease_owner(path)
+            expired = f'{path}.expired-{self.owner}'
+            os.rename(path, expired)
+        except FileNotFoundError:
+            # released or reclaimed by another process in the meantime
+            return None
+        renamed = os.stat(expired)
+        if ((renamed.st_ino, renamed.st_mtime) != (stale.st_ino, stale.st_mtime)
+                or lease_owner(expired) != owner):
+            # another process reclaimed the batch after the stat and this is its
+            # new lease, a link does not replace a lease that was created since
+            try:
+                os.link(expired, path)
+            except FileExistsError:
+                pass
+            os.remove(expired)
+            return None
+        os.remove(expired)
+        self.reclaimed += 1
+        print(f'>>> Reclaimed expired batch {batch}')
+        return self.claim(batch)
+
+    def mark_done(self, batch: int, count: int):
+        path = os.path.join(self.done_dir, str(batch))
+        with open(f'{path}.{self.owner}', 'w') as fh:
+            json.dump({'owner': self.owner, 'documents': count, 'finished': time.time()}, fh)
+        os.replace(f'{path}.{self.owner}', path)
+
+    def claimed_batches(self):
+        """Generate pairs of a batch number and a Lease until all batches are done.
+        The caller processes the batch, calls mark_done() and releases the lease."""
+        # start at a different batch in each process so they do not all compete
+        # for the same leases
+        count = len(self.batches)
+        offset = random.randrange(count) if count else 0
+        order = [(offset + i) % count for i in range(count)]
+        while True:
+            done = self.done()
+            open_batches = [batch for batch in order if batch not in done]
+            if not open_batches:
+                return
+            now = self.now()
+            found = False
+            for batch in open_batches:
+                lease = self.claim(batch) or self.reclaim(batch, now)
+                if lease is None:
+                    continue
+                if os.path.exists(os.path.join(self.done_dir, str(batch))):
+                    # finished by its owner after we listed the done batches
+                    lease.release()
+                    continue
+                found = True
+                yield batch, lease
+            if not found:
+                time.sleep(self.poll_interval)
+
+
+def run(scpa_dir: str, text_dir: str, out_dir: str, work_dir: str,
+        batch_size: int = BATCH_SIZE, timeout: float = LEASE_TIMEOUT, **options):
+    """Process the batches that this process can claim and write their output,
+    the options are handed to Documents."""
+    coordinator = Coordinator(work_dir, batch_size, timeout)
+    names = IdSet(name[:-len(TEXT_SUFFIX)] for name in os.listdir(text_dir)
+                  if name.endswith(TEXT_SUFFIX))
+    coordinator.plan(names)
+    print(f'>>> {coordinator.owner}: {len(coordinator.batches):,} batches in {work_dir}')
+    os.makedirs(out_dir, exist_ok=True)
+    docs = WatchedDocuments(scpa_dir, text_dir, out_dir, **options)
+    documents = 0
+    try:
+        for batch, lease in coordinator.claimed_batches():
+            docs.names = coordinator.batches[batch]
+            count = 0
+            try:
+                for name, result in docs.results():
+                    if result is not None:
+                        docs.write_result(name, result)
+                    count += 1
+                if docs.writer is not None:
+                    # the batch is only done when its output is on disk
+                    docs.writer.flush()
+                coordinator.mark_done(batch, count)
+            finally:
+                lease.release()
+            documents += count
+    finally:
+        docs.shutdown()
+    print(f'>>> {coordinator}: processed {documents:,} documents')
+    docs.report()
@@ -0,0 +1,218 @@
+"""Building a list of frequent words from a corpus
+
+The frequent word list in frequencies.py was taken from Project Gutenberg, which
+is mostly 19th century fiction, so it has words like "thou" and "thy" and misses
+words that are frequent in scientific prose. This module builds a frequent word
+list, a lexicon, from the text files of an xDD drop.
+
+Counting is done in bounded memory, whatever the size of the corpus:
+
+- Each worker counts the tokens of a batch of documents exactly, and when the
+  batch has FLUSH_SIZE distinct tokens it is added to a count-min sketch, which
+  is a fixed table of DEPTH rows of WIDTH counters. A token is hashed to one
+  counter in each row and its estimated count is the minimum over the rows, which
+  is never too low and is only too high by a small fraction of the total count.
+- Next to the sketch each worker keeps the tokens with the highest estimated
+  counts, the heavy hitters, at most CANDIDATES of them.
+- The sketches of the workers are added up, since the hashing is the same in
+  each process, and the candidates of all workers are estimated with the merged
+  sketch to pick the words for the lexicon.
+
+Tokens are taken the way the scorer takes them, by splitting on whitespace, and
+only lower-case alphabetic tokens are kept.
+
+The lexicon is written in the same format as frequencies.FREQUENCIES, a rank, a
+word and a count separated by tabs, with comment lines starting with '#'. Use
+parse.py --lexicon FILE to score with it instead of the built-in list.
+
+Usage:
+
+$ python3 lexicon.py --text DIR --out FILE --size 500 --workers 8
+
+DIR is a directory with text files or an archive, archives are read by one worker.
+
+"""
+
+import os, zlib, heapq, argparse
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import archive
+import utils
+
+
+# Number of counters in each row of the sketch and the number of rows
+WIDTH = 2 ** 18
+DEPTH = 4
+
+# Number of distinct tokens counted exactly before they are added to the sketch
+FLUSH_SIZE = 200000
+
+# Number of heavy hitters kept by each worker
+CANDIDATES = 20000
+
+# Default number of words in the lexicon
+LEXICON_SIZE = 500
+
+
+class CountMinSketch:
+
+    def __init__(self, width: int = WIDTH, depth: int = DEPTH):
+        self.width = width
+        self.depth = depth
+        self.table = array('Q', bytes(8 * width * depth))
+        self.total = 0
+
+    def __str__(self):
+        return f'<CountMinSketch width={self.width} depth={self.depth} total={self.total}>'
+
+    def positions(self, token: str) -> list:
+        """Return the index of the counter for the token in each row. The two
+        hashes are CRC32 checksums with different start values, which are the same
+        in every process, unlike the built-in hash of strings."""
+        data = token.encode('utf-8')
+        h1 = zlib.crc32(data)
+        h2 = zlib.crc32(data, 0x9e3779b9) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def add(self, token: str, count: int = 1):
+        table = self.table
+        for position in self.positions(token):
+            table[position] += count
+        self.total += count
+
+    def estimate(self, token: str) -> int:
+        table = self.table
+        return min(table[position] for position in self.positions(token))
+
+    def merge(self, other: 'CountMinSketch'):
+        """Add the counts of a sketch with the same width and depth."""
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError('cannot merge sketches of different sizes')
+        self.table = array('Q', map(sum, zip(self.table, other.table)))
+        self.total += other.total
+
+
+class TokenCounter:
+
+    """Counting tokens with a count-min sketch and a set of heavy hitters."""
+
+    def __init__(self, width: int = WIDTH, depth: int = DEPTH,
+                 flush_size: int = FLUSH_SIZE, candidates: int = CANDIDATES):
+        self.sketch = CountMinSketch(width, depth)
+        self.flush_size = flush_size
+        self.max_candidates = candidates
+        self.batch = Counter()
+        self.candidates = {}
+        self.documents = 0
+
+    def __str__(self):
+        return (f'<TokenCounter documents={self.documents} tokens={self.sketch.total}'
+                f' candidates={len(self.candidates)}>')
+
+    def add_document(self, content: str):
+        # counting all tokens is done in C, they are filtered when flushing
+        self.batch.update(Counter(content.split()))
+        self.documents += 1
+        if len(self.batch) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """Add the batch to the sketch and keep the tokens with the highest
+        estimated counts as candidates."""
+        words = [token for token in self.batch if token.isalpha() and token.islower()]
+        for token in words:
+            self.sketch.add(token, self.batch[token])
+        tokens = set(self.candidates).union(words)
+        self.batch = Counter()
+        estimates = ((self.sketch.estimate(token), token) for token in tokens)
+        self.candidates = {token: count for count, token
+                           in heapq.nlargest(self.max_candidates, estimates)}
+
+    def merge(self, other: 'TokenCounter'):
+        self.flush()
+        other.flush()
+        self.sketch.merge(other.sketch)
+        self.documents += other.documents
+        tokens = set(self.candidates) | set(other.candidates)
+        self.candidates = {token: self.sketch.estimate(token) for token in tokens}
+
+    def most_common(self, n: int) -> list:
+        """Return the n tokens with the highest estimated counts, as pairs of a
+        token and a count, ties are broken on the token."""
+        self.flush()
+        return heapq.nsmallest(n, self.candidates.items(), key=lambda item: (-item[1], item[0]))
+
+    def save(self, path: str, n: int = LEXICON_SIZE):
+        error = self.sketch.total * 2.72 / self.sketch.width
+        with open(path, 'w') as fh:
+            fh.write(f'# documents\t{self.documents}\n')
+            fh.write(f'# tokens\t{self.sketch.total}\n')
+            fh.write(f'# error\t{int(error)}\n')
+            for rank, (token, count) in enumerate(self.most_common(n), start=1):
+                fh.write(f'{rank}\t{token}\t{count}\n')
+
+
+def load(path: str) -> set:
+    """Return the words of a lexicon file, or of any file in the format of
+    frequencies.FREQUENCIES."""
+    with open(path) as fh:
+        return set(line.split()[1] for line in fh
+                   if line.strip() and not line.startswith('#'))
+
+
+def count_files(paths: list) -> TokenCounter:
+    """Count the tokens in the text files, this runs in a worker process."""
+    counter = TokenCounter()
+    for path in paths:
+        with open(path, 'rb') as fh:
+            counter.add_document(utils.decode_text(fh.read()))
+    counter.flush()
+    return counter
+
+
+def count_archive(path: str) -> TokenCounter:
+    counter = TokenCounter()
+    for _, text, _ in archive.documents(path):
+        counter.add_document(utils.decode_text(text))
+    counter.flush()
+    return counter
+
+
+def build(path: str, workers: int = 1) -> TokenCounter:
+    """Count the tokens in a text directory or an archive, with the files of a
+    directory spread over the workers."""
+    if archive.is_archive(path):
+        return count_archive(path)
+    paths = [os.path.join(path, fname)
+             for fname in sorted(os.listdir(path)) if fname.endswith('.txt')]
+    if workers <= 1:
+        return count_files(paths)
+    shards = [paths[i::workers] for i in range(workers)]
+    with ProcessPoolExecutor(workers) as executor:
+        counters = list(executor.map(count_files, shards))
+    counter = counters[0]
+    for other in counters[1:]:
+        counter.merge(other)
+    return counter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build a lexicon of frequent words')
+    parser.add_argument('--text', help="text directory or archive")
+    parser.add_argument('--out', help="lexicon file")
+    parser.add_argument('--size', help="number of words in the lexicon",
+                        type=int, default=LEXICON_SIZE)
+    parser.add_argument('--workers', help="number of worker processes",
+                        type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    counter = build(args.text, args.workers)
+    counter.save(args.out, args.size)
+    print(f'>>> Counted {counter.sketch.total:,} tokens in {counter.documents:,} documents')
+    print(f'>>> Lexicon with {args.size} words written to {args.out}')
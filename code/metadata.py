@@ -0,0 +1,251 @@
+"""Index on the xDD metadata file
+
+An xDD drop comes with a metadata.json file, which is one json list with a
+record for each document, identified by its "_gddid". For big topics this file
+is hundreds of megabytes, too much to load just to look up a few records. The
+MetadataIndex reads the file once as a stream and stores the byte offset and the
+length of each record, after that a record is taken from the file with one seek
+and one read.
+
+- The file is read in chunks of CHUNK_SIZE bytes and each record is decoded by
+  itself, so reading needs memory for one chunk and one record.
+- The index is written next to the metadata file, as metadata.json.index, and
+  is used again by later runs as long as the size and the modification time of
+  the metadata file did not change. If the index cannot be written it is kept
+  in memory.
+- The index has 24 bytes for each record: the 12 bytes of the identifier, the
+  offset and the length, sorted on the identifier, so a lookup is a binary
+  search, like for ids.IdSet. Records without a standard identifier are left
+  out, for duplicate identifiers the first record is used.
+
+Usage:
+
+    index = MetadataIndex('metadata.json')
+    record = index.get('5c02a2371faed6554886c814')
+    fields = index.fields('5c02a2371faed6554886c814')
+
+$ python3 metadata.py FILE
+
+Builds the index for a metadata file, if needed, and prints its statistics.
+
+"""
+
+import os, re, sys, json, time, codecs, struct, bisect
+from ids import STANDARD_ID, ID_SIZE
+
+
+# Number of bytes read from the metadata file at once
+CHUNK_SIZE = 1024 ** 2
+
+# Extension of the index file
+INDEX_EXTENSION = '.index'
+
+# Increment this when the format of the index file changes
+INDEX_VERSION = 1
+
+# An entry in the index: identifier, offset and length
+ENTRY = struct.Struct(f'>{ID_SIZE}sQI')
+
+_DECODER = json.JSONDecoder()
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def records(path: str, chunk_size: int = CHUNK_SIZE):
+    """Generate triples <record, offset, length> for the records in the json list
+    in the file, where the offset and the length are in bytes."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(path, 'rb') as fh:
+        text = ''
+        # byte offset of the start of the text
+        offset = 0
+        started = False
+        while True:
+            chunk = fh.read(chunk_size)
+            text += decoder.decode(chunk, final=not chunk)
+            position = 0
+            # the text up to here is counted in the offset
+            counted = 0
+            while True:
+                position = _WHITESPACE.match(text, position).end()
+                if position == len(text):
+                    break
+                char = text[position]
+                if not started:
+                    if char != '[':
+                        raise ValueError(f'{path} is not a json list')
+                    started = True
+                elif char == ']':
+                    return
+                elif char != ',':
+                    try:
+                        record, end = _DECODER.raw_decode(text, position)
+                    except json.JSONDecodeError:
+                        if not chunk:
+                            raise
+                        # the record continues in the next chunk
+                        break
+                    if not isinstance(record, dict):
+                        raise ValueError(f'{path} has a record that is not an object')
+                    offset += _size(text, counted, position)
+                    length = _size(text, position, end)
+                    yield record, offset, length
+                    offset += length
+                    counted = position = end
+                    continue
+                position += 1
+            if not chunk:
+                raise ValueError(f'{path} ends before the end of the list')
+            offset += _size(text, counted, position)
+            text = text[position:]
+
+
+def _size(text: str, start: int, end: int) -> int:
+    """Return the number of bytes of the text between the offsets."""
+    return len(text[start:end].encode('utf-8'))
+
+
+class MetadataIndex:
+
+    def __init__(self, path: str, index_path: str = None):
+        """Open the index for the metadata file, the index is created if there is
+        none or if it is out of date."""
+        self.path = path
+        self.index_path = path + INDEX_EXTENSION if index_path is None else index_path
+        self.skipped = 0
+        self.lookups = 0
+        self.found = 0
+        self.entries = self.load()
+        if self.entries is None:
+            self.entries = self.build()
+        self.fh = open(path, 'rb')
+
+    def __str__(self):
+        return f'<MetadataIndex {self.path} records={len(self)}>'
+
+    def __len__(self):
+        return len(self.entries) // ENTRY.size
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) is not None
+
+    def signature(self) -> dict:
+        stat = os.stat(self.path)
+        return {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    def load(self):
+        """Return the entries from the index file, or None if there is no index
+        file for the current version of the metadata file."""
+        try:
+            with open(self.index_path, 'rb') as fh:
+                header = json.loads(fh.readline())
+                entries = fh.read()
+        except (OSError, ValueError):
+            return None
+        if header != self.signature() or len(entries) % ENTRY.size:
+            return None
+        return entries
+
+    def build(self) -> bytes:
+        """Read the metadata file, save the index and return its entries."""
+        start = time.perf_counter()
+        signature = self.signature()
+        entries = []
+        for record, offset, length in records(self.path):
+            name = record.get('_gddid')
+            if isinstance(name, str) and STANDARD_ID.fullmatch(name):
+                entries.append(ENTRY.pack(bytes.fromhex(name), offset, length))
+            else:
+                self.skipped += 1
+        # the sort is stable, so the first record comes first for duplicates
+        entries.sort(key=lambda entry: entry[:ID_SIZE])
+        entries = b''.join(entries)
+        print(f'>>> Indexed {len(entries) // ENTRY.size:,} metadata records'
+              f' in {time.perf_counter() - start:.2f}s')
+        if self.skipped:
+            print(f'WARNING: {self.skipped} metadata records without a standard _gddid')
+        try:
+            with open(self.index_path, 'wb') as fh:
+                fh.write(json.dumps(signature).encode('utf-8') + b'\n')
+                fh.write(entries)
+        except OSError as e:
+            print(f'WARNING: could not save the metadata index ({e})')
+        return entries
+
+    def _entry(self, i: int) -> bytes:
+        return self.entries[i * ENTRY.size:(i + 1) * ENTRY.size]
+
+    def _find(self, name: str):
+        """Return the offset and the length of the record for the name, or None if
+        there is no record."""
+        if not STANDARD_ID.fullmatch(name):
+            return None
+        key = bytes.fromhex(name)
+        keys = _Keys(self)
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return ENTRY.unpack(self._entry(i))[1:]
+        return None
+
+    def get(self, name: str):
+        """Return the metadata record for the name, or None if there is none."""
+        self.lookups += 1
+        found = self._find(name)
+        if found is None:
+            return None
+        self.found += 1
+        offset, length = found
+        self.fh.seek(offset)
+        return json.loads(self.fh.read(length))
+
+    def select(self, names) -> list:
+        """Return the records for those names that have one, in the order of the
+        metadata file."""
+        found = sorted(filter(None, (self._find(name) for name in names)))
+        records = []
+        for offset, length in found:
+            self.fh.seek(offset)
+            records.append(json.loads(self.fh.read(length)))
+        return records
+
+    def fields(self, name: str):
+        """Return the DOI, the journal and the year from the record for the name,
+        or None if there is no record."""
+        record = self.get(name)
+        if record is None:
+            return None
+        journal = record.get('journal')
+        if isinstance(journal, dict):
+            journal = journal.get('name')
+        doi = None
+        for identifier in record.get('identifier') or []:
+            if isinstance(identifier, dict) and identifier.get('type') == 'doi':
+                doi = identifier.get('id')
+                break
+        return {'doi': doi, 'journal': journal, 'year': record.get('year')}
+
+    def report(self) -> str:
+        return f'metadata lookups={self.lookups} found={self.found} records={len(self)}'
+
+    def close(self):
+        self.fh.close()
+
+
+class _Keys:
+
+    """Sequence view of the identifiers in the index entries, for bisect."""
+
+    def __init__(self, index: MetadataIndex):
+        self.entries = index.entries
+
+    def __len__(self):
+        return len(self.entries) // ENTRY.size
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.entries[i * ENTRY.size:i * ENTRY.size + ID_SIZE]
+
+
+if __name__ == '__main__':
+
+    index = MetadataIndex(sys.argv[1])
+    print(f'>>> {index}, index in {index.index_path}')
@@ -0,0 +1,165 @@
+"""Finding and profiling the slowest documents of a run
+
+The total runtime of a run often comes from a handful of documents, which the
+throughput numbers do not show. SlowDocuments is handed to Documents and is told
+the parse time of each document that was parsed, it keeps the K slowest of them
+in a heap together with their size, the number of paragraphs in the text and the
+number of ScienceParse sections.
+
+At the end of the run some documents are parsed again under cProfile and their
+stats are written to NAME.pstats files in the profile directory:
+
+- documents that took longer than the threshold, slowest first
+- a fraction of all parsed documents, picked with a hash of the name so that the
+  same documents are picked in every run
+
+No more than MAX_PROFILES documents are profiled. Parsing again is done in the
+main process, so profiling does not slow down the run itself, and it is not
+done for archives since those cannot be read again. A summary with the slowest
+documents and the profiles is printed and written to slowest.txt in the profile
+directory. Profiles can be inspected with:
+
+$ python3 -m pstats DIR/NAME.pstats
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --slowest 20
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --slowest 20 --profile-dir DIR4 \
+    --profile-threshold 5 --profile-sample 0.001
+
+"""
+
+import os, time, heapq, cProfile
+import utils
+import document
+
+
+# Default number of slowest documents that are kept
+TOP_K = 20
+
+# Maximum number of documents that are profiled
+MAX_PROFILES = 20
+
+# Name of the summary file in the profile directory
+SUMMARY_FILE = 'slowest.txt'
+
+
+class SlowDocuments:
+
+    def __init__(self, k: int = TOP_K, profile_dir: str = None, threshold: float = None,
+                 sample: float = 0.0, max_profiles: int = MAX_PROFILES):
+        """Keep the k slowest documents. If there is a profile directory, the
+        documents over the threshold (in seconds) and a sample of the documents,
+        with sample the fraction of documents, are profiled."""
+        self.k = k
+        self.profile_dir = profile_dir
+        self.threshold = threshold
+        self.sample = sample
+        self.max_profiles = max_profiles
+        # min-heap of <seconds, name, info> with the fastest of the slowest on top
+        self.heap = []
+        # the slowest documents over the threshold and the first sampled documents,
+        # as pairs <seconds, name>, there are never more than needed for profiling
+        self.over_threshold = []
+        self.sampled = []
+        self.profiles = {}
+        self.documents = 0
+        self.total_seconds = 0.0
+
+    def __str__(self):
+        return f'<SlowDocuments k={self.k} documents={self.documents}>'
+
+    def add(self, name: str, seconds: float, size: int, paragraphs: int, sections: int):
+        self.documents += 1
+        self.total_seconds += seconds
+        info = {'size': size, 'paragraphs': paragraphs, 'sections': sections}
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (seconds, name, info))
+        elif seconds > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (seconds, name, info))
+        if self.threshold is not None and seconds > self.threshold:
+            if len(self.over_threshold) < self.max_profiles:
+                heapq.heappush(self.over_threshold, (seconds, name))
+            elif seconds > self.over_threshold[0][0]:
+                heapq.heapreplace(self.over_threshold, (seconds, name))
+        if len(self.sampled) < self.max_profiles and self.is_sampled(name):
+            self.sampled.append((seconds, name))
+
+    def is_sampled(self, name: str) -> bool:
+        if self.sample <= 0:
+            return False
+        return utils.stable_hash(name.encode('utf-8')) % 1000000 < self.sample * 1000000
+
+    def slowest(self) -> list:
+        """Return the kept documents as triples <seconds, name, info>, slowest first."""
+        return sorted(self.heap, key=lambda item: (-item[0], item[1]))
+
+    def to_profile(self) -> list:
+        """Return the names of the documents to profile, the ones over the threshold
+        first, slowest first."""
+        names = [name for _, name in sorted(self.over_threshold, reverse=True)]
+        names.extend(name for _, name in sorted(self.sampled, reverse=True))
+        return list(dict.fromkeys(names))[:self.max_profiles]
+
+    def profile(self, docs: document.Documents):
+        """Parse the selected documents again under cProfile and write their stats."""
+        names = self.to_profile()
+        if not names:
+            return
+        if isinstance(docs, document.ArchiveDocuments):
+            print('WARNING: documents in an archive are not profiled')
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        options = (docs.boilerplate, docs.trim_lines, docs.abstract_only, docs.encoding_errors)
+        for name in names:
+            _, text, scpa = docs.source(name)
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            document.process_source(name, docs.content(text), scpa, *options)
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            # names of documents in topics have the number of the topic as a
+            # directory, see topics.py
+            path = os.path.join(self.profile_dir, f'{name}.pstats')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            profiler.dump_stats(path)
+            self.profiles[name] = (seconds, path)
+
+    def relative(self, path: str) -> str:
+        return os.path.relpath(path, self.profile_dir)
+
+    def summary(self) -> str:
+        lines = [f'{self.documents:,} documents parsed in {self.total_seconds:.2f}s']
+        slowest = self.slowest()
+        slow_seconds = sum(seconds for seconds, _, _ in slowest)
+        if self.total_seconds > 0:
+            lines.append(f'the {len(slowest)} slowest took {slow_seconds:.2f}s'
+                         f' ({slow_seconds / self.total_seconds:.1%})')
+        lines.append(f'{"seconds":>9}  {"name":24}  {"size":>10}  {"paragraphs":>10}'
+                     f'  {"sections":>8}  profile')
+        for seconds, name, info in slowest:
+            profile = self.profiles.get(name)
+            lines.append(f'{seconds:9.3f}  {name:24}  {info["size"]:10,}'
+                         f'  {info["paragraphs"]:10,}  {info["sections"]:8,}'
+                         f'  {"" if profile is None else self.relative(profile[1])}')
+        slowest_names = {name for _, name, _ in slowest}
+        others = [name for name in self.profiles if name not in slowest_names]
+        if others:
+            lines.append('other profiled documents, with the time under the profiler:')
+        for name in others:
+            seconds, path = self.profiles[name]
+            lines.append(f'{seconds:9.3f}  {name:24}  {self.relative(path)}')
+        return '\n'.join(lines)
+
+    def finish(self, docs: document.Documents):
+        """Profile the selected documents and print and save the summary."""
+        if self.profile_dir is not None:
+            self.profile(docs)
+        summary = self.summary()
+        for line in summary.split('\n'):
+            print(f'>>> {line}')
+        if self.profile_dir is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            with open(os.path.join(self.profile_dir, SUMMARY_FILE), 'w') as fh:
+                fh.write(summary + '\n')
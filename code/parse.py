@@ -12,11 +12,55 @@ $ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --limit N
 Process a maximum on N documents from the ScienceParse (DIR1) and text (DIR2) directories
 and write output to DIR3.
 
+$ python3 parse.py --archive FILE --out DIR3 --limit N
+
+Like the above, but the ScienceParse and text files are read from a tar or zip archive
+without extracting it first, see archive.py for the expected archive layout.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --workers 8 --cache FILE --verify
+
+Do not write output, but check that the results with the given options are the same as
+the results of the plain sequential parser, see verify.py.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --plan --workers 8
+
+Do not write output, but estimate the runtime, the output size, the memory use and the
+modes from a sample of the documents, see plan.py.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --watch
+
+Keep polling DIR1 and DIR2 and process documents as they arrive, see watch.py.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --shard 0/4 --bundle
+
+Only process the documents of shard 0 out of 4 and write their output to one file with
+a manifest, run "python3 shards.py merge DIR3" when all shards are done, see shards.py.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --writer-queue 64
+
+Write the output in a background thread so that parsing does not wait for slow storage,
+see writer.py.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --coordinate DIR4
+
+Take batches of documents until all are done, together with other processes that use the
+same directory DIR4 on the same or other machines, see leases.py.
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --ndjson - --ids -
+
+Read the names of documents from standard input and write the results to standard output
+as NDJSON, one line per document, see stream.py.
+
+$ python3 parse.py --topics FILE --workers 16 --cache FILE
+
+Parse all topics in the manifest FILE, which has a line with the ScienceParse, text and
+output directories of each topic, with one pool of workers and one cache, see topics.py.
+
 Usage in demo mode:
 
 $ python3 parse.py --list ../lists/FILENAME
 
-FILENAME is a file created by the select.py script, it contains the locations of the
+FILENAME is a file created by the selection.py script, it contains the locations of the
 raw text and ScienceParse directories and a list of filenames. All locations in the
 list are used asinput. Output is written to directories in ../out, with the directory
 name taken from the file list.
@@ -42,7 +86,6 @@ Does not do stand-off annotation of the text.
 
 """
 
-# TODO: maybe add pargraphs line-by-line and filter for language score
 # TODO: for the singletons, it often happens with ScienceParse that highlighted
 #       text has spaces added (for example: "i n t r o d u c t i o n"), may want
 #       to find a way to undo this
@@ -50,7 +93,22 @@ Does not do stand-off annotation of the text.
 
 import os, sys, argparse
 from utils import basename
-from document import Documents
+from document import Documents, ArchiveDocuments, use_lexicon, STREAM_SIZE
+from cache import ResultCache
+from dedup import DuplicateDetector
+from boilerplate import BoilerplateIndex, MIN_DOCUMENTS
+from metadata import MetadataIndex
+import scheduler
+import verify
+import watch
+import plan
+import shards
+import leases
+import writer
+import stream
+import topics
+from watchdog import Quarantine
+from outliers import SlowDocuments, TOP_K
 
 
 # Name for temporary file with all files to process, with their locations
@@ -62,35 +120,169 @@ def parse_args():
     parser.add_argument('--scpa', help="scienceparse directory")
     parser.add_argument('--text', help="text directory")
     parser.add_argument('--out', help="output directory")
+    parser.add_argument('--archive', help="tar or zip archive with text and scienceparse files")
     parser.add_argument('--list', help="Use list of files")
     parser.add_argument('--limit', help="Maximum number of documents to process",
                         type=int, default=sys.maxsize)
+    parser.add_argument('--cache', help="Result cache shared between runs")
+    parser.add_argument('--cache-size', help="Maximum size of the result cache in MB",
+                        type=int, default=2048)
+    parser.add_argument('--dedup', help="Tag output with near-duplicate clusters",
+                        action='store_true')
+    parser.add_argument('--skip-duplicates', help="Do not process near-duplicates",
+                        action='store_true')
+    parser.add_argument('--trim-lines', help="Remove lines that are not running text from paragraphs",
+                        action='store_true')
+    parser.add_argument('--abstract-only', help="Only output the title and the abstract",
+                        action='store_true')
+    parser.add_argument('--bytes', help="Parse plain ASCII text as bytes without decoding it",
+                        action='store_true')
+    parser.add_argument('--encoding-errors', help="How to handle text that is not UTF-8",
+                        choices=['replace', 'strict'], default='replace')
+    parser.add_argument('--metadata', help="xDD metadata file to add the DOI, journal and year from")
+    parser.add_argument('--lexicon', help="Frequent word list to use instead of the built-in one")
+    parser.add_argument('--boilerplate', help="Index of boilerplate lines to remove")
+    parser.add_argument('--boilerplate-min-docs', help="Minimum document count for boilerplate",
+                        type=int, default=MIN_DOCUMENTS)
+    parser.add_argument('--workers', help="Number of worker processes",
+                        type=int, default=1)
+    parser.add_argument('--memory-budget', help="Memory budget for documents in flight in MB",
+                        type=int, default=scheduler.DEFAULT_MEMORY_BUDGET // 1024 ** 2)
+    parser.add_argument('--memory-factor', help="Ratio of memory use to input size, see --plan",
+                        type=float, default=scheduler.MEMORY_FACTOR)
+    parser.add_argument('--huge-size', help="Documents over this size in MB get their own worker",
+                        type=int, default=scheduler.HUGE_DOCUMENT_SIZE // 1024 ** 2)
+    parser.add_argument('--time-budget', help="Maximum number of seconds for parsing a document",
+                        type=float)
+    parser.add_argument('--memory-limit', help="Maximum memory in MB for parsing a document",
+                        type=int)
+    parser.add_argument('--quarantine', help="File to add documents that went over their budget to")
+    parser.add_argument('--retry-cheaper', help="Retry documents over budget in abstract-only mode",
+                        action='store_true')
+    parser.add_argument('--slowest', help="Report this many of the slowest documents",
+                        type=int, default=None)
+    parser.add_argument('--profile-dir', help="Directory for profiles of slow documents and the report")
+    parser.add_argument('--profile-threshold', help="Profile documents that took more seconds than this",
+                        type=float, default=None)
+    parser.add_argument('--profile-sample', help="Fraction of the documents to profile",
+                        type=float, default=0.0)
+    parser.add_argument('--shard', help="Only process shard I of N, given as I/N with 0 <= I < N",
+                        type=shards.parse_shard, default=None)
+    parser.add_argument('--bundle', help="Write the output to one NDJSON file with a manifest",
+                        action='store_true')
+    parser.add_argument('--writer-queue', help="Write output in a background thread with a queue of this size",
+                        type=int, default=0)
+    parser.add_argument('--stream-size', help="Write outputs with more text than this in MB one section at a time",
+                        type=int, default=STREAM_SIZE // 1024 ** 2)
+    parser.add_argument('--coordinate', help="Shared directory for taking batches of work with other processes")
+    parser.add_argument('--batch-size', help="Number of documents in a batch of work",
+                        type=int, default=leases.BATCH_SIZE)
+    parser.add_argument('--lease-timeout', help="Seconds after which the batch of a silent process is taken over",
+                        type=float, default=leases.LEASE_TIMEOUT)
+    parser.add_argument('--topics', help="Manifest with the directories of several topics to parse in one run")
+    parser.add_argument('--ndjson', help="Stream the results as NDJSON to this file or named pipe, - is stdout")
+    parser.add_argument('--ids', help="Read the names of the documents from this file, - is stdin")
+    parser.add_argument('--verify', help="Compare results with the reference parser instead of writing output",
+                        action='store_true')
+    parser.add_argument('--verify-sample', help="Verify a random sample of this many documents",
+                        type=int)
+    parser.add_argument('--verify-tolerance', help="Maximum difference between scores when verifying",
+                        type=float, default=verify.TOLERANCE)
+    parser.add_argument('--plan', help="Estimate the cost and the results of the run from a sample",
+                        action='store_true')
+    parser.add_argument('--plan-sample', help="Number of documents to parse for the estimate",
+                        type=int, default=plan.SAMPLE_SIZE)
+    parser.add_argument('--watch', help="Keep processing new documents as they arrive",
+                        action='store_true')
+    parser.add_argument('--watch-interval', help="Seconds between polls of the directories",
+                        type=float, default=watch.POLL_INTERVAL)
+    parser.add_argument('--settle-time', help="Seconds that files should be unchanged before processing",
+                        type=float, default=watch.SETTLE_TIME)
     return parser.parse_args()
 
 
-def parse_files_in_list(file_list: str):
+def parse_files_in_list(file_list: str, **options):
     """Parse all files in the file list and create html and json files for those
     files in the ../out/html/<subdir> and ../out/data/<subdir> directories, where
-    <subdir> is the name of the data set, something like bio-20221208-154439-0025."""
+    <subdir> is the name of the data set, something like bio-20221208-154439-0025.
+    The options are handed to Documents."""
     subdir = basename(file_list)
     if subdir == basename(FILE_LIST):
         subdir = 'tmp'
     html_dir = os.path.join('../out/html', subdir)
     data_dir = os.path.join('../out/data', subdir)
-    docs = Documents(file_list, html_dir, data_dir)
+    docs = Documents(file_list, html_dir, data_dir, **options)
     docs.write_output()
     docs.write_html()
     Documents.write_html_index('../out/html')
 
 
-def parse_files_in_directory(scpa_dir: str, text_dir: str, out_dir: str, limit=sys.maxsize):
+def parse_files_in_directory(scpa_dir: str, text_dir: str, out_dir: str,
+                             limit=sys.maxsize, **options):
+    """Parse files from the directories, the options are handed to Documents."""
     _generate_filelist(FILE_LIST, scpa_dir, text_dir, limit)
     print(f'>>> Writing results to {out_dir}')
     # In production mode we only write JSON output, so the html_dir is set to None
-    docs = Documents(FILE_LIST, None, out_dir)
+    docs = Documents(FILE_LIST, None, out_dir, **options)
     docs.write_output()
 
 
+def parse_files_in_archive(archive_file: str, out_dir: str, limit=sys.maxsize, **options):
+    print(f'>>> Reading documents from {archive_file}')
+    print(f'>>> Writing results to {out_dir}')
+    docs = ArchiveDocuments(archive_file, None, out_dir, limit, **options)
+    docs.write_output()
+
+
+def verify_files(docs: Documents, args) -> bool:
+    return verify.verify(docs, sample=args.verify_sample, tolerance=args.verify_tolerance)
+
+
+def document_options(args) -> dict:
+    """Return the keyword arguments for Documents from the command line."""
+    options = {}
+    if args.cache:
+        options['cache'] = ResultCache(args.cache, args.cache_size * 1024 ** 2)
+    if args.dedup or args.skip_duplicates:
+        options['dedup'] = DuplicateDetector()
+        options['skip_duplicates'] = args.skip_duplicates
+    if args.trim_lines:
+        options['trim_lines'] = True
+    if args.abstract_only:
+        options['abstract_only'] = True
+    if args.bytes:
+        options['bytes_mode'] = True
+    if args.encoding_errors != 'replace':
+        options['encoding_errors'] = args.encoding_errors
+    if args.metadata:
+        options['metadata'] = MetadataIndex(args.metadata)
+    if args.boilerplate:
+        options['boilerplate'] = BoilerplateIndex(args.boilerplate, args.boilerplate_min_docs)
+    if args.time_budget is not None:
+        options['time_budget'] = args.time_budget
+    if args.memory_limit is not None:
+        options['memory_limit'] = args.memory_limit * 1024 ** 2
+    if args.quarantine:
+        options['quarantine'] = Quarantine(args.quarantine)
+    if args.retry_cheaper:
+        options['retry_cheaper'] = True
+    if args.slowest or args.profile_dir:
+        options['outliers'] = SlowDocuments(
+            args.slowest or TOP_K, args.profile_dir,
+            args.profile_threshold, args.profile_sample)
+    if args.shard is not None or args.bundle:
+        options['shard'] = shards.Shard(*(args.shard or (0, 1)), bundle=args.bundle)
+    if args.writer_queue > 0:
+        options['writer'] = writer.OutputWriter(args.writer_queue, args.stream_size * 1024 ** 2)
+    # also used without workers, by --plan
+    options['memory_factor'] = args.memory_factor
+    if args.workers > 1:
+        options['workers'] = args.workers
+        options['memory_budget'] = args.memory_budget * 1024 ** 2
+        options['huge_size'] = args.huge_size * 1024 ** 2
+    return options
+
+
 def _generate_filelist(file_list: str, scpa_dir: str, text_dir: str, limit=sys.maxsize):
     """Generate a list with input files and their location and save it in FILE_LIST."""
     with open(file_list, 'w') as fh:
@@ -107,7 +299,35 @@ def _generate_filelist(file_list: str, scpa_dir: str, text_dir: str, limit=sys.m
 if __name__ == '__main__':
 
     args = parse_args()
+    if args.lexicon:
+        use_lexicon(args.lexicon)
+    options = document_options(args)
     if args.list:
-        parse_files_in_list(args.list)
+        parse_files_in_list(args.list, **options)
+    elif args.watch:
+        watcher = watch.Watcher(args.scpa, args.text, args.out, args.watch_interval,
+                                args.settle_time, **options)
+        watcher.run()
+    elif args.coordinate:
+        leases.run(args.scpa, args.text, args.out, args.coordinate,
+                   args.batch_size, args.lease_timeout, **options)
+    elif args.topics:
+        topics.run(args.topics, **options)
+    elif args.ndjson:
+        stream.run(args.scpa, args.text, args.ndjson, args.ids, args.batch_size, **options)
+    elif args.plan and args.archive:
+        print('WARNING: --plan needs the text and scienceparse directories, not an archive')
+    elif args.plan:
+        _generate_filelist(FILE_LIST, args.scpa, args.text, args.limit)
+        plan.plan(Documents(FILE_LIST, None, None, **options), args.plan_sample)
+    elif args.verify and args.archive:
+        docs = ArchiveDocuments(args.archive, None, None, args.limit, **options)
+        sys.exit(0 if verify_files(docs, args) else 1)
+    elif args.verify:
+        _generate_filelist(FILE_LIST, args.scpa, args.text, args.limit)
+        docs = Documents(FILE_LIST, None, None, **options)
+        sys.exit(0 if verify_files(docs, args) else 1)
+    elif args.archive:
+        parse_files_in_archive(args.archive, args.out, args.limit, **options)
     else:
-        parse_files_in_directory(args.scpa, args.text, args.out, args.limit)
+        parse_files_in_directory(args.scpa, args.text, args.out, args.limit, **options)
@@ -0,0 +1,223 @@
+"""Estimating the cost and the results of a run from a sample
+
+Before a long run on a new topic this gives an estimate of how long the run will
+take, how much output it will write, how much memory a document needs, and how
+many documents end up in each mode or pass each document test. Nothing is
+written.
+
+- The sizes of all documents are taken with os.stat(), no file is read.
+- The documents are split into STRATA groups of about the same number of
+  documents, from small to large, and a random sample is taken from each group,
+  in proportion to the size of the group but with at least two documents.
+- The sampled documents are parsed in the main process with the options of the
+  run, through the same code that creates Document and Morsels. Each document
+  is parsed twice, once to time it and once with tracemalloc to get the peak
+  memory, since tracemalloc slows down parsing.
+- Totals and rates are extrapolated with the stratified estimator, with 95%
+  confidence intervals. The cache and duplicate detection are not used.
+- Documents that cannot be decoded or parsed are counted as a failure rate,
+  they count for the runtime but not for the memory, the output or the modes.
+  Empty documents have no memory ratio.
+- The ratio of the peak memory to the input size is given as a mean and as a
+  p95, both with 95% confidence intervals. The interval for the p95 is taken
+  from the order statistics of the sample as if it were a simple random sample.
+  If the scheduler assumes a lower ratio than the upper bound for the p95, see
+  --memory-factor, the upper bound is suggested.
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --plan
+$ python3 parse.py --scpa DIR1 --text DIR2 --plan --plan-sample 400 --workers 8
+
+"""
+
+import json, math, time, random, tracemalloc
+import document
+
+
+# Number of size groups to sample from
+STRATA = 5
+
+# Default number of documents in the sample
+SAMPLE_SIZE = 100
+
+# Z score for 95% confidence intervals
+Z = 1.96
+
+
+def strata(jobs: list, count: int = STRATA) -> list:
+    """Split the jobs, which are pairs of a name and a size, into groups of about
+    the same number of jobs, ordered on size."""
+    ordered = sorted(jobs, key=lambda job: (job[1], job[0]))
+    count = max(1, min(count, len(ordered)))
+    bounds = [round(i * len(ordered) / count) for i in range(count + 1)]
+    return [ordered[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+
+def allocate(groups: list, sample_size: int) -> list:
+    """Return the number of jobs to sample from each group, proportional to the
+    size of the group, with at least two jobs if the group has that many."""
+    total = sum(len(group) for group in groups)
+    return [min(len(group), max(2, round(sample_size * len(group) / total)))
+            for group in groups]
+
+
+def quantile_interval(values: list, q: float) -> tuple:
+    """Return the q-th quantile of the sorted values with the lower and upper
+    bound of its 95% confidence interval, which are the values at the ranks
+    n * q ± Z * sqrt(n * q * (1 - q))."""
+    n = len(values)
+    margin = Z * math.sqrt(n * q * (1 - q))
+    low = max(0, math.floor(n * q - margin))
+    high = min(n - 1, math.ceil(n * q + margin))
+    return values[low], values[min(n - 1, int(n * q))], values[high]
+
+
+def measure(docs: document.Documents, name: str) -> dict:
+    """Parse a document and return the time, the peak memory, the size of the
+    input and the output, the mode and the results of the document tests. For a
+    document that could not be decoded or parsed only the size, the time and the
+    error are returned."""
+    _, text, scpa = docs.source(name)
+    options = {'boilerplate': docs.boilerplate,
+               'trim_lines': docs.trim_lines,
+               'abstract_only': docs.abstract_only,
+               'errors': docs.encoding_errors}
+
+    def parse():
+        try:
+            content = docs.content(text)
+        except UnicodeDecodeError:
+            return document.failure(name, 'encoding')
+        return document.process_with_budget(name, content, scpa, **options)
+
+    start = time.perf_counter()
+    result = parse()
+    seconds = time.perf_counter() - start
+    if document.is_failure(result):
+        return {'size': len(text) + len(scpa),
+                'seconds': seconds,
+                'error': result['error']}
+    tracemalloc.start()
+    try:
+        parse()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    scores = result['scores']
+    tests = {test_name: test(scores[test_name], threshold)
+             for test_name, (test, threshold) in document.DOCUMENT_TESTS.items()
+             if scores.get(test_name) is not None}
+    return {'size': len(text) + len(scpa),
+            'seconds': seconds,
+            'memory': peak,
+            'output': len(json.dumps(result['morsels'], indent=4)),
+            'mode': result['mode'],
+            'tests': tests}
+
+
+def has_memory_ratio(measurement: dict) -> bool:
+    """Failed documents have no peak memory and empty documents have no ratio."""
+    return 'error' not in measurement and measurement['size'] > 0
+
+
+class Estimate:
+
+    """Stratified estimate of a total and of the mean per document."""
+
+    def __init__(self, groups: list):
+        # groups are pairs of the number of documents in the group and the sampled
+        # values, groups without values are left out
+        self.total = 0.0
+        variance = 0.0
+        self.documents = sum(size for size, values in groups if values)
+        for size, values in groups:
+            n = len(values)
+            if n == 0:
+                continue
+            mean = sum(values) / n
+            self.total += size * mean
+            if n > 1:
+                sample_variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+                variance += size ** 2 * (1 - n / size) * sample_variance / n
+        self.margin = Z * math.sqrt(variance)
+
+    def mean(self) -> tuple:
+        return self.total / self.documents, self.margin / self.documents
+
+    def __str__(self):
+        return f'{self.total:,.1f} ± {self.margin:,.1f}'
+
+
+def plan(docs: document.Documents, sample_size: int = SAMPLE_SIZE, seed: int = None):
+    """Print the estimates for running on the documents."""
+    start = time.perf_counter()
+    jobs = [(name, docs.source_size(name)) for name in docs.names]
+    if not jobs:
+        print('WARNING: there are no documents')
+        return
+    sizes = sorted(size for _, size in jobs)
+    print(f'>>> {len(jobs):,} documents, {_megabytes(sum(sizes))} of input'
+          f' (stat took {time.perf_counter() - start:.2f}s)')
+    print(f'>>> sizes: median {_megabytes(sizes[len(sizes) // 2])}'
+          f'  p99 {_megabytes(sizes[int(len(sizes) * 0.99)])}  max {_megabytes(sizes[-1])}')
+    rng = random.Random(seed)
+    groups = strata(jobs)
+    measured = []
+    for group, count in zip(groups, allocate(groups, sample_size)):
+        sample = rng.sample(group, count)
+        measured.append((len(group), [measure(docs, name) for name, _ in sample]))
+    print(f'>>> Parsed a sample of {sum(len(m) for _, m in measured):,} documents'
+          f' from {len(groups)} size groups')
+
+    def estimate(value, included=lambda m: True) -> Estimate:
+        return Estimate([(size, [value(m) for m in sample if included(m)])
+                         for size, sample in measured])
+
+    failed = [m for _, sample in measured for m in sample if 'error' in m]
+    if failed:
+        mean, margin = estimate(lambda m: 'error' in m).mean()
+        errors = ', '.join(sorted(set(m['error'] for m in failed)))
+        print(f'>>> failures: {mean:.1%} ± {margin:.1%} of the documents cannot be parsed'
+              f' ({errors})')
+    seconds = estimate(lambda m: m['seconds'])
+    workers = max(1, docs.workers)
+    print(f'>>> runtime: {seconds} CPU seconds,'
+          f' about {_duration(seconds.total / workers)} with {workers} worker(s)')
+    output = estimate(lambda m: m.get('output', 0))
+    print(f'>>> output: {_megabytes(output.total)} ± {_megabytes(output.margin)}')
+    ratios = sorted(m['memory'] / m['size']
+                    for _, sample in measured for m in sample if has_memory_ratio(m))
+    if ratios:
+        ratio, ratio_margin = estimate(
+            lambda m: m['memory'] / m['size'], has_memory_ratio).mean()
+        low, p95, high = quantile_interval(ratios, 0.95)
+        largest = sum(sizes[-workers:])
+        print(f'>>> memory: peak is {ratio:.1f} ± {ratio_margin:.1f} times the input size,'
+              f' p95 {p95:.1f} ({low:.1f} to {high:.1f})')
+        print(f'>>> memory: {_megabytes(low * largest)} to {_megabytes(high * largest)}'
+              f' for the {workers} largest document(s) at the same time')
+        if docs.memory_factor < high:
+            print(f'>>> memory: the scheduler assumes {docs.memory_factor:g} times the input'
+                  f' size, use --memory-factor {math.ceil(high)}')
+    else:
+        print('WARNING: no document in the sample has a memory ratio')
+    # failed documents are in none of the modes and pass none of the tests
+    for mode in ('scpa', 'text', 'none'):
+        mean, margin = estimate(lambda m: m.get('mode') == mode).mean()
+        print(f'>>> mode {mode:5} {mean:6.1%} ± {margin:.1%}')
+    for test_name in document.DOCUMENT_TESTS:
+        if all(test_name in m['tests'] for _, sample in measured for m in sample
+               if 'error' not in m):
+            mean, margin = estimate(
+                lambda m: m.get('tests', {}).get(test_name, False)).mean()
+            print(f'>>> test {test_name:22} passes {mean:6.1%} ± {margin:.1%}')
+
+
+def _megabytes(size: float) -> str:
+    return f'{size / 1024 ** 2:,.1f}MB'
+
+
+def _duration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    return f'{hours}h{rest // 60:02d}m{rest % 60:02d}s'
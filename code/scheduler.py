@@ -0,0 +1,297 @@
+"""Size-aware scheduling of documents over worker processes
+
+Documents in an xDD drop range from a kilobyte to tens of megabytes. Handing them
+to a pool of workers in name order gives stragglers at the end of a run, when one
+worker is still busy with a big document that happened to come late, and memory
+spikes when several big documents are processed at the same time.
+
+The scheduler therefore:
+
+- Orders documents largest first, so the long jobs start early and the small ones
+  fill in the gaps at the end. Ties are broken on the name so that the order only
+  depends on the names and sizes of the documents.
+- Keeps an estimate of the memory used by the documents that are in flight, which
+  is the memory factor times the size of the input files, and does not start a
+  new document if that would go over the memory budget. The default factor is
+  the p95 of the ratio that --plan measures, see plan.py, use --plan to get the
+  ratio for a corpus and --memory-factor to use it.
+- Sends huge documents to a separate pool with its own workers, so that they do
+  not end up being processed at the same time and do not hold up the other
+  workers.
+
+Results are generated in the planned order, largest first over both lanes, so
+the output of a run does not depend on which worker happens to finish first.
+Results that are done before the ones ahead of them are kept until it is their
+turn. A document counts against the budget only until it is done, not until
+its result is handed out, so a lane that is busy with huge documents does not
+hold up the other lane. When nothing is in flight the next document is always
+started, so a document that is larger than the whole budget still gets
+processed, on its own.
+
+With a hard timeout the scheduler also acts as a watchdog. Workers report the
+time at which they start a job in a dictionary shared through a manager process,
+a job that is only waiting in the queue of the pool is not running. A document
+that has been running for longer than the timeout is stuck somewhere the time
+budget of the worker cannot reach (see watchdog.py), so the workers of its pool
+are killed and the pool is replaced. The other documents that were in that pool
+are started again, and for the stuck document the failure handler is called to
+get a result. The same happens for documents that were in a pool that broke
+more than MAX_ATTEMPTS times, for example because a worker crashed on them.
+
+"""
+
+import time, itertools, multiprocessing
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Ratio of the peak memory used while parsing a document to the size of its files,
+# --plan measured a p95 of 31 on a test corpus with documents of 2-20KB
+MEMORY_FACTOR = 32
+
+# Default maximum of the estimated memory for documents in flight
+DEFAULT_MEMORY_BUDGET = 4 * 1024 ** 3
+
+# Documents with files larger than this (in bytes) go to the pool for huge documents
+HUGE_DOCUMENT_SIZE = 5 * 1024 ** 2
+
+# Number of times a document is started in a pool that breaks before giving up
+MAX_ATTEMPTS = 3
+
+MAIN = 'main'
+HUGE = 'huge'
+
+
+class Scheduler:
+
+    def __init__(self, workers: int, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 huge_size: int = HUGE_DOCUMENT_SIZE, huge_workers: int = 1,
+                 initializer=None, initargs=(), hard_timeout: float = None,
+                 on_failure=None, memory_factor: float = MEMORY_FACTOR):
+        """The failure handler is called with the name of a document and the
+        reason, "timeout" or "crashed", and returns the result for the document.
+        Without a handler the BrokenProcessPool exception is raised."""
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.memory_factor = memory_factor
+        self.huge_size = huge_size
+        self.huge_workers = huge_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.hard_timeout = hard_timeout
+        self.on_failure = on_failure
+        self.executors = {}
+        # allow a few more jobs than workers per lane so workers do not sit idle
+        self.lane_limits = {MAIN: 2 * workers, HUGE: huge_workers}
+        # start times of the jobs by job number, set by the workers
+        self.manager = None
+        self.started = None
+        self.job_numbers = itertools.count()
+
+    def __str__(self):
+        return (f'<Scheduler workers={self.workers} huge_workers={self.huge_workers}'
+                f' budget={self.memory_budget}>')
+
+    def executor(self, lane: str):
+        """Return the pool for the lane, pools are created when first needed. With
+        a hard timeout the pool is wrapped so that the workers report when they
+        start a job."""
+        if lane not in self.executors:
+            workers = self.workers if lane == MAIN else self.huge_workers
+            if self.hard_timeout is None or self.on_failure is None:
+                self.executors[lane] = ProcessPoolExecutor(
+                    workers, initializer=self.initializer, initargs=self.initargs)
+            else:
+                if self.manager is None:
+                    self.manager = multiprocessing.Manager()
+                    self.started = self.manager.dict()
+                pool = ProcessPoolExecutor(
+                    workers, initializer=_initialize_timed_worker,
+                    initargs=(self.started, self.initializer, self.initargs))
+                self.executors[lane] = TimedExecutor(pool, self.job_numbers)
+        return self.executors[lane]
+
+    def lane(self, size: int) -> str:
+        return HUGE if size > self.huge_size else MAIN
+
+    @staticmethod
+    def order(jobs: list) -> list:
+        """Return the jobs, which are pairs of a name and a size, largest first."""
+        return sorted(jobs, key=lambda job: (-job[1], job[0]))
+
+    def run(self, jobs: list, submit):
+        """Run the jobs, which are pairs of a name and a size in bytes, and generate
+        pairs of names and results in the order of order(). Jobs are started
+        largest first in each lane. The submit function is called with an executor
+        and a name and should return a Future."""
+        waiting = {MAIN: deque(), HUGE: deque()}
+        memory = {}
+        planned = deque()
+        for name, size in self.order(jobs):
+            waiting[self.lane(size)].append(name)
+            memory[name] = size * self.memory_factor
+            planned.append(name)
+        # results that are done but wait for the results ahead of them
+        results = {}
+        names = {}
+        lanes = {}
+        attempts = Counter()
+        failed = {}
+        active = set()
+        done = deque()
+        running = {MAIN: 0, HUGE: 0}
+        in_flight = 0
+        remaining = len(memory)
+
+        def start(lane, name):
+            future = submit(self.executor(lane), name)
+            attempts[name] += 1
+            names[future] = name
+            lanes[future] = lane
+            if future.done():
+                done.append(future)
+            else:
+                active.add(future)
+                running[lane] += 1
+
+        while remaining:
+            # start as many jobs as the lane limits and the budget allow
+            for lane in (HUGE, MAIN):
+                queue = waiting[lane]
+                while queue and running[lane] < self.lane_limits[lane]:
+                    name = queue[0]
+                    if in_flight and in_flight + memory[name] > self.memory_budget:
+                        break
+                    queue.popleft()
+                    start(lane, name)
+                    in_flight += memory[name]
+            if not done:
+                finished, _ = wait(active, timeout=self._poll_interval(),
+                                   return_when=FIRST_COMPLETED)
+                for future in finished:
+                    active.discard(future)
+                    running[lanes[future]] -= 1
+                    name = names[future]
+                    if (self.on_failure is not None and name not in failed
+                            and (future.cancelled()
+                                 or isinstance(future.exception(), BrokenProcessPool))):
+                        if attempts[name] < MAX_ATTEMPTS:
+                            lane = lanes.pop(future)
+                            del names[future]
+                            self._forget(future)
+                            start(lane, name)
+                            continue
+                        failed[name] = 'crashed'
+                    done.append(future)
+                self._check_timeouts(active, names, lanes, failed, running, done)
+            while done:
+                future = done.popleft()
+                name = names.pop(future)
+                lanes.pop(future)
+                self._forget(future)
+                in_flight -= memory[name]
+                remaining -= 1
+                if name in failed:
+                    results[name] = self.on_failure(name, failed.pop(name))
+                else:
+                    results[name] = future.result()
+            while planned and planned[0] in results:
+                name = planned.popleft()
+                yield name, results.pop(name)
+
+    def _poll_interval(self):
+        return None if self.hard_timeout is None else min(1.0, self.hard_timeout / 4)
+
+    def _forget(self, future):
+        job = getattr(future, 'job', None)
+        if job is not None and self.started is not None:
+            self.started.pop(job, None)
+
+    def _check_timeouts(self, active, names, lanes, failed, running, done):
+        """Kill the pools with a job that has been running for longer than the
+        hard timeout, the job is marked as failed."""
+        if self.started is None:
+            return
+        started = self.started.copy()
+        now = time.time()
+        for future in list(active):
+            job_started = started.get(getattr(future, 'job', None))
+            if job_started is None or now - job_started <= self.hard_timeout:
+                continue
+            if names[future] not in failed:
+                failed[names[future]] = 'timeout'
+                if not self.kill(lanes[future]):
+                    # the stuck job never finishes, so do not wait for it
+                    active.discard(future)
+                    running[lanes[future]] -= 1
+                    done.append(future)
+
+    def kill(self, lane: str) -> bool:
+        """Kill the workers of the pool for the lane, the futures of the pool get a
+        BrokenProcessPool exception and the next job in the lane gets a new pool.
+        Returns False if the workers could not be killed, then the pool is shut
+        down without waiting, which cancels the jobs that did not start, and the
+        stuck worker is left to finish by itself."""
+        executor = self.executors.pop(lane, None)
+        if executor is None:
+            return True
+        # there is no public way to get at the worker processes
+        processes = getattr(executor, '_processes', None)
+        if processes is None:
+            try:
+                executor.shutdown(wait=False, cancel_futures=True)
+            except TypeError:
+                # cancel_futures is new in Python 3.9
+                executor.shutdown(wait=False)
+            return False
+        for process in list(processes.values()):
+            process.kill()
+        executor.shutdown(wait=False)
+        return True
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown()
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+
+
+class TimedExecutor:
+
+    """A process pool where each job has a number and the worker records the
+    time at which it starts the job in the shared dictionary, under that number.
+    The number is set on the Future of the job."""
+
+    def __init__(self, pool: ProcessPoolExecutor, job_numbers):
+        self.pool = pool
+        self.job_numbers = job_numbers
+
+    @property
+    def _processes(self):
+        return getattr(self.pool, '_processes', None)
+
+    def submit(self, fn, *args, **kwargs):
+        job = next(self.job_numbers)
+        future = self.pool.submit(_run_timed_job, job, fn, *args, **kwargs)
+        future.job = job
+        return future
+
+    def shutdown(self, wait: bool = True, **options):
+        self.pool.shutdown(wait=wait, **options)
+
+
+_started = None
+
+
+def _initialize_timed_worker(started, initializer, initargs):
+    global _started
+    _started = started
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_timed_job(job: int, fn, *args, **kwargs):
+    _started[job] = time.time()
+    return fn(*args, **kwargs)
@@ -1,6 +1,6 @@
 """Document selection from XDD data drop
 
-$ python3 select.py DIRECTORY NAME COUNT
+$ python3 selection.py DIRECTORY NAME COUNT
 
 This selects COUNT random documents from DIRECTORY and writes output to /lists.
 
@@ -20,10 +20,15 @@ its contents will look like:
 642c0f0714b4ac75a269b131
 5adc4145cf58f164ffe84c6c
 
+This module used to be named select.py, it was renamed because that name hides the
+select module from the standard library, which is needed by multiprocessing and
+socket when scripts are run from this directory.
+
 """
 
-import os, random, argparse
+import os, argparse
 from utils import timestamp
+from ids import IdSet
 
 
 def parse_args():
@@ -40,16 +45,10 @@ def outfile_name(name: str, number_of_documents: int):
 
 
 def select_documents(number_of_documents: int, data_directory: str):
-    fnames = os.listdir(os.path.join(data_directory, "text"))
-    selected_indices = set()
-    selected_documents = set()
-    while len(selected_indices) < number_of_documents:
-        random_int = random.randint(0, len(fnames))
-        selected_indices.add(random_int)
-        selected_document = os.path.splitext(fnames[random_int])[0]
-        selected_documents.add(selected_document)
+    names = IdSet(os.path.splitext(fname)[0]
+                  for fname in os.listdir(os.path.join(data_directory, "text")))
     print("Selecting %d documents from '%s'" % (number_of_documents, data_directory))
-    return selected_documents
+    return names.sample(min(number_of_documents, len(names)))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,301 @@
+"""Document structure parsing as a local service
+
+Running parse.py on a small batch of documents is dominated by the fixed costs of
+starting the interpreter, importing modules and building the lexicon. This module
+runs the parser as a long-running local HTTP service where those costs are paid
+once. Requests are handled by a pool of worker processes that are started and
+warmed up when the service starts.
+
+Usage:
+
+$ python3 service.py --port 8000 --workers 4
+$ python3 service.py --socket /tmp/docstructure.sock --workers 4
+
+Endpoints:
+
+POST /parse     Body is a json object {"name": NAME, "text": TEXT, "scpa": SCPA}, where
+                SCPA is the ScienceParse json for the document or null. Returns the
+                result for the document, see document.Document.result().
+POST /batch     Body is a json list of objects like the one for /parse, returns a list
+                of results in the same order.
+GET  /metrics   Counts of requests, documents, rejections, errors and pool restarts,
+                the number of documents in the queue and percentiles for request
+                latency.
+GET  /health    Returns {"status": "ok"}.
+
+At most --queue-size documents are accepted at the same time, this includes the
+documents that are being processed. Requests that would go over that limit are
+rejected with "503 Service Unavailable" and a Retry-After header, so clients slow
+down instead of piling up work in the service. A batch that is larger than the
+queue size can never be accepted and gets "413 Payload Too Large".
+
+When a worker process dies, for example because it ran out of memory, the pool
+is broken and all its documents fail. The request gets "500 Internal Server
+Error" and the pool is replaced by a new one for the next requests.
+
+Examples with curl:
+
+$ curl -s localhost:8000/parse -d '{"name": "doc1", "text": "Abstract\\nWe model the ...", "scpa": null}'
+$ curl -s --unix-socket /tmp/docstructure.sock http://localhost/metrics
+
+"""
+
+import os, math, time, json, argparse, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+import document
+from boilerplate import BoilerplateIndex, MIN_DOCUMENTS
+
+
+DEFAULT_PORT = 8000
+DEFAULT_QUEUE_SIZE = 256
+
+# Number of most recent requests used for the latency percentiles
+LATENCY_WINDOW = 10000
+
+# Seconds that a rejected client is asked to wait before trying again
+RETRY_AFTER = 1
+
+
+# The boilerplate index of a worker process, set by _initialize_worker()
+_boilerplate = None
+
+
+def _initialize_worker(boilerplate_file: str, min_documents: int):
+    global _boilerplate
+    if boilerplate_file is not None:
+        _boilerplate = BoilerplateIndex(boilerplate_file, min_documents)
+
+
+def _process(name: str, text: str, scpa_json: dict) -> dict:
+    return document.process_document(name, text, scpa_json, _boilerplate)
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ParserService:
+
+    """The worker pool with the bounded queue in front of it and the metrics."""
+
+    def __init__(self, workers: int, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 boilerplate_file: str = None, min_documents: int = MIN_DOCUMENTS):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.initargs = (boilerplate_file, min_documents)
+        self.executor = self.create_executor()
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.in_queue = 0
+        self.counts = {'requests': 0, 'documents': 0, 'rejected': 0, 'errors': 0,
+                       'restarts': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.warm_up()
+
+    def create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            self.workers, initializer=_initialize_worker, initargs=self.initargs)
+
+    def restart(self, executor: ProcessPoolExecutor):
+        """Replace the executor with a new one if it was not replaced already by
+        another request that used the same broken pool."""
+        with self.lock:
+            if self.executor is not executor:
+                return
+            self.executor = self.create_executor()
+            self.counts['restarts'] += 1
+        executor.shutdown(wait=False)
+
+    def warm_up(self):
+        """Start all worker processes and have each one process a tiny document."""
+        futures = [self.executor.submit(_process, 'warm-up', 'Abstract\nwarm up', None)
+                   for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def process(self, documents: list) -> list:
+        """Process a list of documents, each a dictionary with a name, a text and
+        the ScienceParse json, and return a list of results. Raises ServiceBusy
+        if there is no room in the queue for all documents."""
+        acquired = 0
+        try:
+            for _ in documents:
+                if not self.slots.acquire(blocking=False):
+                    raise ServiceBusy()
+                acquired += 1
+            with self.lock:
+                self.in_queue += acquired
+            executor = self.executor
+            try:
+                futures = [executor.submit(_process, doc.get('name'), doc['text'], doc.get('scpa'))
+                           for doc in documents]
+                return [future.result() for future in futures]
+            except BrokenProcessPool:
+                self.restart(executor)
+                raise
+            finally:
+                with self.lock:
+                    self.in_queue -= acquired
+        finally:
+            for _ in range(acquired):
+                self.slots.release()
+
+    def record(self, counter: str, value: int = 1):
+        with self.lock:
+            self.counts[counter] += value
+
+    def record_latency(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def metrics(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            metrics = dict(self.counts)
+            metrics['in_queue'] = self.in_queue
+        metrics['workers'] = self.workers
+        metrics['queue_size'] = self.queue_size
+        metrics['uptime'] = round(time.time() - self.started, 3)
+        metrics['latency'] = {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+            'window': len(latencies)}
+        return metrics
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def percentile(sorted_values: list, p: float):
+    """Return the p-th percentile of a sorted list with the nearest-rank method."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class ParserRequestHandler(BaseHTTPRequestHandler):
+
+    server_version = 'xdd-docstructure'
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, self.server.service.metrics())
+        elif self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path not in ('/parse', '/batch'):
+            self.send_json(404, {'error': f'unknown path {self.path}'})
+            return
+        service = self.server.service
+        start = time.perf_counter()
+        service.record('requests')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.send_json(400, {'error': f'invalid json: {e}'})
+            return
+        documents = [body] if self.path == '/parse' else body
+        if not isinstance(documents, list) or not all(
+                isinstance(doc, dict) and isinstance(doc.get('text'), str) for doc in documents):
+            self.send_json(400, {'error': 'each document needs at least a text'})
+            return
+        if len(documents) > service.queue_size:
+            self.send_json(413, {'error': f'batch is larger than the queue size {service.queue_size}'})
+            return
+        try:
+            results = service.process(documents)
+        except ServiceBusy:
+            service.record('rejected')
+            self.send_json(503, {'error': 'queue is full'}, {'Retry-After': str(RETRY_AFTER)})
+            return
+        except Exception as e:
+            service.record('errors')
+            self.send_json(500, {'error': f'{e.__class__.__name__}: {e}'})
+            return
+        service.record('documents', len(documents))
+        self.send_json(200, results[0] if self.path == '/parse' else results)
+        service.record_latency(time.perf_counter() - start)
+
+    def send_json(self, status: int, data, headers: dict = None):
+        output = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(output)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(output)
+
+    def address_string(self):
+        # the client address is an empty string for Unix sockets
+        return self.client_address[0] if self.client_address else 'unix-socket'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+
+
+def create_server(service: ParserService, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                  socket_file: str = None, quiet: bool = False):
+    if socket_file is not None:
+        server = UnixHTTPServer(socket_file, ParserRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ParserRequestHandler)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the document structure parser as a service')
+    parser.add_argument('--host', help="host to bind to", default='127.0.0.1')
+    parser.add_argument('--port', help="port to listen on", type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', help="Unix socket to listen on instead of a port")
+    parser.add_argument('--workers', help="number of worker processes",
+                        type=int, default=os.cpu_count())
+    parser.add_argument('--queue-size', help="maximum number of documents accepted at once",
+                        type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument('--boilerplate', help="Index of boilerplate lines to remove")
+    parser.add_argument('--boilerplate-min-docs', help="Minimum document count for boilerplate",
+                        type=int, default=MIN_DOCUMENTS)
+    parser.add_argument('--quiet', help="do not log requests", action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    service = ParserService(args.workers, args.queue_size,
+                            args.boilerplate, args.boilerplate_min_docs)
+    server = create_server(service, args.host, args.port, args.socket, args.quiet)
+    where = args.socket if args.socket else f'http://{args.host}:{args.port}'
+    print(f'>>> Serving with {args.workers} workers on {where}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
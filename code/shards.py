@@ -0,0 +1,249 @@
+"""Splitting a run over several machines
+
+A topic can be parsed by several machines that share a file system, without
+anything that coordinates them. Each machine runs the parser with --shard I/N
+and takes the documents for which a stable hash of the name, modulo N, is I, so
+every document is in exactly one shard whatever the machine or the order of the
+file list. Shards are numbered from 0 to N-1.
+
+Each shard writes a manifest, manifest-I-of-N.json in the output directory,
+with the names of the documents it wrote and statistics over their scores. The
+statistics are the count, sum, sum of squares, minimum and maximum of each
+score, so those of several shards can be added up exactly. With --bundle the
+output of a shard is not written as one file per document but as one NDJSON
+file, bundle-I-of-N.ndjson, with a line {"name": NAME, "morsels": MORSELS} for
+each document.
+
+When all shards are done the merge command checks that the shards fit together,
+that there is one for each number and that no document is in more than one,
+and writes manifest.json with the combined statistics and bundle.ndjson with
+the bundles of all shards, if any.
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --shard 0/4 --bundle
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --shard 1/4 --bundle
+...
+$ python3 shards.py merge DIR3
+
+"""
+
+import os, re, glob, json, math, time, shutil, argparse
+from utils import stable_hash
+
+
+MANIFEST_FILE = 'manifest.json'
+BUNDLE_FILE = 'bundle.ndjson'
+
+SHARD_MANIFEST = re.compile(r'manifest-(\d+)-of-(\d+)\.json')
+
+
+def parse_shard(text: str) -> tuple:
+    """Return the pair <index, count> for a shard given as I/N."""
+    match = re.fullmatch(r'(\d+)/(\d+)', text.strip())
+    if match is None or not int(match.group(1)) < int(match.group(2)):
+        raise argparse.ArgumentTypeError(f'a shard is I/N with 0 <= I < N, not {text}')
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_of(name: str, count: int) -> int:
+    return stable_hash(name.encode('utf-8')) % count
+
+
+class Stats:
+
+    """Count, sum, sum of squares, minimum and maximum of each numeric score."""
+
+    def __init__(self):
+        self.documents = 0
+        self.skipped = 0
+        self.modes = {}
+        self.scores = {}
+
+    def add(self, result: dict):
+        """Add a result as created by Document.result(), None is a document that
+        was skipped or that failed."""
+        if result is None:
+            self.skipped += 1
+            return
+        self.documents += 1
+        self.modes[result['mode']] = self.modes.get(result['mode'], 0) + 1
+        for name, value in result['scores'].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats = self.scores.get(name)
+                if stats is None:
+                    self.scores[name] = [1, value, value * value, value, value]
+                else:
+                    stats[0] += 1
+                    stats[1] += value
+                    stats[2] += value * value
+                    stats[3] = min(stats[3], value)
+                    stats[4] = max(stats[4], value)
+
+    def merge(self, other: 'Stats'):
+        self.documents += other.documents
+        self.skipped += other.skipped
+        for mode, count in other.modes.items():
+            self.modes[mode] = self.modes.get(mode, 0) + count
+        for name, (count, total, squares, minimum, maximum) in other.scores.items():
+            stats = self.scores.get(name)
+            if stats is None:
+                self.scores[name] = [count, total, squares, minimum, maximum]
+            else:
+                stats[0] += count
+                stats[1] += total
+                stats[2] += squares
+                stats[3] = min(stats[3], minimum)
+                stats[4] = max(stats[4], maximum)
+
+    def as_json(self) -> dict:
+        return {'documents': self.documents,
+                'skipped': self.skipped,
+                'modes': dict(sorted(self.modes.items())),
+                'scores': {name: dict(zip(('count', 'sum', 'sumsq', 'min', 'max'), stats))
+                           for name, stats in sorted(self.scores.items())}}
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Stats':
+        stats = cls()
+        stats.documents = data['documents']
+        stats.skipped = data['skipped']
+        stats.modes = dict(data['modes'])
+        stats.scores = {name: [s['count'], s['sum'], s['sumsq'], s['min'], s['max']]
+                        for name, s in data['scores'].items()}
+        return stats
+
+    def summary(self) -> list:
+        """Return lines with the documents, the modes and the mean, standard
+        deviation, minimum and maximum of each score."""
+        lines = [f'documents={self.documents:,} skipped={self.skipped:,} '
+                 + ' '.join(f'{mode}={count:,}' for mode, count in sorted(self.modes.items()))]
+        for name, (count, total, squares, minimum, maximum) in sorted(self.scores.items()):
+            mean = total / count
+            deviation = math.sqrt(max(0.0, squares / count - mean * mean))
+            lines.append(f'{name:22} mean={mean:.4g} sd={deviation:.4g}'
+                         f' min={minimum:.4g} max={maximum:.4g}')
+        return lines
+
+
+class Shard:
+
+    def __init__(self, index: int, count: int, bundle: bool = False):
+        """The shard with the given index out of count shards. With bundle the
+        output is written to one NDJSON file."""
+        self.index = index
+        self.count = count
+        self.bundle = bundle
+        self.stats = Stats()
+        self.names = []
+        self.out_dir = None
+        self.bundle_fh = None
+        self.started = None
+
+    def __str__(self):
+        return f'<Shard {self.index}/{self.count} documents={len(self.names)}>'
+
+    def __contains__(self, name: str) -> bool:
+        return shard_of(name, self.count) == self.index
+
+    def filename(self, prefix: str, extension: str) -> str:
+        return os.path.join(self.out_dir, f'{prefix}-{self.index}-of-{self.count}.{extension}')
+
+    def start(self, out_dir: str):
+        self.out_dir = out_dir
+        self.started = time.time()
+        if self.bundle:
+            self.bundle_fh = open(self.filename('bundle', 'ndjson'), 'w')
+
+    def add(self, name: str, result: dict) -> bool:
+        """Add the result to the statistics and to the bundle, returns True if the
+        morsels were written to the bundle."""
+        self.stats.add(result)
+        if result is None:
+            return False
+        self.names.append(name)
+        if self.bundle_fh is None:
+            return False
+        self.bundle_fh.write(json.dumps({'name': name, 'morsels': result['morsels']}) + '\n')
+        return True
+
+    def finish(self):
+        """Close the bundle and write the manifest."""
+        if self.bundle_fh is not None:
+            self.bundle_fh.close()
+        manifest = {'shard': self.index,
+                    'shards': self.count,
+                    'started': self.started,
+                    'finished': time.time(),
+                    'bundle': (os.path.basename(self.filename('bundle', 'ndjson'))
+                               if self.bundle else None),
+                    'stats': self.stats.as_json(),
+                    'documents': sorted(self.names)}
+        with open(self.filename('manifest', 'json'), 'w') as fh:
+            json.dump(manifest, fh)
+        print(f'>>> Shard {self.index}/{self.count}: wrote {len(self.names):,} documents')
+
+
+def merge(out_dir: str) -> dict:
+    """Combine the shard manifests and bundles in the directory, write the merged
+    manifest and bundle and return the manifest. Raises a ValueError if the shards
+    do not fit together."""
+    manifests = {}
+    for path in sorted(glob.glob(os.path.join(out_dir, 'manifest-*-of-*.json'))):
+        if SHARD_MANIFEST.fullmatch(os.path.basename(path)):
+            with open(path) as fh:
+                manifest = json.load(fh)
+            manifests[manifest['shard'], manifest['shards']] = manifest
+    if not manifests:
+        raise ValueError(f'there are no shard manifests in {out_dir}')
+    counts = {count for _, count in manifests}
+    if len(counts) > 1:
+        raise ValueError(f'manifests for different numbers of shards: {sorted(counts)}')
+    count = counts.pop()
+    missing = [i for i in range(count) if (i, count) not in manifests]
+    stats = Stats()
+    seen = set()
+    documents = []
+    for (index, _), manifest in sorted(manifests.items()):
+        stats.merge(Stats.from_json(manifest['stats']))
+        for name in manifest['documents']:
+            if name in seen:
+                raise ValueError(f'{name} is in more than one shard')
+            if shard_of(name, count) != index:
+                raise ValueError(f'{name} does not belong in shard {index}/{count}')
+            seen.add(name)
+        documents.extend(manifest['documents'])
+    bundles = [manifest['bundle'] for _, manifest in sorted(manifests.items())
+               if manifest['bundle']]
+    if bundles:
+        with open(os.path.join(out_dir, BUNDLE_FILE), 'wb') as out:
+            for bundle in bundles:
+                with open(os.path.join(out_dir, bundle), 'rb') as fh:
+                    shutil.copyfileobj(fh, out)
+    merged = {'shards': count,
+              'missing': missing,
+              'bundle': BUNDLE_FILE if bundles else None,
+              'stats': stats.as_json(),
+              'documents': sorted(documents)}
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w') as fh:
+        json.dump(merged, fh)
+    return merged
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Merge the results of shards')
+    parser.add_argument('command', choices=['merge'])
+    parser.add_argument('out', help="output directory of the shards")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    merged = merge(args.out)
+    print(f'>>> Merged {merged["shards"] - len(merged["missing"])} of {merged["shards"]}'
+          f' shards into {os.path.join(args.out, MANIFEST_FILE)}')
+    if merged['missing']:
+        print(f'WARNING: missing shards {merged["missing"]}')
+    for line in Stats.from_json(merged['stats']).summary():
+        print(f'>>> {line}')
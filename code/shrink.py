@@ -9,12 +9,15 @@ $ python shrink.py --source DIR1 --target DIR2 --size N
 The input directory DIR1 should have subdirectories "scienceparse" and "text" and
 optionally a file "metadata.json". The output directory DIR2 will have the same
 structure, but with only N documents per subdirectory. Both subdirectories in DIR2
-have documents with the same identifiers.
+have documents with the same identifiers. The metadata records are taken from
+metadata.json with an index that is saved next to it, see metadata.py.
 
 """
 
-import os, sys, shutil, json, random, argparse
+import os, sys, shutil, json, argparse
 import utils
+from ids import IdSet
+from metadata import MetadataIndex
 
 
 SCIENCEPARSE_DIR = 'scienceparse'
@@ -39,7 +42,8 @@ def shrink(indir: str, outdir: str, size: int):
     os.makedirs(os.path.join(outdir, SCIENCEPARSE_DIR), exist_ok=True)
     text_path = os.path.join(indir, TEXT_DIR)
     selection = _get_selection(os.listdir(text_path), size)
-    for scpa_file, text_file in selection.values():
+    for identifier in selection:
+        scpa_file, text_file = _filenames(identifier)
         source_scpa = os.path.join(indir, SCIENCEPARSE_DIR, scpa_file)
         source_text = os.path.join(indir, TEXT_DIR, text_file)
         target_scpa = os.path.join(outdir, SCIENCEPARSE_DIR, scpa_file)
@@ -56,33 +60,38 @@ def shrink(indir: str, outdir: str, size: int):
     print(f'>>> Results were written to {outdir}/')
 
 
-def _get_selection(text_files: list, n: int) -> dict:
-    """Return a dictionary indexed on identifiers where values are pairs of
-    basenames <scpa_file, text_file>."""
-    ids = [utils.trim_filename(f, '.txt') for f in text_files]
-    random_ids = set()
-    while len(random_ids) < n:
-        random_ids.add(random.choice(ids))
-    selection = {}
-    for identifier in random_ids:
-        selection[identifier] = (f'{identifier}_input.pdf.json', f'{identifier}.txt')
-    return selection
+def _get_selection(text_files: list, n: int) -> IdSet:
+    """Return the identifiers of n text files picked at random."""
+    ids = IdSet(utils.trim_filename(f, '.txt') for f in text_files)
+    return IdSet(ids.sample(min(n, len(ids))))
 
-def _shrink_metadata(indir: str, outdir: str, selection: dict):
+
+def _filenames(identifier: str) -> tuple:
+    """Return the basenames <scpa_file, text_file> for an identifier."""
+    return f'{identifier}_input.pdf.json', f'{identifier}.txt'
+
+
+def _shrink_metadata(indir: str, outdir: str, selection: IdSet):
+    """Copy the metadata records of the selection, these are taken from the
+    metadata file with its index, see metadata.py."""
     try:
-        meta_in = json.load(open(os.path.join(indir, METADATA_FILE)))
-        meta_out = [record for record in meta_in if record["_gddid"] in selection]
-        with open(os.path.join(outdir, METADATA_FILE), 'w') as fh:
-            json.dump(meta_out, fh, indent=4)
+        index = MetadataIndex(os.path.join(indir, METADATA_FILE))
     except FileNotFoundError:
         print("WARNING: there was no metadata file")
+        return
+    try:
+        meta_out = index.select(selection)
+    finally:
+        index.close()
+    with open(os.path.join(outdir, METADATA_FILE), 'w') as fh:
+        json.dump(meta_out, fh, indent=4)
 
 
 def _write_readme(indir, outdir, size, selection):
     with open(os.path.join(outdir, 'readme.txt'), 'w') as fh:
         fh.write(f'$ python {" ".join(sys.argv)}\n\n')
-        for scpa_file, text_file in selection.values():
-            fh.write(f'{text_file[:-4]}\n')
+        for identifier in selection:
+            fh.write(f'{identifier}\n')
 
 
 if __name__ == '__main__':
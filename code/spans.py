@@ -0,0 +1,122 @@
+"""Scoring arbitrary line ranges of a document
+
+A SpanIndex holds cumulative counts over the lines of a document: characters,
+tokens, tokens in the list of frequent words, summed token lengths and tokens of
+one character. With those, the scores of any range of lines can be calculated by
+subtracting two entries, without creating a Paragraph and without tokenizing the
+lines again. This is used to trim lines that are not running text from the
+paragraphs that are selected in text mode, and it allows sliding a window over
+the lines of a document, for example to find a stretch of prose that crosses
+paragraph boundaries.
+
+Note that singletons_per_token for a span is the number of one-character tokens
+over the number of tokens. This differs slightly from the paragraph score, which
+counts distinct one-character tokens, but that cannot be computed from prefix
+sums. For most text the two are very close.
+
+"""
+
+from dataclasses import dataclass
+from itertools import accumulate
+import utils
+
+
+# Tests used to decide whether a single line is running text
+LINE_TESTS = {
+    'language': (utils.larger, 0.1),
+    'average_token_length': (utils.larger, 2),
+    'singletons_per_token': (utils.smaller, 0.5)}
+
+
+@dataclass()
+class SpanScores:
+
+    size: int = 0
+    token_count: int = 0
+    language: float = 0.0
+    average_line_length: float = 0.0
+    average_token_length: float = 0.0
+    singletons_per_token: float = 0.0
+
+    def __str__(self):
+        return (
+            f"<SpanScores lan={self.language:.2f} ll={self.average_line_length:.2f}"
+            + f" tl={self.average_token_length:.2f} st={self.singletons_per_token:.2f}>")
+
+
+class SpanIndex:
+
+    def __init__(self, lines: list, frequent_words: set):
+        chars, tokens, frequent, token_chars, singletons = [], [], [], [], []
+        for line in lines:
+            line_tokens = line.split()
+            chars.append(len(line))
+            tokens.append(len(line_tokens))
+            frequent.append(sum(1 for t in line_tokens if t in frequent_words))
+            token_chars.append(sum(map(len, line_tokens)))
+            singletons.append(sum(1 for t in line_tokens if len(t) == 1))
+        self.line_count = len(lines)
+        self.chars = list(accumulate(chars, initial=0))
+        self.tokens = list(accumulate(tokens, initial=0))
+        self.frequent = list(accumulate(frequent, initial=0))
+        self.token_chars = list(accumulate(token_chars, initial=0))
+        self.singletons = list(accumulate(singletons, initial=0))
+
+    def __len__(self):
+        return self.line_count
+
+    def __str__(self):
+        return f'<SpanIndex lines={self.line_count} tokens={self.tokens[-1]}>'
+
+    def token_count(self, start: int, end: int) -> int:
+        return self.tokens[end] - self.tokens[start]
+
+    def scores(self, start: int, end: int) -> SpanScores:
+        """Return the scores for the lines from start up to but not including end,
+        where the size includes the newlines between the lines."""
+        lines = end - start
+        size = self.chars[end] - self.chars[start] + max(0, lines - 1)
+        tokens = self.token_count(start, end)
+        if tokens == 0:
+            return SpanScores(size=size, average_line_length=_ratio(size, lines))
+        return SpanScores(
+            size=size,
+            token_count=tokens,
+            language=(self.frequent[end] - self.frequent[start]) / tokens,
+            average_line_length=_ratio(size, lines),
+            average_token_length=(self.token_chars[end] - self.token_chars[start]) / tokens,
+            singletons_per_token=(self.singletons[end] - self.singletons[start]) / tokens)
+
+    def is_prose(self, start: int, end: int, tests: dict = LINE_TESTS) -> bool:
+        """Return True if the lines pass the tests, lines without tokens are
+        considered to be prose so that they do not break up a paragraph."""
+        if self.token_count(start, end) == 0:
+            return True
+        return utils.run_tests(tests, self.scores(start, end))
+
+    def prose_lines(self, start: int, end: int, tests: dict = LINE_TESTS) -> list:
+        """Return the line numbers from the range that are running text."""
+        return [i for i in range(start, end) if self.is_prose(i, i + 1, tests)]
+
+    def windows(self, width: int, start: int = 0, end: int = None):
+        """Generate pairs of a line number and the scores of the window of width
+        lines that starts at that line. A range that is shorter than the width has
+        one window and an empty range has none."""
+        end = self.line_count if end is None else end
+        if end <= start:
+            return
+        for i in range(start, max(start, end - width) + 1):
+            yield i, self.scores(i, min(i + width, end))
+
+    def best_window(self, width: int, start: int = 0, end: int = None):
+        """Return the line number of the window with the highest language score
+        and the scores of that window, or None if the range is empty."""
+        return max(self.windows(width, start, end),
+                   key=lambda window: window[1].language, default=None)
+
+
+def _ratio(x: int, y: int) -> float:
+    try:
+        return x / y
+    except ZeroDivisionError:
+        return 0.0
@@ -0,0 +1,113 @@
+"""Streaming results as NDJSON to another program
+
+Instead of writing a file for each document, the results can be written as
+NDJSON, one line for each document, to standard output or to a named pipe, so
+the next step of a processing chain can read them as they come without going
+through the disk. Each line has the name of the document as the id, the mode,
+the scores and the morsels (title, abstract, sections and the optional fields):
+
+{"id": NAME, "mode": MODE, "scores": {...}, "title": ..., "abstract": ..., "sections": [...]}
+
+A document that could not be parsed gets a line with the id, the error and, if
+the parser raised an exception, the message, so the reader knows that no other
+line is coming for it. Documents that were retried in abstract-only mode get
+the line of the retried result:
+
+{"id": NAME, "error": ERROR, "message": MESSAGE}
+
+Newlines in the text are escaped by the JSON encoder, so a line is always one
+record. With workers the order of the lines is the order of the scheduler for
+each batch, which only depends on the names and the sizes of the documents.
+
+The output is flushed after each line. When the reader is slower than the
+parser the writes block, which holds up the parser, so a slow reader gets
+backpressure and not a growing buffer.
+
+The names of the documents are taken from the text directory, or are read from
+a file or standard input, one on a line, which is read as the names come in.
+Without workers each document is parsed as soon as its name is read, with
+workers the names are handed to the worker pool in batches.
+
+When the results go to standard output the progress messages go to standard
+error.
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --ndjson - | next-step
+$ mkfifo results.pipe
+$ python3 parse.py --scpa DIR1 --text DIR2 --ndjson results.pipe --workers 8
+$ list-ids | python3 parse.py --scpa DIR1 --text DIR2 --ndjson - --ids -
+
+"""
+
+import os, sys, json, itertools, contextlib
+from watch import WatchedDocuments, TEXT_SUFFIX
+
+
+# Number of names that are handed to the worker pool at once
+BATCH_SIZE = 100
+
+
+def read_ids(fh, docs: WatchedDocuments):
+    """Generate the names in the file, skipping empty lines, comments and names
+    without a text file."""
+    for line in fh:
+        name = line.strip()
+        if not name or name.startswith('#'):
+            continue
+        if not os.path.exists(docs.text_filename(name)):
+            print(f'WARNING: there is no text file for {name}')
+            continue
+        yield name
+
+
+def batches(names, size: int):
+    names = iter(names)
+    while True:
+        batch = list(itertools.islice(names, size))
+        if not batch:
+            return
+        yield batch
+
+
+def records(docs: WatchedDocuments, names, batch_size: int = BATCH_SIZE):
+    """Generate the records for the names, without workers documents are parsed
+    one at a time as the names come in."""
+    for batch in ([names] if docs.workers <= 1 else batches(names, batch_size)):
+        docs.names = batch
+        yield from docs.records()
+
+
+def run(scpa_dir: str, text_dir: str, output: str, ids: str = None,
+        batch_size: int = BATCH_SIZE, **options):
+    """Write the records as NDJSON to the output, which is a file name or '-' for
+    standard output. The names are read from the ids file, '-' is standard input,
+    or taken from the text directory. The options are handed to Documents."""
+    out = sys.stdout if output == '-' else open(output, 'w')
+    log = sys.stderr if output == '-' else sys.stdout
+    with contextlib.redirect_stdout(log):
+        docs = WatchedDocuments(scpa_dir, text_dir, None, **options)
+        ids_file = None if ids in (None, '-') else open(ids)
+        if ids is None:
+            names = sorted(name[:-len(TEXT_SUFFIX)] for name in os.listdir(text_dir)
+                           if name.endswith(TEXT_SUFFIX))
+        else:
+            names = read_ids(sys.stdin if ids == '-' else ids_file, docs)
+        count = 0
+        try:
+            for record in records(docs, names, batch_size):
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                count += 1
+        except BrokenPipeError:
+            print('WARNING: the reader closed the output, stopping')
+            # keep the interpreter from complaining when it flushes stdout at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+        finally:
+            docs.shutdown()
+            if ids_file is not None:
+                ids_file.close()
+            if out is not sys.stdout:
+                out.close()
+        print(f'>>> Streamed {count:,} records to {output}')
+        docs.report()
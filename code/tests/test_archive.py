@@ -0,0 +1,79 @@
+import io, os, json, gzip, shutil, tarfile, tempfile, zipfile, unittest
+import archive
+
+
+NAMES = [f'5c02a2371faed6554886c8{number:02d}' for number in range(20)]
+
+
+def text(name: str) -> bytes:
+    return f'The text of {name}\n'.encode('utf8')
+
+
+def scpa(name: str) -> bytes:
+    return json.dumps({'title': name, 'sections': []}).encode('utf8')
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def members(self, names: list) -> list:
+        """Return the members with all text members first, as in xDD archives."""
+        return ([(f'topic/text/{name}.txt', text(name)) for name in names]
+                + [(f'topic/scienceparse/{name}_input.pdf.json', scpa(name))
+                   for name in names])
+
+    def tar(self, members: list) -> str:
+        path = os.path.join(self.tmp, 'topic.tar.gz')
+        with tarfile.open(path, 'w:gz') as tar:
+            for member_name, data in members:
+                info = tarfile.TarInfo(member_name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        return path
+
+    def zip(self, members: list) -> str:
+        path = os.path.join(self.tmp, 'topic.zip')
+        with zipfile.ZipFile(path, 'w') as zf:
+            for member_name, data in members:
+                zf.writestr(member_name, data)
+        return path
+
+    def assertPaired(self, documents, names: list):
+        documents = {identifier: (text_data, scpa_data)
+                     for identifier, text_data, scpa_data in documents}
+        self.assertEqual(sorted(documents), sorted(names))
+        for name in names:
+            self.assertEqual(documents[name], (text(name), scpa(name)))
+
+    def test_tar_pairs_members_over_the_limit(self):
+        path = self.tar(self.members(NAMES))
+        self.assertPaired(archive.documents(path, max_unpaired=3), NAMES)
+
+    def test_tar_gzipped_members(self):
+        members = [(member_name + '.gz', gzip.compress(data))
+                   for member_name, data in self.members(NAMES[:5])]
+        path = self.tar(members)
+        self.assertPaired(archive.documents(path, max_unpaired=2), NAMES[:5])
+
+    def test_tar_unpaired_members(self):
+        members = self.members(NAMES[:4])
+        # no ScienceParse member for the first document, no text for the last
+        del members[4]
+        del members[3]
+        path = self.tar(members)
+        documents = list(archive.documents(path, max_unpaired=1))
+        self.assertEqual(sorted(identifier for identifier, _, _ in documents), NAMES[:3])
+        self.assertIn((NAMES[0], text(NAMES[0]), None), documents)
+
+    def test_zip_pairs_members(self):
+        path = self.zip(self.members(NAMES))
+        self.assertPaired(archive.documents(path), NAMES)
+
+
+if __name__ == '__main__':
+    unittest.main()
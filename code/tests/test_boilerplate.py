@@ -0,0 +1,59 @@
+import os, tempfile, unittest
+from boilerplate import BoilerplateCounter, BoilerplateIndex
+
+
+RUNNING_HEAD = 'medRxiv preprint doi: https://doi.org/10.1101/2020.04.01.0001'
+
+
+def letters(number: int) -> str:
+    """Spell out a number in letters, since digits are normalized away."""
+    word = ''
+    while True:
+        number, digit = divmod(number, 26)
+        word += chr(ord('a') + digit)
+        if number == 0:
+            return word
+
+
+def document(i: int, lines: int = 20) -> str:
+    """Return a document with lines that are in no other document."""
+    return '\n'.join(f'line {letters(j)} of a document that only occurs once, {letters(i)}'
+                      for j in range(lines))
+
+
+class BoilerplateCounterTest(unittest.TestCase):
+
+    def test_counts_documents_not_lines(self):
+        counter = BoilerplateCounter()
+        counter.add_document('\n'.join([RUNNING_HEAD] * 5))
+        counter.add_document(RUNNING_HEAD)
+        (count, delta, _), = counter.counts.values()
+        self.assertEqual((count, delta), (2, 0))
+
+    def test_pruning_does_not_make_unique_lines_boilerplate(self):
+        counter = BoilerplateCounter(max_entries=2000)
+        for i in range(5050):
+            counter.add_document(document(i) + '\n' + RUNNING_HEAD)
+        self.assertGreater(counter.error, 10)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.tsv')
+            counter.save(path)
+            index = BoilerplateIndex(path, min_documents=10)
+        self.assertTrue(index.is_boilerplate(RUNNING_HEAD))
+        last = document(5049).split('\n')
+        self.assertFalse(any(index.is_boilerplate(line) for line in last))
+        self.assertEqual(len(index), 1)
+
+    def test_strip(self):
+        counter = BoilerplateCounter()
+        for i in range(3):
+            counter.add_document(f'{RUNNING_HEAD}\n\n{document(i)}')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.tsv')
+            counter.save(path)
+            index = BoilerplateIndex(path, min_documents=3)
+        self.assertEqual(index.strip(f'{RUNNING_HEAD}\n\nsome text'), 'some text')
+
+
+if __name__ == '__main__':
+    unittest.main()
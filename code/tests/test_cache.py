@@ -0,0 +1,78 @@
+import os, time, shutil, sqlite3, tempfile, unittest
+import cache
+from cache import ResultCache
+
+
+def result(name: str, size: int = 10) -> dict:
+    # random-looking text so that the compressed size grows with the size
+    text = ''.join(chr(97 + (i * 7919 + len(name)) % 26) for i in range(size))
+    return {'name': name, 'mode': 'text', 'scores': {}, 'morsels': {'title': text}}
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def total(self, results: ResultCache) -> int:
+        return results.connection.execute('SELECT TOTAL(size) FROM results').fetchone()[0]
+
+    def test_size_is_kept_up_to_date(self):
+        results = ResultCache(self.path)
+        for i in range(20):
+            results.put(f'key{i % 5}', result(f'doc{i}', 100 * i))
+        self.assertEqual(results.count(), 5)
+        self.assertEqual(results.size(), self.total(results))
+        results.connection.execute("DELETE FROM results WHERE key = 'key1'")
+        self.assertEqual(results.size(), self.total(results))
+        results.close()
+
+    def test_size_of_a_cache_without_stats(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE results ('
+                           ' key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)')
+        connection.execute("INSERT INTO results VALUES ('key', x'00', 1000, 0)")
+        connection.commit()
+        connection.close()
+        results = ResultCache(self.path)
+        self.assertEqual(results.size(), 1000)
+        results.close()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        results = ResultCache(self.path, max_bytes=10 ** 9)
+        for i in range(10):
+            results.put(f'key{i}', result(f'doc{i}', 1000))
+        time.sleep(0.01)
+        for i in range(5):
+            self.assertEqual(results.get(f'key{i}')['name'], f'doc{i}')
+        results.max_bytes = results.size() * 0.8
+        results.put('key10', result('doc10', 1000))
+        self.assertLessEqual(results.size(), results.max_bytes)
+        self.assertEqual(results.size(), self.total(results))
+        # the entries that were used are kept, the others go first
+        for i in range(5):
+            self.assertIsNotNone(results.get(f'key{i}'))
+        self.assertIsNone(results.get('key5'))
+        results.close()
+
+    def test_hits_are_written_in_batches(self):
+        results = ResultCache(self.path)
+        results.put('key', result('doc'))
+        last_used = 'SELECT last_used FROM results'
+        stored = results.connection.execute(last_used).fetchone()[0]
+        time.sleep(0.01)
+        for _ in range(cache.TOUCH_BATCH - 1):
+            results.get('key')
+        self.assertEqual(results.connection.execute(last_used).fetchone()[0], stored)
+        results.get('key')
+        self.assertGreater(results.connection.execute(last_used).fetchone()[0], stored)
+        self.assertEqual(results.touched, {})
+        results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
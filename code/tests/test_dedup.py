@@ -0,0 +1,99 @@
+import random, unittest
+import dedup
+from dedup import DuplicateDetector
+
+
+def words(seed: int, count: int = 1500) -> list:
+    rng = random.Random(seed)
+    return [f'word{rng.randrange(3000)}' for _ in range(count)]
+
+
+def content(tokens: list) -> str:
+    return '\n\n'.join(' '.join(tokens[i:i + 100]) for i in range(0, len(tokens), 100))
+
+
+def scattered_edits(tokens: list, seed: int, fraction: float = 0.02) -> list:
+    rng = random.Random(seed)
+    edited = list(tokens)
+    for i in rng.sample(range(len(tokens)), int(len(tokens) * fraction)):
+        edited[i] = f'edit{i}'
+    return edited
+
+
+def jaccard(first: str, second: str) -> float:
+    first, second = set(dedup.shingles(first)), set(dedup.shingles(second))
+    return len(first & second) / len(first | second)
+
+
+class DuplicateDetectorTest(unittest.TestCase):
+
+    def test_exact_duplicate(self):
+        detector = DuplicateDetector()
+        self.assertEqual(detector.add('doc1', content(words(1))), 'doc1')
+        self.assertEqual(detector.add('doc2', content(words(1))), 'doc1')
+        self.assertEqual(detector.duplicates, 1)
+
+    def test_clearly_distinct(self):
+        detector = DuplicateDetector()
+        for i in range(20):
+            self.assertEqual(detector.add(f'doc{i}', content(words(i))), f'doc{i}')
+        self.assertEqual(detector.duplicates, 0)
+
+    def test_near_duplicate_with_edits_in_one_place(self):
+        # like a preprint and the published version with another header
+        tokens = words(1)
+        edited = [f'header{i}' for i in range(30)] + tokens[30:]
+        detector = DuplicateDetector()
+        detector.add('doc1', content(tokens))
+        self.assertEqual(detector.add('doc2', content(edited)), 'doc1')
+
+    def test_near_duplicates_with_scattered_edits(self):
+        # changing 2% of the tokens changes about 10% of the shingles, so the
+        # Jaccard similarity is about 0.82, pairs are only missed if they share
+        # none of the bands
+        found = 0
+        for seed in range(20):
+            tokens = words(seed)
+            edited = scattered_edits(tokens, seed)
+            self.assertAlmostEqual(jaccard(content(tokens), content(edited)), 0.82, delta=0.02)
+            detector = DuplicateDetector()
+            detector.add('doc1', content(tokens))
+            found += detector.add('doc2', content(edited)) == 'doc1'
+        self.assertGreaterEqual(found, 18)
+
+    def test_similarity_estimate(self):
+        tokens = words(1)
+        for fraction in (0.0, 0.02, 0.1, 0.5):
+            edited = content(scattered_edits(tokens, 2, fraction))
+            detector = DuplicateDetector()
+            detector.add('doc1', content(tokens))
+            sketch = bytes(value & 0xff for value in dedup.signature(edited))
+            self.assertAlmostEqual(detector.similarity(sketch, 0),
+                                   jaccard(content(tokens), edited), delta=0.12)
+
+    def test_documents_shorter_than_the_shingle_size(self):
+        detector = DuplicateDetector()
+        self.assertEqual(len(list(dedup.shingles('three short words'))), 1)
+        self.assertEqual(detector.add('doc1', 'three short words'), 'doc1')
+        self.assertEqual(detector.add('doc2', 'Three  SHORT words\n'), 'doc1')
+        self.assertEqual(detector.add('doc3', 'three other words'), 'doc3')
+        self.assertEqual(detector.add('doc4', 'short\n\nwords'), 'doc4')
+
+    def test_empty_documents_are_not_duplicates(self):
+        detector = DuplicateDetector()
+        self.assertIsNone(dedup.signature(' \n\n '))
+        self.assertEqual(detector.add('doc1', ''), 'doc1')
+        self.assertEqual(detector.add('doc2', ' \n\n '), 'doc2')
+        self.assertEqual(detector.duplicates, 0)
+
+    def test_band_table_grows(self):
+        table = dedup.BandTable(capacity=4)
+        for key in range(1, 100):
+            self.assertEqual(table.setdefault(key * 7919, key), key)
+        for key in range(1, 100):
+            self.assertEqual(table.setdefault(key * 7919, 0), key)
+        self.assertEqual(len(table), 99)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import io, os, json, shutil, tempfile, contextlib, unittest
+from concurrent.futures import Future
+import document
+from cache import ResultCache
+
+
+class ProcessWithBudgetTest(unittest.TestCase):
+
+    TEXT = 'Introduction\n\nSome text about the climate that is long enough.\n'
+
+    def test_result(self):
+        result = document.process_with_budget('doc', self.TEXT, b'{}', time_budget=5)
+        self.assertFalse(document.is_failure(result))
+        self.assertEqual(result['name'], 'doc')
+
+    def test_deeply_nested_scienceparse_json(self):
+        scpa = ('{"a": ' + '[' * 100000 + ']' * 100000 + '}').encode('ascii')
+        for content in (self.TEXT, self.TEXT.encode('ascii')):
+            result = document.process_with_budget('doc', content, scpa, time_budget=5)
+            self.assertEqual(result['error'], 'recursion')
+
+    def test_invalid_scienceparse_json(self):
+        result = document.process_with_budget('doc', self.TEXT, b'{"sections": [')
+        self.assertEqual(result['error'], 'exception')
+        self.assertTrue(result['message'].startswith('JSONDecodeError'))
+
+    def test_failures_are_quarantined(self):
+        docs = document.Documents.__new__(document.Documents)
+        docs.set_options()
+        entry = {'name': 'doc', 'error': 'recursion', 'stages': {'json': 0.1}}
+        self.assertIsNone(docs.handle_failure('doc', entry))
+        self.assertEqual(docs.quarantine.entries[0]['stages'], {'json': 0.1})
+
+
+
+class PendingExecutor:
+
+    """An executor that never runs anything, the test sets the results."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+class InFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.docs = document.Documents.__new__(document.Documents)
+        self.docs.set_options(cache=ResultCache(os.path.join(self.tmp, 'cache.db')))
+
+    def tearDown(self):
+        self.docs.cache.close()
+        shutil.rmtree(self.tmp)
+
+    def test_documents_with_the_same_content_share_one_parse(self):
+        executor = PendingExecutor()
+        first = self.docs.submit('doc1', b'text', b'', executor)
+        second = self.docs.submit('doc2', b'text', b'', executor)
+        self.assertEqual(len(executor.futures), 1)
+        result = {'name': 'doc1', 'mode': 'text', 'scores': {}, 'morsels': {'title': None}}
+        first.set_result(result)
+        self.assertTrue(second.done())
+        results = {'doc2': self.docs.finish('doc2', second.result()),
+                   'doc1': self.docs.finish('doc1', first.result())}
+        self.assertEqual(results['doc1']['name'], 'doc1')
+        self.assertEqual(results['doc2']['name'], 'doc2')
+        self.assertIsNot(results['doc1']['morsels'], results['doc2']['morsels'])
+        # the result that both got was not changed
+        self.assertEqual(result, {'name': 'doc1', 'mode': 'text', 'scores': {},
+                                  'morsels': {'title': None}})
+
+    def test_cached_result_gets_the_name_of_the_document(self):
+        key = self.docs.cache.key(b'text', b'', self.docs.cache_version())
+        self.docs.cache.put(key, {'name': 'doc1', 'mode': 'text', 'scores': {},
+                                  'morsels': {'title': None}})
+        future = self.docs.submit('doc2', b'text', b'', PendingExecutor())
+        self.assertEqual(self.docs.finish('doc2', future.result())['name'], 'doc2')
+
+
+class WriteMorselsTest(unittest.TestCase):
+
+    MORSELS = {'title': 'A study',
+               'abstract': {'source': 'scpa', 'abstract': 'An abstract ' * 10},
+               'sections': [{'source': 'text', 'heading': None, 'text': 'A section'}]}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_text_size_counts_the_abstract_text(self):
+        self.assertEqual(document.text_size(self.MORSELS), 120 + 9)
+        self.assertEqual(document.text_size({'title': None, 'abstract': None}), 0)
+
+    def test_streamed_output_is_the_same(self):
+        out_file = os.path.join(self.tmp, 'doc.json')
+        for stream_size in (None, 0):
+            size = document.write_morsels(out_file, self.MORSELS, stream_size)
+            with open(out_file) as fh:
+                output = fh.read()
+            self.assertEqual(output, json.dumps(self.MORSELS, indent=4))
+            self.assertEqual(size, len(output))
+        self.assertEqual(os.listdir(self.tmp), ['doc.json'])
+
+
+class BytesModeTest(unittest.TestCase):
+
+    TEXT = (b'A study of the climate\n\nAbstract\n\nWe model the climate of the last'
+            b' century with a simple model and compare the results with the records.\n\n'
+            b'1 Introduction\n\nThe climate of the last century was warmer than the'
+            b' climate of the century before that, as the records of the stations show.\n'
+            b'+++ 12 34 56 x y z\n\nmedRxiv preprint\n')
+
+    TEXTS = {'plain': TEXT,
+             'crlf': TEXT.replace(b'\n', b'\r\n'),
+             'cr': TEXT.replace(b'\n', b'\r'),
+             'utf8': TEXT.replace(b'climate', 'clim\u00e2te'.encode('utf8')),
+             'separator': TEXT.replace(b'x y z', b'x\x1cy z'),
+             'invalid': TEXT.replace(b'simple', b'simp\xffle'),
+             'invalid crlf': TEXT.replace(b'\n', b'\r\n') + b'\xc3',
+             'empty': b''}
+
+    SCPA = {'none': b'',
+            'scpa': json.dumps({'metadata': {
+                'title': 'A study', 'abstractText': 'An abstract.',
+                'sections': [{'heading': 'One', 'text': 'The climate was warmer.'},
+                             {'heading': 'Two', 'text': 'The model was simple.'}]}}).encode()}
+
+    def results(self, text: bytes, scpa: bytes, **options) -> tuple:
+        """Return the result and the quarantine of a document in text mode and in
+        bytes mode."""
+        results = []
+        for bytes_mode in (False, True):
+            docs = document.Documents.__new__(document.Documents)
+            docs.set_options(bytes_mode=bytes_mode, **options)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = docs.process('doc', text, scpa)
+            results.append((result, [entry['error'] for entry in docs.quarantine.entries]))
+        return results
+
+    def test_bytes_mode_gives_the_same_output(self):
+        for text_name, text in self.TEXTS.items():
+            for scpa_name, scpa in self.SCPA.items():
+                for errors in ('replace', 'strict'):
+                    for options in ({}, {'trim_lines': True}, {'abstract_only': True}):
+                        text_mode, bytes_mode = self.results(
+                            text, scpa, encoding_errors=errors, **options)
+                        self.assertEqual(text_mode, bytes_mode,
+                                         (text_name, scpa_name, errors, options))
+
+    def test_invalid_bytes_with_strict_errors_are_quarantined(self):
+        for text in (self.TEXTS['invalid'], self.TEXTS['invalid crlf']):
+            for bytes_mode in self.results(text, b'', encoding_errors='strict'):
+                self.assertEqual(bytes_mode, (None, ['encoding']))
+        text_mode, bytes_mode = self.results(self.TEXTS['invalid'], b'')
+        self.assertIn('simp\ufffdle', json.dumps(bytes_mode[0]['morsels'], ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
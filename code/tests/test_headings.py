@@ -0,0 +1,65 @@
+import unittest
+import headings
+import verify
+
+
+NUMBERED = ['1 Introduction', '1. Introduction', '2.1 Methods', '2.1. Methods', '10 Results',
+            '12.3.4 Discussion', '  3 Conclusions', 'IV. RESULTS', 'XII. References',
+            'A. Methods', 'a. methods', 'IV Results', '1Introduction', '1 . Introduction',
+            '1.. Methods', '2.x Methods', 'Z. Conclusion', 'AB. Methods', '3)Results']
+
+ALL_CAPS = ['ABSTRACT', 'INTRODUCTION', 'MATERIALS AND METHODS', 'RESULTS AND DISCUSSION',
+            'A B S T R A C T', 'R E S U L T S', 'KEY WORDS', 'KEYWORDS', 'LITERATURE  CITED',
+            'ACKNOWLEDGMENTS', 'CONCLUSIONS', 'ABSTRACTS', 'RESULTSX', 'AB STRACT',
+            'ABSTRACT OF THE THESIS', 'I N T R O D U C T I O N', 'METHODS AND MATERIALS']
+
+TRAILING_COLON = ['Abstract:', 'Abstract :', 'ABSTRACT:', 'Abstract.', 'Abstract: ',
+                  'Abstract: We study the climate', 'ABSTRACT:We study', 'Abstract :we',
+                  'Results:', 'Results and discussion: the model', 'Key words: climate',
+                  'Methods - we used', 'Methods-we used', 'Methods — we used', 'Methods –',
+                  'Abstract::', 'Abstract:.', 'Abstract; we', 'Abstract,', 'Abstract - ']
+
+
+class HeadingsTest(unittest.TestCase):
+
+    def assertSameHeadings(self, lines: list):
+        for line in lines:
+            expected = verify.baseline_headings(line)
+            self.assertEqual(headings.find_headings(line), expected, line)
+            if line.isascii():
+                self.assertEqual(headings.find_headings(line.encode('ascii')), expected, line)
+        content = '\n'.join(lines)
+        self.assertEqual(headings.find_headings(content), verify.baseline_headings(content))
+
+    def test_numbered_headings(self):
+        self.assertSameHeadings(NUMBERED)
+        self.assertEqual([h.label for h in headings.find_headings('\n'.join(NUMBERED[:11]))],
+                         ['introduction', 'introduction', 'methods', 'methods', 'results',
+                          'discussion', 'conclusions', 'results', 'references', 'methods',
+                          'methods'])
+        # roman numbers need a period
+        self.assertEqual(headings.find_headings('IV Results'), [])
+
+    def test_all_caps_headings(self):
+        self.assertSameHeadings(ALL_CAPS)
+        self.assertEqual(headings.find_headings('MATERIALS AND METHODS'),
+                         [headings.Heading('methods', 0, 21)])
+
+    def test_trailing_colon(self):
+        self.assertSameHeadings(TRAILING_COLON)
+        # the heading ends where the text after the colon starts
+        heading, = headings.find_headings('Abstract: We study the climate')
+        self.assertEqual(heading.end, len('Abstract: '))
+
+    def test_lines_with_only_abstract_are_still_found(self):
+        # these are the lines that the scan before headings.py recognized
+        for line in ('abstract', 'Abstract', 'ABSTRACT', 'AbStRaCt'):
+            content = f'A title\n\n{line}\nWe study the climate.\n\nIntroduction'
+            found = headings.find_headings(content)
+            self.assertEqual(found[0].label, 'abstract')
+            heading, (start, end) = headings.first_abstract_span(content, found)
+            self.assertEqual(content[start:end], 'We study the climate.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import random, unittest
+from unittest import mock
+import ids
+from ids import IdSet
+
+
+def identifiers(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [f'{rng.getrandbits(96):024x}' for _ in range(count)]
+
+
+# names of other lengths, with upper case and with letters that are not hexadecimal
+OTHERS = ['5c02a2371faed6554886c81', '5c02a2371faed6554886c8140',
+          '5C02A2371FAED6554886C814', 'test-document', '', 'g' * 24]
+
+
+class IdSetTest(unittest.TestCase):
+
+    def test_membership(self):
+        names = identifiers(100) + OTHERS
+        id_set = IdSet(names)
+        self.assertEqual(len(id_set), len(names))
+        for name in names:
+            self.assertIn(name, id_set)
+        for name in identifiers(10, seed=1) + ['5c02a2371faed6554886c814', 'other']:
+            self.assertNotIn(name, id_set)
+        self.assertEqual(list(id_set), sorted(names))
+
+    def test_other_names(self):
+        id_set = IdSet(identifiers(5) + OTHERS)
+        self.assertEqual(id_set.others, sorted(OTHERS))
+        self.assertEqual(len(id_set.buffer), 5 * ids.ID_SIZE)
+        self.assertEqual(IdSet(OTHERS).buffer, b'')
+
+    def test_duplicates(self):
+        names = identifiers(10)
+        self.assertEqual(len(IdSet(names + names[:5] + OTHERS + OTHERS[:2])), 10 + len(OTHERS))
+
+    def test_merge_of_chunks(self):
+        names = identifiers(50)
+        with mock.patch.object(ids, 'CHUNK_SIZE', 7):
+            # duplicates end up in different chunks
+            id_set = IdSet(names + list(reversed(names)))
+        self.assertEqual(list(id_set), sorted(names))
+        self.assertEqual(len(id_set), 50)
+        self.assertEqual(ids._merge([b'', b'']), b'')
+
+    def test_difference(self):
+        names = identifiers(40) + OTHERS
+        first = IdSet(names[:30] + OTHERS[:4])
+        second = IdSet(names[20:] + OTHERS[2:])
+        self.assertEqual(list(first.difference(second)),
+                         sorted(set(names[:30] + OTHERS[:4]) - set(names[20:] + OTHERS[2:])))
+        self.assertEqual(list(first.difference(IdSet())), list(first))
+        self.assertEqual(list(IdSet().difference(first)), [])
+        self.assertEqual(len(first.difference(first)), 0)
+
+    def test_sample(self):
+        names = identifiers(30) + OTHERS
+        id_set = IdSet(names)
+        sample = id_set.sample(10, random.Random(1))
+        self.assertEqual(len(set(sample)), 10)
+        self.assertTrue(set(sample) <= set(names))
+        self.assertEqual(sample, id_set.sample(10, random.Random(1)))
+
+    def test_sample_of_all_names(self):
+        names = identifiers(10) + OTHERS
+        id_set = IdSet(names)
+        for k in (len(names), len(names) + 1, 1000):
+            self.assertEqual(sorted(id_set.sample(k, random.Random(1))), sorted(names))
+        self.assertEqual(IdSet().sample(5), [])
+
+    def test_index(self):
+        id_set = IdSet(identifiers(3) + ['other'])
+        self.assertEqual([id_set[i] for i in range(4)], sorted(identifiers(3)) + ['other'])
+        self.assertEqual(id_set[-1], 'other')
+        with self.assertRaises(IndexError):
+            id_set[4]
+
+
+if __name__ == '__main__':
+    unittest.main()
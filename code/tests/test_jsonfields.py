@@ -0,0 +1,120 @@
+import json, unittest
+from unittest import mock
+import jsonfields
+
+
+def expected(text: str, path: list, keys: list, lengths: dict = None) -> dict:
+    """The fields taken from the result of json.loads()."""
+    value = json.loads(text)
+    for step in path:
+        value = value.get(step) if isinstance(value, dict) else None
+    value = value if isinstance(value, dict) else {}
+    fields = {key: value.get(key) for key in keys}
+    for key, member in (lengths or {}).items():
+        items = value.get(key)
+        fields[key] = None if not isinstance(items, list) else [
+            len(item[member]) if isinstance(item, dict) and isinstance(item.get(member), str)
+            else None
+            for item in items]
+    return fields
+
+
+def metadata(**members) -> str:
+    return json.dumps({'name': 'doc.pdf', 'metadata': members})
+
+
+DOCUMENTS = [
+    metadata(title='A study', abstractText='We study it.', sections=[]),
+    # escapes in skipped and in decoded strings
+    metadata(source='say \"hi\" \\ \\\\', title='The \"climate\" \\ model\\',
+             abstractText='café \U0001F600 \\u00e9', sections=[
+                 {'heading': 'A', 'text': 'one \"two\" \\\\ three'},
+                 {'heading': 'B', 'text': 'café \U0001F600'},
+                 {'heading': 'C', 'text': '\\'}]),
+    '{"metadata": {"title": "\\u0041 \\ud83d\\ude00 \\"x\\" \\\\",'
+    ' "sections": [{"text": "\\ud83d\\ude00\\n\\t\\"\\\\"}, {"text": "\\\\\\""}],'
+    ' "abstractText": "\\/"}}',
+    # nested objects and arrays that are skipped
+    metadata(authors=[{'name': 'A', 'affiliations': [{'x': [1, [2, {'y': '}]'}]]}]}],
+             references=[{'title': '{"title": "fake"}', 'year': 2000}] * 3,
+             title='Real', abstractText=None,
+             sections=[{'heading': None, 'text': 'x', 'nested': {'text': 'deeper'}}]),
+    # null and numbers
+    metadata(title=None, abstractText=None, sections=None, year=2019, score=-1.5e-3),
+    metadata(title=12, abstractText=0.5, sections=[{'text': None}, {'text': 3}, {}]),
+    metadata(title=True, abstractText=False, sections='abc'),
+    metadata(sections=[1, {'text': 'abc'}]),
+    '{"metadata": {"title": null, "year": 2019, "x": -0.0, "y": 1E+2, "sections": null}}',
+    # keys with escapes, white space
+    '{ "meta\\u0064ata" : { "ti\\u0074le" :"T" , "abstractText":"A",'
+    '\n\t"sections" : [ { "text" : "abc" } , { "heading":"h" } ] } }',
+    # the path or the keys are missing
+    json.dumps({'name': 'doc.pdf'}),
+    json.dumps({'metadata': {}}),
+    json.dumps({'metadata': None}),
+    json.dumps({'metadata': [1, 2]}),
+    json.dumps({'metadata': {'title': 'T', 'sections': []}, 'after': {'title': 'U'}}),
+    json.dumps([1, 2]),
+    # duplicate keys, the last one wins
+    '{"metadata": {"title": "first", "title": "second", "sections": [],'
+    ' "sections": [{"text": "ab"}]}}',
+    '{"metadata": {"title": "first", "abstractText": "A"}, "metadata": {"title": "second"}}',
+    '{"metadata": {"title": "first"}, "name": "x", "metadata": null}',
+]
+
+MALFORMED = [
+    '{"metadata": {"title": "A study", "sections": [{"text": "ab',
+    '{"metadata": {"title": "A study"',
+    '{"metadata": {"title": "A study"}',
+    '{"metadata": {"title": "A study",}}',
+    '{"metadata": {"title" "A study"}}',
+    '{"metadata": {"title": "A study"}} extra',
+    '{"metadata": {"title": "A \\"study}}',
+    '{"metadata": {"title": tru}}',
+    '{"metadata": ',
+]
+
+
+class ExtractTest(unittest.TestCase):
+
+    KEYS = ['title', 'abstractText']
+    LENGTHS = {'sections': 'text'}
+
+    def test_same_as_json_loads(self):
+        for text in DOCUMENTS:
+            self.assertEqual(jsonfields.extract(text, ['metadata'], self.KEYS, self.LENGTHS),
+                             expected(text, ['metadata'], self.KEYS, self.LENGTHS), text)
+            self.assertEqual(jsonfields.extract(text, ['metadata'], self.KEYS + ['sections']),
+                             expected(text, ['metadata'], self.KEYS + ['sections']), text)
+            self.assertEqual(jsonfields.extract(text, [], ['metadata', 'name']),
+                             expected(text, [], ['metadata', 'name']), text)
+
+    def test_fallback_to_json_loads(self):
+        # only documents where the path does not lead to an object or where the
+        # sections are not objects are decoded with json.loads()
+        for text in DOCUMENTS + [json.dumps({'metadata': {'sections': [1, 2]}})]:
+            value = json.loads(text)
+            found = value.get('metadata', {}) if isinstance(value, dict) else None
+            sections = found.get('sections') if isinstance(found, dict) else None
+            fallback_expected = not isinstance(found, dict) or not (
+                sections is None or all(isinstance(item, dict) for item in sections))
+            with mock.patch.object(jsonfields, '_extract_from_json',
+                                   wraps=jsonfields._extract_from_json) as fallback:
+                fields = jsonfields.extract(text, ['metadata'], self.KEYS, self.LENGTHS)
+            self.assertEqual(fallback.called, fallback_expected, text)
+            self.assertEqual(fields, expected(text, ['metadata'], self.KEYS, self.LENGTHS))
+
+    def test_malformed_json(self):
+        for text in MALFORMED:
+            with self.assertRaises(json.JSONDecodeError):
+                json.loads(text)
+            with self.assertRaises(json.JSONDecodeError, msg=text):
+                jsonfields.extract(text, ['metadata'], self.KEYS, self.LENGTHS)
+
+    def test_empty_document(self):
+        self.assertEqual(jsonfields.extract('', ['metadata'], self.KEYS, self.LENGTHS),
+                         {'title': None, 'abstractText': None, 'sections': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
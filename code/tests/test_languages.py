@@ -0,0 +1,64 @@
+import unittest
+from collections import Counter
+import utils
+import document
+import languages
+import verify
+
+
+TEXTS = {
+    'english': 'we model the climate of the last century with a simple model',
+    'mixed': 'the climate der Klimawandel und die Erde le climat de la terre el clima'
+             ' de la tierra in het klimaat',
+    'scripts': 'the climate климат изменение 気候変動 の 研究 تغير المناخ κλίμα und die'
+               ' 🌍 🌡️ de la',
+    # unassigned, private use, replacement and combining characters, a decomposed
+    # e with acute accent, a lone surrogate and control characters
+    'unknown': '\U0010ffff \U000e0001 \ue000 \ufffd \u200d \u0301 e\u0301 caf\u00e9'
+               ' cafe\u0301 \ud800 the \x00 \x1c',
+    'overlap': 'de in de in a e o en en die die',
+    'empty': '',
+}
+
+
+class LanguageTableTest(unittest.TestCase):
+
+    def assertSameScores(self, word_lists: dict, tokens: Counter):
+        table = languages.LanguageTable(word_lists)
+        baseline = verify.BaselineLanguageTable(word_lists)
+        scores = table.scores(tokens)
+        self.assertEqual(scores, {language: utils.language_score(tokens, words)
+                                  for language, words in word_lists.items()})
+        self.assertEqual(table.best(scores), baseline.best(baseline.scores(tokens)))
+
+    def test_same_as_language_score(self):
+        for name, text in TEXTS.items():
+            with self.subTest(name):
+                self.assertSameScores(document.FREQUENT_WORDS, Counter(text.split()))
+
+    def test_bytes_tokens(self):
+        word_lists = {language: {word.encode('utf-8') for word in words}
+                      for language, words in document.FREQUENT_WORDS.items()}
+        for name, text in TEXTS.items():
+            with self.subTest(name):
+                data = text.encode('utf-8', 'surrogatepass')
+                self.assertSameScores(word_lists, Counter(data.split()))
+        self.assertSameScores(word_lists, Counter(b'\xff\xfe de \xc3 the \x80'.split()))
+
+    def test_unknown_code_points_are_not_frequent_words(self):
+        table = languages.LanguageTable(document.FREQUENT_WORDS)
+        scores = table.scores(Counter(TEXTS['unknown'].split()))
+        self.assertEqual(scores['en'], 1 / len(TEXTS['unknown'].split()))
+        self.assertEqual(table.best(table.scores(Counter('\U0010ffff \ufffd'.split()))),
+                         (None, 0.0))
+
+    def test_ties_go_to_the_first_language(self):
+        word_lists = {'en': {'de', 'the'}, 'fr': {'de', 'la'}, 'es': {'de', 'la'}}
+        table = languages.LanguageTable(word_lists)
+        for text in ('de', 'la de', 'the la', 'el'):
+            self.assertSameScores(word_lists, Counter(text.split()))
+        self.assertEqual(table.best(table.scores(Counter(['la']))), ('fr', 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
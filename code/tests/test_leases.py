@@ -0,0 +1,56 @@
+import os, json, time, shutil, tempfile, unittest
+from unittest import mock
+import leases
+from leases import Coordinator
+
+
+class ReclaimTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.first = self.coordinator('first')
+        self.second = self.coordinator('second')
+        # an expired lease of a process that died
+        self.path = self.first.lease_file(0)
+        with open(self.path, 'w') as fh:
+            json.dump({'owner': 'dead', 'batch': 0, 'claimed': 0}, fh)
+        os.utime(self.path, (0, 0))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def coordinator(self, owner: str) -> Coordinator:
+        coordinator = Coordinator(self.tmp, timeout=60)
+        coordinator.owner = owner
+        return coordinator
+
+    def test_expired_lease_is_reclaimed(self):
+        lease = self.second.reclaim(0, time.time())
+        self.assertIsNotNone(lease)
+        self.assertEqual(leases.lease_owner(self.path), 'second')
+        self.assertIsNone(self.first.reclaim(0, time.time()))
+        lease.release()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_only_one_process_reclaims_an_expired_lease(self):
+        rename = os.rename
+        leases_of_first = []
+
+        def rename_after_the_first_reclaims(source, target):
+            # the first process reclaims the batch after the second saw the
+            # expired lease but before it renames the lease file
+            if target.endswith('-second') and not leases_of_first:
+                leases_of_first.append(self.first.reclaim(0, time.time()))
+            rename(source, target)
+
+        with mock.patch.object(leases.os, 'rename', rename_after_the_first_reclaims):
+            lease = self.second.reclaim(0, time.time())
+        self.assertIsNone(lease)
+        self.assertIsNotNone(leases_of_first[0])
+        self.assertEqual(leases.lease_owner(self.path), 'first')
+        self.assertEqual(os.listdir(self.first.lease_dir), ['0.lease'])
+        leases_of_first[0].release()
+
+
+if __name__ == '__main__':
+    unittest.main()
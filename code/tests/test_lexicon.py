@@ -0,0 +1,74 @@
+import os, shutil, tempfile, unittest
+from collections import Counter
+import lexicon
+from lexicon import CountMinSketch, TokenCounter
+
+
+def documents(count: int) -> list:
+    """Return documents where word i occurs i + 1 times in every tenth document."""
+    words = ['w' + 'abcdefghij'[i % 10] + 'abcdefghij'[i // 10] for i in range(100)]
+    return [' '.join(word for i, word in enumerate(words) if d % 10 == i % 10
+                     for _ in range(i + 1)) + ' The 123 x'
+            for d in range(count)]
+
+
+class CountMinSketchTest(unittest.TestCase):
+
+    def test_estimates_are_never_too_low(self):
+        sketch = CountMinSketch(width=64, depth=3)
+        counts = Counter({f'token{i}': i % 7 + 1 for i in range(500)})
+        for token, count in counts.items():
+            sketch.add(token, count)
+        self.assertEqual(sketch.total, sum(counts.values()))
+        for token, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(token), count)
+
+    def test_merge_adds_the_counts(self):
+        first, second, both = (CountMinSketch(width=64, depth=3) for _ in range(3))
+        for i in range(200):
+            (first if i % 2 else second).add(f'token{i % 50}', i)
+            both.add(f'token{i % 50}', i)
+        first.merge(second)
+        self.assertEqual(first.table, both.table)
+        self.assertEqual(first.total, both.total)
+        with self.assertRaises(ValueError):
+            first.merge(CountMinSketch(width=32, depth=3))
+
+
+class TokenCounterTest(unittest.TestCase):
+
+    def test_heavy_hitters(self):
+        counter = TokenCounter(width=4096, flush_size=20, candidates=30)
+        for content in documents(100):
+            counter.add_document(content)
+        common = counter.most_common(5)
+        # each of the words counts (i + 1) * 10, only lower-case words are kept
+        self.assertEqual(common, [('wjj', 1000), ('wij', 990), ('whj', 980),
+                                  ('wgj', 970), ('wfj', 960)])
+
+    def test_merged_counters_agree_with_one_counter(self):
+        one = TokenCounter(width=4096, flush_size=20, candidates=30)
+        parts = [TokenCounter(width=4096, flush_size=20, candidates=30) for _ in range(3)]
+        for i, content in enumerate(documents(90)):
+            one.add_document(content)
+            parts[i % 3].add_document(content)
+        for other in parts[1:]:
+            parts[0].merge(other)
+        self.assertEqual(parts[0].documents, 90)
+        self.assertEqual(parts[0].most_common(10), one.most_common(10))
+
+    def test_save_and_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            counter = TokenCounter(width=4096)
+            for content in documents(20):
+                counter.add_document(content)
+            path = os.path.join(tmp, 'lexicon.tsv')
+            counter.save(path, 3)
+            self.assertEqual(lexicon.load(path), {'wjj', 'wij', 'whj'})
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
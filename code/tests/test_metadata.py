@@ -0,0 +1,68 @@
+import os, json, shutil, tempfile, unittest
+import metadata
+from metadata import MetadataIndex
+
+
+RECORDS = [
+    {'_gddid': '5c02a2371faed6554886c811', 'title': 'Über das Klima',
+     'journal': {'name': 'Klimaforschung'}, 'year': '2019',
+     'identifier': [{'type': 'doi', 'id': '10.1000/1'}]},
+    {'_gddid': 'not-an-id', 'title': 'Skipped'},
+    {'_gddid': '5c02a2371faed6554886c813', 'title': 'A string with ] and , and "quotes"',
+     'journal': 'Climate', 'year': '2020', 'authors': ['Ω ' * 50]},
+    {'_gddid': '5c02a2371faed6554886c812', 'title': 'Climate 🌍', 'year': '2021'},
+    {'_gddid': '5c02a2371faed6554886c811', 'title': 'A duplicate'}]
+
+
+class MetadataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'metadata.json')
+        with open(self.path, 'w', encoding='utf-8') as fh:
+            fh.write('[\n  ' + ',\n  '.join(json.dumps(record, ensure_ascii=False)
+                                           for record in RECORDS) + '\n]\n')
+        with open(self.path, 'rb') as fh:
+            self.data = fh.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_records_offsets(self):
+        # small chunks split records and the bytes of multi-byte characters
+        for chunk_size in (1, 2, 3, 7, 64, 1024 ** 2):
+            found = list(metadata.records(self.path, chunk_size))
+            self.assertEqual([record for record, _, _ in found], RECORDS)
+            for record, offset, length in found:
+                self.assertEqual(json.loads(self.data[offset:offset + length]), record)
+
+    def test_not_a_list(self):
+        for content in ('{"_gddid": 1}', '[{"_gddid": 1}', '[1, 2]'):
+            with open(self.path, 'w') as fh:
+                fh.write(content)
+            with self.assertRaises(ValueError):
+                list(metadata.records(self.path, 4))
+
+    def test_index(self):
+        index = MetadataIndex(self.path)
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.skipped, 1)
+        self.assertEqual(index.get('5c02a2371faed6554886c811'), RECORDS[0])
+        self.assertIsNone(index.get('5c02a2371faed6554886c819'))
+        self.assertIsNone(index.get('not-an-id'))
+        self.assertEqual(index.fields('5c02a2371faed6554886c811'),
+                         {'doi': '10.1000/1', 'journal': 'Klimaforschung', 'year': '2019'})
+        self.assertEqual(index.fields('5c02a2371faed6554886c813')['journal'], 'Climate')
+        self.assertEqual(index.select(['5c02a2371faed6554886c812', '5c02a2371faed6554886c813']),
+                         [RECORDS[2], RECORDS[3]])
+        index.close()
+        # the saved index is used by the next run
+        again = MetadataIndex(self.path)
+        self.assertEqual(again.skipped, 0)
+        self.assertEqual(again.entries, index.entries)
+        self.assertEqual(again.get('5c02a2371faed6554886c812'), RECORDS[3])
+        again.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
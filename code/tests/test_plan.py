@@ -0,0 +1,98 @@
+import io, os, shutil, tempfile, contextlib, unittest
+import document
+import plan
+
+
+TEXT = b'Introduction\n\nSome text about the climate of the last century.\n'
+
+# text and ScienceParse file for each document
+FILES = {'5c02a2371faed6554886c801': (TEXT, b'{}'),
+         '5c02a2371faed6554886c802': (TEXT, b'{"metadata": '),
+         '5c02a2371faed6554886c803': (b'\xff\xfe' + TEXT, None),
+         '5c02a2371faed6554886c804': (b'', None)}
+
+
+class QuantileIntervalTest(unittest.TestCase):
+
+    def test_interval_contains_the_quantile(self):
+        values = list(range(100))
+        low, p95, high = plan.quantile_interval(values, 0.95)
+        self.assertEqual(p95, 95)
+        self.assertEqual((low, high), (90, 99))
+
+    def test_small_sample(self):
+        self.assertEqual(plan.quantile_interval([3.0], 0.95), (3.0, 3.0, 3.0))
+        self.assertEqual(plan.quantile_interval([1, 2], 0.5), (1, 2, 2))
+
+
+class EstimateTest(unittest.TestCase):
+
+    def test_complete_sample_has_no_margin(self):
+        estimate = plan.Estimate([(2, [1.0, 3.0]), (3, [2.0, 2.0, 5.0])])
+        self.assertEqual(estimate.total, 13.0)
+        self.assertEqual(estimate.margin, 0.0)
+        self.assertEqual(estimate.mean(), (2.6, 0.0))
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp, 'text'))
+        os.mkdir(os.path.join(self.tmp, 'scpa'))
+        for name, (text, scpa) in FILES.items():
+            with open(os.path.join(self.tmp, 'text', f'{name}.txt'), 'wb') as fh:
+                fh.write(text)
+            if scpa is not None:
+                with open(os.path.join(self.tmp, 'scpa', f'{name}_input.pdf.json'), 'wb') as fh:
+                    fh.write(scpa)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def documents(self, names=FILES, **options) -> document.Documents:
+        file_list = os.path.join(self.tmp, 'files.txt')
+        with open(file_list, 'w') as fh:
+            fh.write(f"# TEXT\t{os.path.join(self.tmp, 'text')}\n")
+            fh.write(f"# SCPA\t{os.path.join(self.tmp, 'scpa')}\n")
+            fh.writelines(f'{name}\n' for name in names)
+        return document.Documents(file_list, None, None, **options)
+
+    def plan(self, docs) -> str:
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            plan.plan(docs, seed=1)
+        return output.getvalue()
+
+    def test_failures_are_measured(self):
+        docs = self.documents()
+        self.assertEqual(plan.measure(docs, '5c02a2371faed6554886c801')['mode'], 'text')
+        self.assertEqual(plan.measure(docs, '5c02a2371faed6554886c802')['error'], 'exception')
+        self.assertNotIn('error', plan.measure(docs, '5c02a2371faed6554886c803'))
+
+    def test_encoding_errors(self):
+        for bytes_mode in (False, True):
+            docs = self.documents(encoding_errors='strict', bytes_mode=bytes_mode)
+            self.assertEqual(plan.measure(docs, '5c02a2371faed6554886c803')['error'], 'encoding')
+            self.assertNotIn('error', plan.measure(docs, '5c02a2371faed6554886c801'))
+
+    def test_empty_documents_have_no_memory_ratio(self):
+        measurement = plan.measure(self.documents(), '5c02a2371faed6554886c804')
+        self.assertEqual(measurement['size'], 0)
+        self.assertFalse(plan.has_memory_ratio(measurement))
+
+    def test_plan_counts_failures(self):
+        output = self.plan(self.documents(encoding_errors='strict'))
+        self.assertIn('>>> failures: 50.0% ± 0.0% of the documents cannot be parsed'
+                      ' (encoding, exception)', output)
+        self.assertIn('>>> memory: peak is', output)
+        self.assertIn('>>> mode text   25.0%', output)
+
+    def test_plan_without_memory_ratios(self):
+        docs = self.documents(['5c02a2371faed6554886c802', '5c02a2371faed6554886c804'])
+        output = self.plan(docs)
+        self.assertIn('WARNING: no document in the sample has a memory ratio', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import time, unittest
+from unittest import mock
+import scheduler
+from scheduler import Scheduler, MEMORY_FACTOR
+
+
+def sleep_job(name: str, seconds: float) -> str:
+    time.sleep(seconds)
+    return name
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def run_jobs(self, scheduler, jobs, durations):
+        def submit(executor, name):
+            return executor.submit(sleep_job, name, durations.get(name, 0.0))
+        try:
+            return list(scheduler.run(jobs, submit))
+        finally:
+            scheduler.shutdown()
+
+    def test_all_jobs_are_done(self):
+        jobs = [(f'doc{i}', i * 100) for i in range(20)]
+        results = self.run_jobs(Scheduler(2), jobs, {})
+        self.assertEqual(sorted(name for name, _ in results), sorted(name for name, _ in jobs))
+        self.assertTrue(all(name == result for name, result in results))
+
+    def test_queued_jobs_do_not_time_out(self):
+        # with one worker the second job waits in the queue of the pool while the
+        # first one is stuck, only the first one should time out
+        scheduler = Scheduler(1, hard_timeout=1.0, on_failure=lambda name, reason: reason)
+        jobs = [('stuck', 200), ('queued', 100)]
+        results = dict(self.run_jobs(scheduler, jobs, {'stuck': 30.0, 'queued': 0.8}))
+        self.assertEqual(results, {'stuck': 'timeout', 'queued': 'queued'})
+
+    def test_timeout_without_access_to_the_workers(self):
+        # without the private _processes of the pool the stuck worker cannot be
+        # killed, the scheduler should still give up on it
+        scheduler_ = Scheduler(1, hard_timeout=0.5, on_failure=lambda name, reason: reason)
+        jobs = [('stuck', 200), ('other', 100)]
+        with mock.patch.object(scheduler.TimedExecutor, '_processes', None):
+            results = dict(self.run_jobs(scheduler_, jobs, {'stuck': 3.0}))
+        self.assertEqual(results, {'stuck': 'timeout', 'other': 'other'})
+
+    def test_huge_documents_do_not_hold_up_other_results(self):
+        # two huge documents in the lane with one worker and small documents that
+        # fill the memory budget, the small ones should come out first
+        scheduler = Scheduler(2, memory_budget=1010 * MEMORY_FACTOR, huge_size=100)
+        jobs = [('huge1', 1000), ('huge2', 1000)] + [(f'doc{i}', 1) for i in range(20)]
+        durations = {'huge1': 1.0, 'huge2': 1.0}
+        durations.update((f'doc{i}', 0.05) for i in range(20))
+        start = time.time()
+        results = self.run_jobs(scheduler, jobs, durations)
+        self.assertEqual([name for name, _ in results],
+                         [name for name, _ in Scheduler.order(jobs)])
+        self.assertLess(time.time() - start, 4.0)
+
+    def test_order_does_not_depend_on_which_job_is_done_first(self):
+        # the smallest jobs take longest, so they are done last in the first run
+        # and first in the second run
+        jobs = [(f'doc{i:02d}', i % 7 * 100) for i in range(30)]
+        orders = []
+        for durations in ({name: 0.3 - size / 3000 for name, size in jobs},
+                          {name: size / 3000 for name, size in jobs}):
+            results = self.run_jobs(Scheduler(4), jobs, durations)
+            orders.append([name for name, _ in results])
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0], [name for name, _ in Scheduler.order(jobs)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+import service
+
+
+TEXT = 'Abstract\nWe model the climate of the last century with a simple model.'
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 11))
+        self.assertEqual(service.percentile(values, 50), 5)
+        self.assertEqual(service.percentile(values, 90), 9)
+        self.assertEqual(service.percentile(values, 99), 10)
+        self.assertEqual(service.percentile(values, 0), 1)
+        self.assertEqual(service.percentile([1, 2, 3, 4], 25), 1)
+        self.assertIsNone(service.percentile([], 50))
+
+
+class ParserServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.service = service.ParserService(1, queue_size=4)
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def test_broken_pool_is_replaced(self):
+        executor = self.service.executor
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        with self.assertRaises(BrokenProcessPool):
+            self.service.process([{'name': 'doc1', 'text': TEXT}])
+        self.assertIsNot(self.service.executor, executor)
+        self.assertEqual(self.service.metrics()['restarts'], 1)
+        result = self.service.process([{'name': 'doc2', 'text': TEXT}])[0]
+        self.assertEqual(result['name'], 'doc2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os, json, shutil, tempfile, unittest
+import shards
+from shards import Shard, Stats
+
+
+NAMES = [f'5c02a2371faed6554886c8{number:02d}' for number in range(30)]
+
+
+def result(i: int) -> dict:
+    return {'mode': 'text' if i % 3 else 'scpa',
+            'scores': {'size': 1000 + i, 'language': i / 30, 'best_language': 'en'},
+            'morsels': {'title': f'Title {i}'}}
+
+
+class MergeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_shard(self, index: int, count: int, names: list = None, bundle: bool = True):
+        shard = Shard(index, count, bundle=bundle)
+        shard.start(self.tmp)
+        for i, name in enumerate(NAMES):
+            if (name in shard) if names is None else (name in names):
+                shard.add(name, result(i))
+        shard.add('skipped', None)
+        shard.finish()
+
+    def test_merge(self):
+        for index in range(3):
+            self.run_shard(index, 3)
+        merged = shards.merge(self.tmp)
+        self.assertEqual(merged['missing'], [])
+        self.assertEqual(merged['documents'], NAMES)
+        stats = Stats()
+        for i in range(len(NAMES)):
+            stats.add(result(i))
+        for _ in range(3):
+            stats.add(None)
+        self.assertEqual(merged['stats']['modes'], stats.as_json()['modes'])
+        self.assertEqual(merged['stats']['skipped'], 3)
+        for name, score in stats.as_json()['scores'].items():
+            for key, value in score.items():
+                self.assertAlmostEqual(merged['stats']['scores'][name][key], value)
+        with open(os.path.join(self.tmp, shards.BUNDLE_FILE)) as fh:
+            bundled = [json.loads(line) for line in fh]
+        self.assertEqual(sorted(line['name'] for line in bundled), NAMES)
+        with open(os.path.join(self.tmp, shards.MANIFEST_FILE)) as fh:
+            self.assertEqual(json.load(fh), merged)
+
+    def test_missing_shard(self):
+        self.run_shard(0, 3, bundle=False)
+        self.run_shard(2, 3, bundle=False)
+        merged = shards.merge(self.tmp)
+        self.assertEqual(merged['missing'], [1])
+        self.assertIsNone(merged['bundle'])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, shards.BUNDLE_FILE)))
+
+    def test_shards_that_do_not_fit(self):
+        with self.assertRaises(ValueError):
+            shards.merge(self.tmp)
+        self.run_shard(0, 2)
+        self.run_shard(1, 3)
+        with self.assertRaises(ValueError):
+            shards.merge(self.tmp)
+
+    def test_document_in_two_shards(self):
+        first = [name for name in NAMES if shards.shard_of(name, 2) == 0]
+        second = [name for name in NAMES if shards.shard_of(name, 2) == 1]
+        self.run_shard(0, 2, first)
+        self.run_shard(1, 2, second + first[:1])
+        with self.assertRaisesRegex(ValueError, 'more than one shard'):
+            shards.merge(self.tmp)
+
+    def test_document_in_the_wrong_shard(self):
+        second = [name for name in NAMES if shards.shard_of(name, 2) == 1]
+        self.run_shard(0, 2, second[:1])
+        with self.assertRaisesRegex(ValueError, 'does not belong'):
+            shards.merge(self.tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from collections import Counter
+import utils
+import spans
+import document
+
+
+TEXTS = ['',
+         '\n',
+         '\n\n\n',
+         '   \n\t\n',
+         'one line without a newline',
+         'the first line of the text\n\nand the second line\n',
+         '\nthe text starts with an empty line and ends with two\n\n',
+         'a b c d e f\n12 34 56 78\n+++ --- ***\nthe climate of the century was warm\n',
+         'x\n\n\ny']
+
+
+def line_scores(lines: list) -> spans.SpanScores:
+    """The scores of the lines calculated from their text, as before there was an
+    index."""
+    text = '\n'.join(lines)
+    tokens = text.split()
+    if not tokens:
+        return spans.SpanScores(size=len(text),
+                                average_line_length=len(text) / len(lines) if lines else 0.0)
+    return spans.SpanScores(
+        size=len(text),
+        token_count=len(tokens),
+        language=utils.language_score(Counter(tokens), document.FREQUENT_ENGLISH_WORDS),
+        average_line_length=len(text) / len(lines),
+        average_token_length=sum(map(len, tokens)) / len(tokens),
+        singletons_per_token=sum(1 for t in tokens if len(t) == 1) / len(tokens))
+
+
+class SpanIndexTest(unittest.TestCase):
+
+    def index(self, text: str) -> spans.SpanIndex:
+        return spans.SpanIndex(text.split('\n'), document.FREQUENT_ENGLISH_WORDS)
+
+    def assertScoresEqual(self, first, second, msg=None):
+        for field in ('size', 'token_count'):
+            self.assertEqual(getattr(first, field), getattr(second, field), msg)
+        for field in ('language', 'average_line_length', 'average_token_length',
+                      'singletons_per_token'):
+            self.assertAlmostEqual(getattr(first, field), getattr(second, field), msg=msg)
+
+    def test_all_line_ranges(self):
+        # this includes empty ranges and ranges that start or end at the first
+        # and the last line
+        for text in TEXTS:
+            index = self.index(text)
+            lines = text.split('\n')
+            self.assertEqual(len(index), len(lines))
+            for start in range(len(lines) + 1):
+                for end in range(start, len(lines) + 1):
+                    self.assertScoresEqual(index.scores(start, end),
+                                           line_scores(lines[start:end]), (text, start, end))
+
+    def test_empty_text(self):
+        index = self.index('')
+        self.assertEqual(index.scores(0, 1), spans.SpanScores())
+        self.assertEqual(index.scores(0, 0), spans.SpanScores())
+        self.assertEqual(index.prose_lines(0, 1), [0])
+        self.assertEqual(list(index.windows(3)), [(0, spans.SpanScores())])
+        self.assertIsNone(index.best_window(3, 1, 1))
+        self.assertIsNone(spans.SpanIndex([], set()).best_window(2))
+
+    def test_prose_lines_are_the_lines_that_pass_on_their_own(self):
+        for text in TEXTS:
+            index = self.index(text)
+            lines = text.split('\n')
+            expected = [i for i, line in enumerate(lines) if not line.split()
+                        or utils.run_tests(spans.LINE_TESTS, line_scores([line]))]
+            self.assertEqual(index.prose_lines(0, len(lines)), expected, text)
+            doc = document.Document('doc', content=text, scpa_json={}, trim_lines=True)
+            self.assertEqual(doc.prose_lines(0, len(lines)), expected, text)
+
+    def test_windows_at_the_end_of_the_text(self):
+        lines = TEXTS[7].split('\n')
+        index = self.index(TEXTS[7])
+        for width in (1, 2, len(lines), len(lines) + 3):
+            windows = list(index.windows(width))
+            self.assertEqual([i for i, _ in windows],
+                             list(range(max(0, len(lines) - width) + 1)))
+            for i, scores in windows:
+                self.assertScoresEqual(scores, line_scores(lines[i:i + width]))
+
+
+if __name__ == '__main__':
+    unittest.main()
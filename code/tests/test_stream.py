@@ -0,0 +1,104 @@
+import io, os, json, shutil, tempfile, contextlib, unittest
+import stream
+from watch import TEXT_SUFFIX, SCPA_SUFFIX
+
+
+TEXT = '''A study of the climate
+
+Abstract
+
+We model the climate of the last century with a simple model and compare the
+results of the model with the temperature records of many weather stations.
+
+1 Introduction
+
+The climate of the last century was warmer than the climate of the century
+before that, as can be seen in the records of the weather stations.
+'''
+
+NAMES = [f'5c02a2371faed6554886c8{number:02d}' for number in range(12)]
+
+# the ScienceParse file of this document is not valid JSON
+INVALID = NAMES[3]
+
+
+class StreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.text_dir = os.path.join(self.tmp, 'text')
+        self.scpa_dir = os.path.join(self.tmp, 'scpa')
+        os.makedirs(self.text_dir)
+        os.makedirs(self.scpa_dir)
+        for i, name in enumerate(NAMES):
+            # documents of different sizes, in an order that is not the name order
+            with open(os.path.join(self.text_dir, name + TEXT_SUFFIX), 'w') as fh:
+                fh.write(TEXT * (1 + i * 7 % 5))
+            with open(os.path.join(self.scpa_dir, name + SCPA_SUFFIX), 'w') as fh:
+                fh.write('{"metadata": ' if name == INVALID
+                         else '{"metadata": {"title": "A study of the climate"}}')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_stream(self, **options) -> list:
+        output = os.path.join(self.tmp, 'results.ndjson')
+        with contextlib.redirect_stdout(io.StringIO()):
+            stream.run(self.scpa_dir, self.text_dir, output, **options)
+        with open(output) as fh:
+            return fh.read().split('\n')
+
+    def test_one_record_per_line(self):
+        lines = self.run_stream()
+        self.assertEqual(lines[-1], '')
+        records = [json.loads(line) for line in lines[:-1]]
+        self.assertEqual([record['id'] for record in records], NAMES)
+        record = records[0]
+        self.assertEqual(record['mode'], 'text')
+        self.assertEqual(record['title'], 'A study of the climate')
+        self.assertIn('abstract', record)
+        self.assertIn('size', record['scores'])
+
+    def test_newlines_are_escaped(self):
+        lines = self.run_stream()
+        records = [json.loads(line) for line in lines[:-1]]
+        abstract = records[0]['abstract']['abstract']
+        self.assertIn('\n', abstract)
+        self.assertNotIn(abstract, lines[0])
+        self.assertIn(json.dumps(abstract), lines[0])
+
+    def test_failure_records(self):
+        records = {record['id']: record
+                   for record in map(json.loads, self.run_stream()[:-1])}
+        self.assertEqual(len(records), len(NAMES))
+        self.assertEqual(records[INVALID]['error'], 'exception')
+        self.assertTrue(records[INVALID]['message'].startswith('JSONDecodeError'))
+        self.assertNotIn('mode', records[INVALID])
+        # the retry in abstract-only mode fails on the same JSON
+        records = {record['id']: record
+                   for record in map(json.loads, self.run_stream(retry_cheaper=True)[:-1])}
+        self.assertEqual(records[INVALID]['error'], 'exception')
+
+    def test_ids_file(self):
+        ids = os.path.join(self.tmp, 'ids.txt')
+        with open(ids, 'w') as fh:
+            fh.write(f'{NAMES[5]}\n# comment\n\n{NAMES[1]}\n5c02a2371faed6554886c899\n')
+        records = [json.loads(line) for line in self.run_stream(ids=ids)[:-1]]
+        self.assertEqual([record['id'] for record in records], [NAMES[5], NAMES[1]])
+
+    def test_order_with_workers_is_stable(self):
+        runs = [self.run_stream(workers=3, batch_size=5) for _ in range(2)]
+        self.assertEqual(runs[0], runs[1])
+        ids = [json.loads(line)['id'] for line in runs[0][:-1]]
+        self.assertEqual(sorted(ids), NAMES)
+        # each batch is in the largest first order of the scheduler
+        sizes = {name: os.path.getsize(os.path.join(self.text_dir, name + TEXT_SUFFIX))
+                 for name in NAMES}
+        for start in range(0, len(NAMES), 5):
+            batch = ids[start:start + 5]
+            self.assertEqual(batch, sorted(NAMES[start:start + 5],
+                                           key=lambda name: (-sizes[name], name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
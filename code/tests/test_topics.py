@@ -0,0 +1,48 @@
+import os, json, shutil, tempfile, unittest
+import topics
+from outliers import SlowDocuments
+from tests.test_watch import TEXT, NAMES
+from watch import TEXT_SUFFIX, SCPA_SUFFIX
+
+
+class TopicsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tmp, 'topics.tsv')
+        with open(self.manifest, 'w') as manifest:
+            manifest.write('# two topics that share a document\n')
+            for topic, names in (('a', NAMES[:2]), ('b', NAMES[1:])):
+                text_dir = os.path.join(self.tmp, topic, 'text')
+                scpa_dir = os.path.join(self.tmp, topic, 'scpa')
+                os.makedirs(text_dir)
+                os.makedirs(scpa_dir)
+                for name in names:
+                    with open(os.path.join(text_dir, name + TEXT_SUFFIX), 'w') as fh:
+                        fh.write(TEXT)
+                    with open(os.path.join(scpa_dir, name + SCPA_SUFFIX), 'w') as fh:
+                        json.dump({'title': 'A study', 'sections': []}, fh)
+                out_dir = os.path.join(self.tmp, topic, 'out')
+                manifest.write(f'{scpa_dir}\t{text_dir}\t{out_dir}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_outputs_and_stats_per_topic(self):
+        topics.run(self.manifest)
+        for topic, names in (('a', NAMES[:2]), ('b', NAMES[1:])):
+            out_dir = os.path.join(self.tmp, topic, 'out')
+            self.assertEqual(sorted(os.listdir(out_dir)),
+                             sorted([f'{name}.json' for name in names] + [topics.STATS_FILE]))
+            with open(os.path.join(out_dir, topics.STATS_FILE)) as fh:
+                self.assertEqual(json.load(fh)['stats']['documents'], 2)
+
+    def test_profiles(self):
+        profile_dir = os.path.join(self.tmp, 'profiles')
+        topics.run(self.manifest, outliers=SlowDocuments(profile_dir=profile_dir, sample=1.0))
+        self.assertEqual(sorted(os.listdir(os.path.join(profile_dir, '1'))),
+                         [f'{name}.pstats' for name in NAMES[1:]])
+
+
+if __name__ == '__main__':
+    unittest.main()
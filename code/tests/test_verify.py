@@ -0,0 +1,154 @@
+import io, json, shutil, tarfile, tempfile, contextlib, unittest
+from collections import Counter
+from unittest import mock
+import document
+import headings
+import languages
+import verify
+
+
+LINES = ['Abstract', 'ABSTRACT:', 'A B S T R A C T', 'Abstract: We study the climate',
+         'ABSTRACT - we study', 'ABSTRACT-we', 'Abstract — we study', 'Abstract. ',
+         '  1 Introduction', '2.1. Methods', 'IV. RESULTS', 'a. methods', 'IV Results',
+         'Results and Discussion', 'Results and discussion: the model', 'Methodology',
+         'Key words:', '1Introduction', 'I N T R O D U C T I O N', 'Abs tract',
+         'Abstractly', 'Abstract :', 'Abstract - ', 'x. Abstract', '1.2.3 References',
+         'Literature  cited', '\tAcknowledgements.\t', 'We model the climate.', '']
+
+TEXT = '''A study of the climate
+
+Abstract
+
+We model the climate of the last century with a simple model and compare the
+results of the model with the temperature records of many weather stations.
+
+1 Introduction
+
+The climate of the last century was warmer than the climate of the century
+before that, as can be seen in the records of the weather stations.
++++ 12 34 56 x y z
+'''
+
+SCPA = json.dumps({'metadata': {
+    'title': 'A study of the climate',
+    'abstractText': 'We model the climate of the last century.',
+    'sections': [{'heading': 'Introduction', 'text': 'The climate was warmer.'},
+                 {'heading': 'Methods', 'text': 'We used a simple model.'}]}}).encode('utf8')
+
+NAMES = [f'5c02a2371faed6554886c8{number:02d}' for number in range(6)]
+
+
+class BaselineTest(unittest.TestCase):
+
+    def test_headings(self):
+        for line in LINES:
+            self.assertEqual(verify.baseline_headings(line), headings.find_headings(line), line)
+        content = '\n'.join(LINES)
+        self.assertEqual(verify.baseline_headings(content), headings.find_headings(content))
+
+    def test_language_scores(self):
+        baseline = verify.BaselineLanguageTable(document.FREQUENT_WORDS)
+        table = languages.LanguageTable(document.FREQUENT_WORDS)
+        for text in (TEXT, 'der die das und', '', '12 34'):
+            tokens = Counter(text.split())
+            self.assertEqual(baseline.scores(tokens), table.scores(tokens))
+            self.assertEqual(baseline.best(baseline.scores(tokens)),
+                             table.best(table.scores(tokens)))
+
+    def test_trimmed_lines(self):
+        doc = verify.BaselineDocument('doc', content=TEXT, scpa_json={}, trim_lines=True)
+        for start in range(len(doc.lines)):
+            self.assertEqual(doc.prose_lines(start, len(doc.lines)),
+                             doc.span_index().prose_lines(start, len(doc.lines)))
+
+    def test_reference_does_not_use_the_heading_expression(self):
+        with mock.patch.object(headings, 'find_headings', return_value=[]):
+            fast = document.process_source('doc', TEXT, b'')
+            reference = verify.reference_result('doc', TEXT.encode('utf8'), b'')
+        self.assertIsNone(fast['morsels']['abstract'])
+        self.assertEqual(reference['morsels']['abstract']['source'], 'text')
+        self.assertTrue(verify.compare(reference, fast))
+
+    def test_only_produced_fields(self):
+        reference = verify.reference_result('doc', TEXT.encode('utf8'), b'')
+        fast = document.process_source('doc', TEXT, b'', abstract_only=True)
+        self.assertEqual(verify.compare(verify.only_produced_fields(reference, fast), fast), [])
+        self.assertEqual(sorted(verify.only_produced_fields(reference, fast)['morsels']),
+                         ['abstract', 'title'])
+
+    def test_only_produced_fields_in_scpa_mode(self):
+        reference = verify.reference_result('doc', TEXT.encode('utf8'), SCPA)
+        fast = document.process_source('doc', TEXT, SCPA, abstract_only=True)
+        self.assertEqual(fast['mode'], 'scpa')
+        self.assertIsNone(fast['scores']['language'])
+        self.assertEqual(verify.compare(verify.only_produced_fields(reference, fast), fast), [])
+        fast = document.process_source('doc', TEXT.encode('utf8'), SCPA, abstract_only=True)
+        self.assertEqual(verify.compare(verify.only_produced_fields(reference, fast), fast), [])
+
+    def test_failures(self):
+        reference = verify.reference_result('doc', TEXT.encode('utf8'), b'{"metadata": ')
+        fast = document.process_with_budget('doc', TEXT, b'{"metadata": ')
+        self.assertEqual(reference['error'], 'exception')
+        self.assertEqual(verify.compare(reference, fast), [])
+        result = verify.reference_result('doc', TEXT.encode('utf8'), b'')
+        self.assertEqual(verify.compare(result, fast),
+                         [f"result: only the fast path failed ({fast['message']})"])
+        self.assertEqual(len(verify.compare(reference, result)), 1)
+        reference = verify.reference_result('doc', b'\xff' + TEXT.encode('utf8'), b'', errors='strict')
+        self.assertEqual(reference['error'], 'encoding')
+
+
+class VerifyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def archive(self) -> str:
+        path = f'{self.tmp}/topic.tar'
+        with tarfile.open(path, 'w') as tar:
+            for name in NAMES:
+                scpa = b'{"metadata": ' if name == NAMES[0] else SCPA
+                for member_name, data in ((f'topic/text/{name}.txt', TEXT.encode('utf8')),
+                                          (f'topic/scienceparse/{name}_input.pdf.json', scpa)):
+                    info = tarfile.TarInfo(member_name)
+                    info.size = len(data)
+                    tar.addfile(info, io.BytesIO(data))
+        return path
+
+    def verify(self, docs, **options):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            same = verify.verify(docs, **options)
+        return same, output.getvalue()
+
+    def test_archive(self):
+        for abstract_only in (False, True):
+            docs = document.ArchiveDocuments(self.archive(), None, None,
+                                             abstract_only=abstract_only, retry_cheaper=True)
+            same, output = self.verify(docs)
+            self.assertTrue(same, output)
+            self.assertIn('Verifying 6 documents', output)
+            self.assertIn('0 of 6 documents diverge', output)
+
+    def test_archive_sample(self):
+        docs = document.ArchiveDocuments(self.archive(), None, None)
+        same, output = self.verify(docs, sample=3, seed=1)
+        self.assertTrue(same, output)
+        self.assertIn('0 of 3 documents diverge', output)
+        self.assertEqual(len(docs.names), 3)
+
+    def test_one_path_fails(self):
+        docs = document.ArchiveDocuments(self.archive(), None, None)
+        with mock.patch.object(verify, 'reference_result',
+                               side_effect=lambda name, *args: document.failure(name, 'memory')):
+            same, output = self.verify(docs)
+        self.assertFalse(same)
+        self.assertIn('5 of 6 documents diverge', output)
+        self.assertIn('only the reference path failed (memory)', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
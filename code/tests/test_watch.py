@@ -0,0 +1,81 @@
+import os, json, shutil, tempfile, unittest
+from unittest import mock
+import document
+import shards
+from watch import Watcher, TEXT_SUFFIX, SCPA_SUFFIX
+
+
+TEXT = '''A study of the climate
+
+Abstract
+
+We model the climate of the last century with a simple model and compare the
+results of the model with the temperature records of many weather stations.
+'''
+
+NAMES = ['5c02a2371faed6554886c811', '5c02a2371faed6554886c812', '5c02a2371faed6554886c813']
+
+
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.text_dir = os.path.join(self.tmp, 'text')
+        self.scpa_dir = os.path.join(self.tmp, 'scpa')
+        self.out_dir = os.path.join(self.tmp, 'out')
+        for directory in (self.text_dir, self.scpa_dir, self.out_dir):
+            os.makedirs(directory)
+        for name in NAMES:
+            with open(os.path.join(self.text_dir, name + TEXT_SUFFIX), 'w') as fh:
+                fh.write(TEXT)
+            with open(os.path.join(self.scpa_dir, name + SCPA_SUFFIX), 'w') as fh:
+                json.dump({'title': 'A study', 'sections': []}, fh)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def watcher(self, **options) -> Watcher:
+        return Watcher(self.scpa_dir, self.text_dir, self.out_dir, interval=0,
+                       settle_time=0, **options)
+
+    def outputs(self) -> list:
+        return sorted(name[:-5] for name in os.listdir(self.out_dir))
+
+    def test_processes_new_documents(self):
+        watcher = self.watcher()
+        watcher.run(max_polls=2)
+        self.assertEqual(self.outputs(), NAMES)
+
+    def test_invalid_scienceparse_json_is_quarantined(self):
+        with open(os.path.join(self.scpa_dir, NAMES[1] + SCPA_SUFFIX), 'w') as fh:
+            fh.write('{"sections": [')
+        watcher = self.watcher()
+        watcher.run(max_polls=3)
+        self.assertEqual(self.outputs(), [NAMES[0], NAMES[2]])
+        self.assertEqual([entry['name'] for entry in watcher.docs.quarantine.entries], [NAMES[1]])
+        self.assertIn(NAMES[1], watcher.done)
+
+    def test_errors_outside_the_parser_are_quarantined(self):
+        watcher = self.watcher()
+        source = document.Documents.source
+
+        def failing_source(docs, name):
+            if name == NAMES[0]:
+                raise OSError('file went away')
+            return source(docs, name)
+
+        with mock.patch.object(document.Documents, 'source', failing_source):
+            watcher.run(max_polls=3)
+        self.assertEqual(self.outputs(), NAMES[1:])
+        self.assertEqual(watcher.failed, 1)
+        self.assertEqual(watcher.docs.quarantine.entries[0]['name'], NAMES[0])
+
+    def test_shard(self):
+        shard = shards.Shard(0, 2)
+        watcher = self.watcher(shard=shard)
+        watcher.run(max_polls=2)
+        self.assertEqual(self.outputs(), [name for name in NAMES if name in shard])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os, json, shutil, tempfile, threading, unittest
+from unittest import mock
+import writer
+
+
+MORSELS = {'title': 'A study of the climate', 'abstract': None, 'sections': []}
+
+
+class OutputWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_outputs_are_written(self):
+        output_writer = writer.OutputWriter()
+        out_files = [os.path.join(self.tmp, 'topic', f'doc{i}.json') for i in range(10)]
+        for out_file in out_files:
+            output_writer.write(out_file, MORSELS)
+        output_writer.close()
+        self.assertEqual(output_writer.files, 10)
+        for out_file in out_files:
+            with open(out_file) as fh:
+                self.assertEqual(json.load(fh), MORSELS)
+        # no temporary files are left
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, 'topic'))),
+                         sorted(os.path.basename(out_file) for out_file in out_files))
+
+    def test_directories_are_synced_once_per_batch(self):
+        # the thread is not started, so all files are in the queue for one batch
+        with mock.patch.object(threading.Thread, 'start'):
+            output_writer = writer.OutputWriter()
+        for i in range(6):
+            output_writer.write(os.path.join(self.tmp, f'dir{i % 2}', f'doc{i}.json'), MORSELS)
+        output_writer.queue.put(None)
+        with mock.patch('os.fsync') as fsync:
+            output_writer._run()
+        self.assertEqual(output_writer.batches, 1)
+        self.assertEqual(output_writer.files, 6)
+        # one sync for each file and one for each directory
+        self.assertEqual(fsync.call_count, 6 + (2 if os.name == 'posix' else 0))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp, 'dir0'))),
+                         ['doc0.json', 'doc2.json', 'doc4.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""Parsing many topics in one run
+
+Running the parser once for each topic pays for the startup of the worker pool
+for every topic, and at the end of each topic most workers are idle while the
+last large documents are parsed. A topic manifest lists the topics, one on a
+line with the ScienceParse directory, the text directory and the output
+directory separated by tabs:
+
+/data/topics/topic1/scienceparse    /data/topics/topic1/text    /data/topics/topic1/output/doc
+/data/topics/topic2/scienceparse    /data/topics/topic2/text    /data/topics/topic2/output/doc
+
+Empty lines and lines starting with # are skipped. The documents of all topics
+go to one worker pool in one largest-first order (see scheduler.py), so all
+workers keep busy until the last topic is done, and they share one result cache
+if there is one. A document that is in several topics is parsed once: if it is
+still being parsed when it comes up again the result is shared, and later the
+result is taken from the cache.
+
+Each topic gets its output in its own output directory, together with a
+stats.json file with the statistics over the scores of its documents (see
+shards.Stats) and the time at which its last document was done.
+
+Usage:
+
+$ python3 parse.py --topics topics.tsv --workers 16 --cache cache.db
+
+"""
+
+import os, json, time
+from document import Documents
+from shards import Stats
+from watch import TEXT_SUFFIX, SCPA_SUFFIX
+
+
+STATS_FILE = 'stats.json'
+
+
+class Topic:
+
+    def __init__(self, index: int, scpa_dir: str, text_dir: str, out_dir: str):
+        self.index = index
+        self.scpa_dir = scpa_dir
+        self.text_dir = text_dir
+        self.out_dir = out_dir
+        self.names = sorted(name[:-len(TEXT_SUFFIX)] for name in os.listdir(text_dir)
+                            if name.endswith(TEXT_SUFFIX))
+        self.remaining = len(self.names)
+        self.stats = Stats()
+        self.started = None
+        self.finished = None
+
+    def __str__(self):
+        return f'<Topic {self.index} {self.out_dir} documents={len(self.names):,}>'
+
+    def add(self, result: dict) -> bool:
+        """Add the result to the statistics, returns True if this was the last
+        document of the topic."""
+        self.stats.add(result)
+        self.remaining -= 1
+        return self.remaining == 0
+
+    def finish(self):
+        """Write the statistics to the output directory."""
+        self.finished = time.time()
+        stats = {'scpa': self.scpa_dir,
+                 'text': self.text_dir,
+                 'started': self.started,
+                 'finished': self.finished,
+                 'stats': self.stats.as_json()}
+        with open(os.path.join(self.out_dir, STATS_FILE), 'w') as fh:
+            json.dump(stats, fh)
+        print(f'>>> Finished {self.out_dir}: {self.stats.documents:,} documents'
+              f' in {self.finished - self.started:.2f}s')
+
+
+def read_manifest(manifest_file: str) -> list:
+    """Return the Topics in the manifest."""
+    topics = []
+    with open(manifest_file) as fh:
+        for line in fh:
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 3:
+                raise ValueError(f'expected SCPA_DIR, TEXT_DIR and OUT_DIR in {line!r}')
+            topics.append(Topic(len(topics), *fields))
+    return topics
+
+
+class TopicDocuments(Documents):
+
+    """The documents of several topics, where the name of a document is the
+    number of its topic and its xDD name, like 3/5c02a2371faed6554886c814."""
+
+    def __init__(self, topics: list, **options):
+        self.html_dir = None
+        self.data_dir = None
+        self.set_options(**options)
+        self.topics = topics
+        self.names = [f'{topic.index}/{name}' for topic in topics for name in topic.names]
+        self.initialize_documents()
+
+    def __str__(self):
+        return f'<TopicDocuments topics={len(self.topics)} size={len(self.names)}>'
+
+    def split(self, name: str) -> tuple:
+        """Return the Topic and the xDD name for the name."""
+        index, name = name.split('/', 1)
+        return self.topics[int(index)], name
+
+    def document_name(self, name: str) -> str:
+        return self.split(name)[1]
+
+    def scpa_filename(self, name: str):
+        topic, name = self.split(name)
+        return os.path.join(topic.scpa_dir, f'{name}{SCPA_SUFFIX}')
+
+    def text_filename(self, name: str):
+        topic, name = self.split(name)
+        return os.path.join(topic.text_dir, f'{name}{TEXT_SUFFIX}')
+
+    def output_filename(self, name: str):
+        topic, name = self.split(name)
+        return os.path.join(topic.out_dir, f'{name}.json')
+
+    def write_output(self):
+        started = time.time()
+        for topic in self.topics:
+            os.makedirs(topic.out_dir, exist_ok=True)
+            topic.started = started
+            if not topic.names:
+                topic.finish()
+        for count, (name, result) in enumerate(self.results(), start=1):
+            if count % 100 == 0:
+                print(count)
+            if result is not None:
+                self.write_result(name, result)
+            topic = self.split(name)[0]
+            if topic.add(result):
+                if self.writer is not None:
+                    # the statistics are only written when the outputs are
+                    self.writer.flush()
+                topic.finish()
+        if self.writer is not None:
+            self.writer.close()
+            print(f'>>> {self.writer}')
+        self.report()
+        if self.outliers is not None:
+            self.outliers.finish(self)
+
+
+def run(manifest_file: str, **options):
+    """Parse the topics in the manifest, the options are handed to Documents."""
+    topics = read_manifest(manifest_file)
+    docs = TopicDocuments(topics, **options)
+    print(f'>>> Parsing {len(docs.names):,} documents in {len(topics):,} topics')
+    docs.write_output()
+    for topic in topics:
+        print(f'>>> {topic.out_dir}')
+        for line in topic.stats.summary():
+            print(f'>>>     {line}')
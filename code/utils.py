@@ -1,4 +1,4 @@
-import os, re, datetime
+import os, re, datetime, hashlib
 from pathlib import Path
 from collections import Counter
 
@@ -14,6 +14,44 @@ def basename(path: str):
     return os.path.splitext(os.path.basename(path))[0]
 
 
+# Characters that make a text not plain, see is_plain_text()
+NOT_PLAIN = re.compile(rb'[\x1c-\x1f\x80-\xff]')
+
+
+def decode_text(data: bytes, errors: str = 'replace') -> str:
+    """Decode the bytes of a text file the way open() does in text mode, which
+    includes translating Windows and old Mac line endings into newlines. Bytes
+    that are not UTF-8 are replaced, unless errors is 'strict', then they raise
+    a UnicodeDecodeError."""
+    text = data.decode('utf-8', errors=errors)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def translate_newlines(data: bytes) -> bytes:
+    """Translate Windows and old Mac line endings into newlines, like decode_text()
+    does, but without decoding."""
+    if b'\r' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return data
+
+
+def is_plain_text(data: bytes) -> bool:
+    """Return True if the bytes are ASCII without the separator characters \\x1c to
+    \\x1f. For plain text splitting, stripping and case-insensitive matching give
+    the same results on the bytes as on the decoded string, because str and bytes
+    only disagree on what is whitespace for those separators and for characters
+    outside of ASCII."""
+    return NOT_PLAIN.search(data) is None
+
+
+def stable_hash(data: bytes) -> int:
+    """Return a 64-bit hash that, unlike the builtin hash(), is the same across
+    processes and runs."""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
 def run_tests(tests: dict, scores) -> bool:
     """Return True if all the tests defined for the scores return True. The
     scores argument is either an instance of document.DocumentScores or an
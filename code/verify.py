@@ -0,0 +1,342 @@
+"""Checking a fast path against the reference path
+
+Options that make processing faster, like the result cache or parsing with worker
+processes, should never change the results. This module runs the reference path,
+which parses each document in the main process without any of those options,
+next to the path selected with the options, and compares the results: scores
+have to be equal within a tolerance and the morsels have to be exactly equal.
+The first few differences are printed for each document that diverges, followed
+by the run times of both paths and the speedup.
+
+The reference path is the full parse of the decoded text, also when the fast
+path is abstract-only or works on bytes, and it does not use the parts of the
+parser that were only added to make it faster, so it also checks those:
+
+- Language scores are calculated with utils.language_score(), one language at
+  a time, instead of with languages.LanguageTable.
+- Headings are found by looking at one line at a time, following the rules in
+  headings.py, instead of with the compiled expression of headings.py.
+- With trimmed lines, each line is tokenized and scored on its own instead of
+  with the cumulative counts of spans.SpanIndex.
+
+In abstract-only mode only the fields that the fast path produces are compared,
+which are the mode, the scores that were needed for the mode, the title and the
+abstract.
+
+Documents that cannot be parsed, for example because the ScienceParse file is
+not valid JSON, fail on the reference path in the same way as on the fast path.
+A document where both paths fail is not a difference, a document where only one
+of them fails is. Failed documents are not retried in abstract-only mode.
+
+Options that change the results on purpose, like removing boilerplate or
+trimming lines, are used for both paths. Duplicate detection is not used since
+it depends on the order in which documents are seen.
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --workers 8 --cache FILE --verify
+$ python3 parse.py --scpa DIR1 --text DIR2 --workers 8 --verify --verify-sample 500
+$ python3 parse.py --archive ARCHIVE --verify --verify-sample 500
+
+"""
+
+import json, math, time, random
+from collections import Counter
+import utils
+import spans
+import document
+import headings
+from ids import IdSet
+
+
+# Default maximum difference between two scores
+TOLERANCE = 1e-9
+
+# Number of differences printed for each document
+MAX_DIFFERENCES = 5
+
+
+def differences(reference, fast, path: str = '', tolerance: float = None):
+    """Generate descriptions of the differences between the reference and fast
+    values. Floats are compared with the tolerance, unless it is None, all other
+    values have to be equal."""
+    if isinstance(reference, dict) and isinstance(fast, dict):
+        for key in reference.keys() | fast.keys():
+            if key not in fast:
+                yield f'{path}.{key}: missing in fast result'
+            elif key not in reference:
+                yield f'{path}.{key}: missing in reference result'
+            else:
+                yield from differences(reference[key], fast[key], f'{path}.{key}', tolerance)
+    elif isinstance(reference, list) and isinstance(fast, list):
+        if len(reference) != len(fast):
+            yield f'{path}: length {len(reference)} != {len(fast)}'
+        for i, (ref, fst) in enumerate(zip(reference, fast)):
+            yield from differences(ref, fst, f'{path}[{i}]', tolerance)
+    elif (tolerance is not None
+          and isinstance(reference, (int, float)) and isinstance(fast, (int, float))):
+        if not math.isclose(reference, fast, rel_tol=tolerance, abs_tol=tolerance):
+            yield f'{path}: {reference!r} != {fast!r}'
+    elif reference != fast:
+        yield f'{path}: {_short(reference)} != {_short(fast)}'
+
+
+def compare(reference: dict, fast: dict, tolerance: float = TOLERANCE) -> list:
+    """Return the differences between two results, using the tolerance for the
+    scores only."""
+    if reference is None or fast is None:
+        return [] if reference is fast else ['result: one of the results is missing']
+    if document.is_failure(reference) or document.is_failure(fast):
+        if document.is_failure(reference) and document.is_failure(fast):
+            return []
+        failed, result = ('reference', reference) if document.is_failure(reference) \
+            else ('fast', fast)
+        error = result.get('message', result['error'])
+        return [f'result: only the {failed} path failed ({error})']
+    found = []
+    for key in ('name', 'mode'):
+        found.extend(differences(reference.get(key), fast.get(key), key))
+    found.extend(differences(reference.get('scores'), fast.get('scores'), 'scores', tolerance))
+    found.extend(differences(reference.get('morsels'), fast.get('morsels'), 'morsels'))
+    return found
+
+
+def only_produced_fields(reference: dict, fast: dict) -> dict:
+    """Return the reference result with only the scores and morsels that are in
+    the fast result. Scores that the fast path did not need are None there and
+    they are None in the returned result too."""
+    if reference is None or fast is None or document.is_failure(reference) \
+            or document.is_failure(fast):
+        return reference
+    reference = dict(reference)
+    reference['scores'] = {key: None if fast['scores'][key] is None else value
+                           for key, value in reference['scores'].items()
+                           if key in fast['scores']}
+    reference['morsels'] = {key: value for key, value in reference['morsels'].items()
+                            if key in fast['morsels']}
+    return reference
+
+
+class BaselineLanguageTable:
+
+    """Language scores with utils.language_score(), with the same methods as
+    languages.LanguageTable."""
+
+    def __init__(self, word_lists: dict):
+        self.word_lists = word_lists
+
+    def scores(self, tokens) -> dict:
+        return {language: utils.language_score(tokens, words)
+                for language, words in self.word_lists.items()}
+
+    def best(self, scores: dict) -> tuple:
+        best_language, best_score = None, 0.0
+        for language in self.word_lists:
+            if scores[language] > best_score:
+                best_language, best_score = language, scores[language]
+        return best_language, best_score
+
+
+def baseline_headings(content: str) -> list:
+    """Return the headings in the content, looking at one line at a time."""
+    found = []
+    offset = 0
+    for line in content.split('\n'):
+        match = _line_heading(line)
+        if match is not None:
+            label, end = match
+            found.append(headings.Heading(label, offset, offset + end))
+        offset += len(line) + 1
+    return found
+
+
+def _line_heading(line: str):
+    """Return the label and the end of the heading at the start of the line, or
+    None if the line does not start with a heading."""
+    start = _skip_spaces(line, 0)
+    numbered = _numbering_end(line, start)
+    for position in ([] if numbered is None else [_skip_spaces(line, numbered)]) + [start]:
+        for label, phrases in headings.HEADINGS.items():
+            for phrase in sorted(phrases, key=len, reverse=True):
+                end = _phrase_end(line, position, phrase)
+                if end is not None:
+                    end = _heading_end(line, end)
+                    if end is not None:
+                        return label, end
+    return None
+
+
+def _skip_spaces(line: str, position: int) -> int:
+    while position < len(line) and line[position] in ' \t':
+        position += 1
+    return position
+
+
+def _numbering_end(line: str, position: int):
+    """Return the end of a number like 2.1., IV. or A. at the position."""
+    end = position
+    while end < len(line) and line[end].isdecimal():
+        end += 1
+    if end > position:
+        while (end + 1 < len(line) and line[end] == '.' and line[end + 1].isdecimal()):
+            end += 1
+            while end < len(line) and line[end].isdecimal():
+                end += 1
+        return end + 1 if line[end:end + 1] == '.' else end
+    while end < len(line) and line[end].upper() in 'IVX':
+        end += 1
+    if end > position and line[end:end + 1] == '.':
+        return end + 1
+    letter = line[position:position + 1]
+    if letter.isascii() and letter.isalpha() and line[position + 1:position + 2] == '.':
+        return position + 2
+    return None
+
+
+def _same_letter(char: str, letter: str) -> bool:
+    return char.lower() == letter or char.upper() == letter.upper()
+
+
+def _phrase_end(line: str, position: int, phrase: str):
+    """Return the end of the phrase at the position, in any case and with one
+    optional space or tab between letters and one or more between words."""
+    for i, word in enumerate(phrase.split()):
+        if i > 0:
+            if line[position:position + 1] not in (' ', '\t'):
+                return None
+            position = _skip_spaces(line, position)
+        for j, letter in enumerate(word):
+            if j > 0 and line[position:position + 1] in (' ', '\t'):
+                position += 1
+            if position >= len(line) or not _same_letter(line[position], letter):
+                return None
+            position += 1
+    return position
+
+
+def _heading_end(line: str, position: int):
+    """Return the end of the heading after the phrase, which is followed by a
+    colon, period or dash and more text on the line, or by an optional colon or
+    period and nothing else. Returns None if neither is the case."""
+    after = _skip_spaces(line, position)
+    if line[after:after + 1] and line[after] in ':.–—' or (
+            after > position and line[after:after + 1] == '-'):
+        end = _skip_spaces(line, after + 1)
+        if end < len(line) and not line[end].isspace():
+            return end
+    if line[after:after + 1] in (':', '.'):
+        after = _skip_spaces(line, after + 1)
+    return len(line) if after == len(line) else None
+
+
+class BaselineDocument(document.Document):
+
+    """A Document that is parsed without the parts that were added for speed."""
+
+    def language_table(self):
+        return BaselineLanguageTable(document.FREQUENT_WORDS)
+
+    def find_headings(self) -> list:
+        return baseline_headings(self.content)
+
+    def prose_lines(self, start: int, end: int) -> list:
+        prose = []
+        for i in range(start, end):
+            tokens = self.lines[i].split()
+            if tokens:
+                scores = spans.SpanScores(
+                    size=len(self.lines[i]),
+                    token_count=len(tokens),
+                    language=utils.language_score(
+                        Counter(tokens), document.FREQUENT_ENGLISH_WORDS),
+                    average_line_length=len(self.lines[i]),
+                    average_token_length=sum(map(len, tokens)) / len(tokens),
+                    singletons_per_token=sum(1 for t in tokens if len(t) == 1) / len(tokens))
+                if not utils.run_tests(spans.LINE_TESTS, scores):
+                    continue
+            prose.append(i)
+        return prose
+
+
+def reference_result(name: str, text: bytes, scpa: bytes, boilerplate=None,
+                     trim_lines: bool = False, errors: str = 'replace') -> dict:
+    """Return the result of the reference path for a document, or a failure as
+    returned by document.process_with_budget() if it could not be decoded with
+    the errors or could not be parsed."""
+    try:
+        content = utils.decode_text(text, errors)
+        scpa = scpa.decode('utf-8-sig', errors)
+        doc = BaselineDocument(name, content=content,
+                               scpa_json=json.loads(scpa) if scpa else {},
+                               boilerplate=boilerplate, trim_lines=trim_lines)
+        return doc.result()
+    except UnicodeDecodeError:
+        return document.failure(name, 'encoding')
+    except RecursionError:
+        return document.failure(name, 'recursion')
+    except Exception as e:
+        return document.failure(name, 'exception', message=f'{type(e).__name__}: {e}')
+
+
+def reference_results(docs: document.Documents):
+    """Generate the results of the reference path."""
+    for name, text, scpa in docs.sources():
+        yield name, reference_result(name, text, scpa, docs.boilerplate, docs.trim_lines,
+                                     docs.encoding_errors)
+
+
+def verify(docs: document.Documents, sample: int = None, seed: int = None,
+           tolerance: float = TOLERANCE, max_differences: int = MAX_DIFFERENCES) -> bool:
+    """Run the reference path and the fast path that is configured on the
+    documents, print the differences and the speedup, and return True if there
+    were no differences."""
+    if docs.dedup is not None:
+        print('>>> Not using duplicate detection for verification')
+        docs.dedup = None
+        docs.skip_duplicates = False
+    if docs.metadata is not None:
+        print('>>> Not adding metadata for verification')
+        docs.metadata = None
+    if docs.retry_cheaper:
+        print('>>> Not retrying failed documents for verification')
+        docs.retry_cheaper = False
+    names = docs.names
+    if names is None:
+        # the names in an archive are only known after reading it once
+        names = IdSet(name for name, _, _ in docs.sources())
+    if sample is not None and sample < len(names):
+        names = IdSet(names.sample(sample, random.Random(seed)))
+    docs.names = names
+    print(f'>>> Verifying {len(names):,} documents')
+    start = time.perf_counter()
+    reference = dict(reference_results(docs))
+    reference_time = time.perf_counter() - start
+    start = time.perf_counter()
+    fast = dict(docs.results())
+    fast_time = time.perf_counter() - start
+    # the fast result of a failed document is None, the failure is in the quarantine
+    for entry in docs.quarantine.entries:
+        if fast.get(entry['name']) is None:
+            fast[entry['name']] = entry
+    diverging = 0
+    for name in sorted(reference):
+        if docs.abstract_only:
+            reference[name] = only_produced_fields(reference[name], fast.get(name))
+        found = compare(reference[name], fast.get(name), tolerance)
+        if found:
+            diverging += 1
+            print(f'DIVERGES {name}')
+            for difference in found[:max_differences]:
+                print(f'    {difference}')
+            if len(found) > max_differences:
+                print(f'    ... and {len(found) - max_differences} more')
+    print(f'>>> {diverging:,} of {len(reference):,} documents diverge')
+    print(f'>>> reference {reference_time:.2f}s  fast {fast_time:.2f}s'
+          f'  speedup {reference_time / fast_time if fast_time else float("inf"):.2f}x')
+    docs.report()
+    return diverging == 0
+
+
+def _short(value, length: int = 60) -> str:
+    text = repr(value)
+    return text if len(text) <= length else text[:length] + '...'
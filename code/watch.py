@@ -0,0 +1,265 @@
+"""Watching the text and ScienceParse directories for new documents
+
+New documents keep arriving in the text and ScienceParse directories. Instead of
+rerunning the parser over everything, the watcher polls the directories and only
+processes documents that were not processed before. No file system notification
+library is needed:
+
+- A directory is only listed again with os.scandir() when its modification time
+  changed, which happens when files are added, removed or renamed.
+- A document is ready when the text file and the ScienceParse file both exist and
+  their sizes and modification times did not change for SETTLE_TIME seconds, so
+  we do not read files that are still being written. Documents that never get a
+  ScienceParse file are processed with the text only after SCPA_TIMEOUT seconds.
+- Documents with an output file that is newer than their input files are
+  considered done when the watcher starts, so a restart does not redo work.
+- A document that fails, for example because its ScienceParse file is not
+  valid JSON or because a file disappeared, is added to the quarantine and
+  marked as done, so one bad document does not stop the watcher.
+- With a shard (see shards.py) only the documents of the shard are processed.
+
+Ready documents are processed in batches by Documents, so the cache, the worker
+pool and the other options work as they do for a full run.
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --watch
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --watch --workers 4 --watch-interval 0.5
+
+"""
+
+import os, time
+from document import Documents
+
+
+# Seconds between two polls of the directories
+POLL_INTERVAL = 1.0
+
+# Seconds that the files of a document should be unchanged before processing it
+SETTLE_TIME = 2.0
+
+# Seconds to wait for the ScienceParse file after the text file is stable
+SCPA_TIMEOUT = 300.0
+
+TEXT_SUFFIX = '.txt'
+SCPA_SUFFIX = '_input.pdf.json'
+
+
+class WatchedDocuments(Documents):
+
+    """Documents from the text and ScienceParse directories, where the names are
+    set for each batch of documents, by the watcher or by leases.run()."""
+
+    def __init__(self, scpa_dir: str, text_dir: str, data_dir: str, **options):
+        self.html_dir = None
+        self.data_dir = data_dir
+        self.set_options(**options)
+        self.text_dir = text_dir
+        self.scpa_dir = scpa_dir
+        self.names = []
+        self.pool = None
+        self.initialize_documents()
+
+    def results(self):
+        """Like Documents.results(), but the pool of workers is kept between batches
+        so the workers stay warm."""
+        if self.workers <= 1:
+            return super().results()
+        return self.warm_results()
+
+    def warm_results(self):
+        if self.pool is None:
+            self.pool = self.scheduler()
+        jobs = [(name, self.source_size(name)) for name in self.names]
+        for name, raw_result in self.pool.run(jobs, self.submit_name):
+            yield name, self.finish(name, raw_result)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.writer is not None:
+            self.writer.close()
+
+    def __str__(self):
+        return f'<WatchedDocuments text_dir={self.text_dir} data_dir={self.data_dir}>'
+
+
+class DirectoryListing:
+
+    """The names of the files in a directory with a given suffix, the directory is
+    only listed again if its modification time changed."""
+
+    def __init__(self, directory: str, suffix: str):
+        self.directory = directory
+        self.suffix = suffix
+        self.mtime = None
+        self.names = set()
+
+    def update(self) -> set:
+        """Return the names that were added since the last update."""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return set()
+        if mtime == self.mtime:
+            return set()
+        self.mtime = mtime
+        with os.scandir(self.directory) as entries:
+            names = {entry.name[:-len(self.suffix)] for entry in entries
+                     if entry.name.endswith(self.suffix) and not entry.name.startswith('.')}
+        added = names - self.names
+        self.names = names
+        return added
+
+
+class Watcher:
+
+    def __init__(self, scpa_dir: str, text_dir: str, out_dir: str,
+                 interval: float = POLL_INTERVAL, settle_time: float = SETTLE_TIME,
+                 scpa_timeout: float = SCPA_TIMEOUT, **options):
+        self.docs = WatchedDocuments(scpa_dir, text_dir, out_dir, **options)
+        self.texts = DirectoryListing(text_dir, TEXT_SUFFIX)
+        self.scpas = DirectoryListing(scpa_dir, SCPA_SUFFIX)
+        self.interval = interval
+        self.settle_time = settle_time
+        self.scpa_timeout = scpa_timeout
+        # for each document that is not done, the signature of its files and the
+        # time that the signature was first seen
+        self.pending = {}
+        self.done = set()
+        self.processed = 0
+        self.failed = 0
+        self.latencies = []
+
+    def __str__(self):
+        return (f'<Watcher pending={len(self.pending)} done={len(self.done)}'
+                f' processed={self.processed} failed={self.failed}>')
+
+    def signature(self, name: str):
+        """Return the sizes and modification times of the files of a document, or
+        None if the text file is not there."""
+        try:
+            text = os.stat(self.docs.text_filename(name))
+        except FileNotFoundError:
+            return None
+        try:
+            scpa = os.stat(self.docs.scpa_filename(name))
+            scpa = (scpa.st_size, scpa.st_mtime_ns)
+        except FileNotFoundError:
+            scpa = None
+        return (text.st_size, text.st_mtime_ns), scpa
+
+    def is_done(self, name: str, signature: tuple) -> bool:
+        """Return True if the output file is newer than the input files."""
+        try:
+            output = os.stat(self.docs.output_filename(name)).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        text, scpa = signature
+        return output >= text[1] and (scpa is None or output >= scpa[1])
+
+    def poll(self, now: float = None) -> list:
+        """Look for new and changed files and return the names of the documents
+        that are ready to be processed."""
+        now = time.time() if now is None else now
+        shard = self.docs.shard
+        for name in self.texts.update() | self.scpas.update():
+            if shard is not None and name not in shard:
+                continue
+            if name not in self.done and name not in self.pending:
+                self.pending[name] = (None, now)
+        ready = []
+        for name, (previous, since) in list(self.pending.items()):
+            signature = self.signature(name)
+            if signature is None:
+                # only the ScienceParse file is there, keep waiting for the text
+                continue
+            if signature != previous:
+                if previous is None and self.is_done(name, signature):
+                    del self.pending[name]
+                    self.done.add(name)
+                else:
+                    self.pending[name] = (signature, now)
+                continue
+            if now - since < self.settle_time:
+                continue
+            if signature[1] is not None or now - since >= self.scpa_timeout:
+                ready.append(name)
+        return sorted(ready)
+
+    def process(self, names: list):
+        """Process the documents and write their output. If processing the batch
+        fails the documents that are left are processed one at a time, so that the
+        document that fails can be put in the quarantine."""
+        started = {name: self.pending[name][1] for name in names}
+        left = set(names)
+        try:
+            self.process_batch(names, started, left)
+        except Exception:
+            for name in sorted(left):
+                try:
+                    self.process_batch([name], started, left)
+                except Exception as e:
+                    self.fail(name, e)
+        self.latencies = self.latencies[-1000:]
+
+    def process_batch(self, names: list, started: dict, left: set):
+        self.docs.names = names
+        for name, result in self.docs.results():
+            if result is not None:
+                self.docs.write_result(name, result)
+            self.finish(name, started[name])
+            left.discard(name)
+
+    def finish(self, name: str, started: float):
+        self.pending.pop(name, None)
+        self.done.add(name)
+        self.processed += 1
+        self.latencies.append(time.time() - started)
+
+    def fail(self, name: str, error: Exception):
+        """Add the document to the quarantine and mark it as done."""
+        print(f'WARNING: {name} failed ({type(error).__name__}: {error})')
+        self.docs.quarantine.add({'name': name, 'error': 'exception', 'stages': {},
+                                  'retried': None,
+                                  'message': f'{type(error).__name__}: {error}'})
+        # forget the state of a document that did not finish
+        self.docs._pending.pop(name, None)
+        self.pending.pop(name, None)
+        self.done.add(name)
+        self.failed += 1
+
+    def run(self, max_polls: int = None):
+        """Poll and process until interrupted, or until max_polls polls were done."""
+        os.makedirs(self.docs.data_dir, exist_ok=True)
+        if self.docs.shard is not None and self.docs.shard.bundle:
+            print('WARNING: there are no bundles in watch mode, writing a file per document')
+        print(f'>>> Watching {self.docs.text_dir} and {self.docs.scpa_dir}')
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                start = time.time()
+                ready = self.poll(start)
+                if ready:
+                    self.process(ready)
+                    print(f'>>> Processed {len(ready):,} documents ({self.report()})')
+                polls += 1
+                time.sleep(max(0.0, self.interval - (time.time() - start)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.docs.shutdown()
+        print(f'>>> {self}')
+        self.docs.report()
+
+    def report(self) -> str:
+        """Return the pending count and the median and maximum latency from the
+        time the final version of the files of a document was first seen to the
+        time its output was written, for the most recent documents."""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return f'pending={len(self.pending)}'
+        median = latencies[len(latencies) // 2]
+        return (f'pending={len(self.pending)} latency_median={median:.2f}s'
+                f' latency_max={latencies[-1]:.2f}s')
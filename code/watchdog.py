@@ -0,0 +1,134 @@
+"""Time and memory budgets for parsing a single document
+
+A few inputs, like a text file with binary garbage or a paragraph of a megabyte,
+take minutes to parse and hold up a whole run. A budget limits the time and the
+memory that parsing one document may take:
+
+- The time budget is enforced with a SIGALRM timer that raises BudgetExceeded in
+  the code that is running when the time is up.
+- The memory budget is enforced by lowering the soft limit on the address space
+  of the process to the current size plus the budget, so that allocations over
+  the budget raise MemoryError. The limit is restored afterwards.
+
+Both are only available where the platform supports them (SIGALRM and
+RLIMIT_AS on Linux), elsewhere the budget is not enforced. Python only handles
+the alarm between bytecodes, so code that spends a long time in one C call is
+not interrupted, for that the scheduler can kill workers that are far over the
+budget, see scheduler.py.
+
+The stages of parsing are recorded on a StageClock, so that for a document that
+was aborted we know where the time went. Aborted documents are written to a
+quarantine file, one json object per line.
+
+"""
+
+import os, json, time, signal
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class StageClock:
+
+    """Records the time since the start of a document at the end of each stage."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def mark(self, stage: str):
+        self.stages[stage] = round(time.perf_counter() - self.started, 4)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def timings(self) -> dict:
+        return dict(self.stages)
+
+
+def _raise_budget_exceeded(signum, frame):
+    raise BudgetExceeded('time budget exceeded')
+
+
+def _address_space() -> int:
+    """Return the size of the address space of this process in bytes, or None if
+    that cannot be found."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def budget(seconds: float = None, memory: int = None):
+    """Run the body with a time budget in seconds and a memory budget in bytes,
+    None means no budget."""
+    use_alarm = seconds is not None and hasattr(signal, 'SIGALRM')
+    limits = None
+    if memory is not None and resource is not None:
+        size = _address_space()
+        if size is not None:
+            limits = resource.getrlimit(resource.RLIMIT_AS)
+            soft = size + memory
+            if limits[1] != resource.RLIM_INFINITY:
+                soft = min(soft, limits[1])
+            resource.setrlimit(resource.RLIMIT_AS, (soft, limits[1]))
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_budget_exceeded)
+    try:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, seconds)
+        yield
+    finally:
+        # the alarm can go off until the timer is disarmed, the handler and the
+        # limit are restored whatever happens
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        finally:
+            if use_alarm:
+                signal.signal(signal.SIGALRM, previous)
+            if limits is not None:
+                resource.setrlimit(resource.RLIMIT_AS, limits)
+
+
+class Quarantine:
+
+    """The documents that went over their budget or that failed otherwise,
+    appended to a file as json lines."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.entries = []
+
+    def __str__(self):
+        return f'<Quarantine path={self.path} entries={len(self.entries)}>'
+
+    def add(self, entry: dict):
+        self.entries.append(entry)
+        if self.path is not None:
+            with open(self.path, 'a') as fh:
+                fh.write(json.dumps(entry) + '\n')
+
+    def report(self) -> str:
+        errors = {}
+        for entry in self.entries:
+            errors[entry['error']] = errors.get(entry['error'], 0) + 1
+        retried = sum(1 for entry in self.entries if entry.get('retried'))
+        recovered = sum(1 for entry in self.entries if entry.get('retried') == 'abstract')
+        parts = [f'quarantined={len(self.entries)}']
+        parts.extend(f'{error}={count}' for error, count in sorted(errors.items()))
+        parts.append(f'retried={retried} recovered={recovered}')
+        return ' '.join(parts)
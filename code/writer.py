@@ -0,0 +1,129 @@
+"""Writing the output in a background thread
+
+Without a writer the output of each document is encoded and written by the
+thread that collects the results, which on slow network storage means that no
+new results are collected while a file is written. An OutputWriter takes the
+morsels through a bounded queue and encodes and writes them in a thread of its
+own, so writing overlaps with parsing. When the queue is full the parser waits
+for the writer, so a slow disk slows down the run but does not fill the memory.
+
+- The writer takes all files that are waiting in the queue at once and writes
+  them one after the other, so it does not go back to the queue for each file,
+  and it only creates each output directory once.
+- Each file is written to a temporary file that is synced to disk and renamed
+  when it is complete, so a crash never leaves a file with part of the output
+  (see write_morsels() in document.py). The renames are made durable with one
+  sync of each output directory per batch instead of one for each file.
+- Outputs with more than stream_size characters of text are encoded and written
+  one section at a time, so the json for a large output is never created as a
+  whole. The output is the same as with json.dumps(morsels, indent=4).
+
+Errors in the writer thread are raised in the main thread by the next write(),
+flush() or close().
+
+Usage:
+
+$ python3 parse.py --scpa DIR1 --text DIR2 --out DIR3 --writer-queue 64
+
+"""
+
+import os, time, queue, threading
+from document import write_morsels, STREAM_SIZE
+
+
+# Default maximum number of outputs waiting to be written
+QUEUE_SIZE = 64
+
+
+class OutputWriter:
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, stream_size: int = STREAM_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stream_size = stream_size
+        self.directories = set()
+        self.error = None
+        self.files = 0
+        self.size = 0
+        self.batches = 0
+        self.waited = 0.0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __str__(self):
+        return (f'<OutputWriter files={self.files:,} size={self.size:,}'
+                f' batches={self.batches:,} waited={self.waited:.2f}s>')
+
+    def write(self, out_file: str, morsels: dict):
+        """Queue the morsels to be written to the file, waits if the queue is full."""
+        self._check()
+        start = time.perf_counter()
+        self.queue.put((out_file, morsels))
+        self.waited += time.perf_counter() - start
+
+    def flush(self):
+        """Wait until all queued outputs are written."""
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        """Write the queued outputs and stop the thread."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._check()
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.batches += 1
+            stop = False
+            written = set()
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif self.error is None:
+                    self._write(*item)
+                    written.add(os.path.dirname(item[0]))
+            if self.error is None:
+                self._sync(written)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, out_file: str, morsels: dict):
+        try:
+            directory = os.path.dirname(out_file)
+            if directory not in self.directories:
+                os.makedirs(directory or '.', exist_ok=True)
+                self.directories.add(directory)
+            self.size += write_morsels(out_file, morsels, self.stream_size)
+            self.files += 1
+        except Exception as e:
+            # outputs after the error are dropped, the error stops the run
+            self.error = e
+
+    def _sync(self, directories: set):
+        """Sync the directories so that the renames of the batch are on disk,
+        directories cannot be opened for this on Windows."""
+        if os.name != 'posix':
+            return
+        try:
+            for directory in directories:
+                fd = os.open(directory or '.', os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        except Exception as e:
+            self.error = e